@@ -1,45 +1,94 @@
 # Pydy Tuesday age gaps in hollywood
-import pandas as pd
-import sqlite3
-import os
-import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
 
-# Load the dataset directly from GitHub (same link as in the R code)
-url = "https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2023/2023-02-14/age_gaps.csv"
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.sync import sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from pydy.reduce import reduce_bars, histogram
 
-# save data in a dataframe named age_gaps
-age_gaps = pd.read_csv(url)
+plt = lazy_import('matplotlib.pyplot')
 
-# name database
-db_name = 'age_differences.db'
+# Load the dataset directly from GitHub (same link as in the R code)
+url = "https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2023/2023-02-14/age_gaps.csv"
 
-# create database
-if not os.path.exists(db_name):
-    print(f'Database not found, creating {db_name}. 🤓')
-    
-    # Create/connect DB and save create data tables
-    with sqlite3.connect(db_name) as con:
-        age_gaps.to_sql('age_gaps', con, if_exists='replace', index=False)
-        print(f"Database {db_name} created with table 'age_gaps'. 👍")
-else:
-    print('Database already exists. 🧮')
+# name database (next to this file, wherever it is run from)
+db_name = Path(__file__).with_name('age_differences.db')
 
-# query to filter where character 1 is a woman
-with sqlite3.connect(db_name) as con:
-    query = """
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    'woman_age_gaps': """
         SELECT movie_name, (actor_1_age - actor_2_age) AS age_gap
         FROM age_gaps
         WHERE character_1_gender = 'woman'
           AND (actor_1_age - actor_2_age) > 5;
-    """
-    df = pd.read_sql_query(query, con)
+    """,
+}
+
+_prepared = False
+
+# create database (afterwards only rows that changed in the csv are written) and index it, once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+
+    # stream the csv into the age_gaps table; the rows have no id, so a changed row is
+    # replaced as a whole
+    sync_csv(db_name, 'age_gaps', url)
+
+    # index the columns the query filters on
+    build_indexes(db_name, QUERIES)
+    _prepared = True
+
+# query to filter where character 1 is a woman
+def woman_age_gaps():
+    prepare()
+    return read_sql(db_name, QUERIES['woman_age_gaps'])
 
 # Step 4: Plot bar chart
-plt.figure(figsize=(12, 6))
-plt.bar(df["movie_name"], df["age_gap"])
-plt.xticks(rotation=90)
-plt.xlabel("Movie")
-plt.ylabel("Age Gap")
-plt.title("Age gaps > 5 years where the main character is a woman")
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+def draw_age_gaps(df):
+    fig = plt.figure(figsize=(12, 6))
+    plt.bar(df["movie_name"], df["age_gap"])
+    plt.xticks(rotation=90)
+    plt.xlabel("Movie")
+    plt.ylabel("Age Gap")
+    plt.title("Age gaps > 5 years where the main character is a woman")
+    plt.tight_layout()
+    return fig
+
+# every qualifying couple, binned by the size of the gap
+def draw_age_gap_histogram(hist):
+    fig = plt.figure(figsize=(10, 6))
+    plt.bar(hist["bin_start"], hist["count"], width=hist["bin_end"] - hist["bin_start"],
+            align="edge", edgecolor="black")
+    plt.xlabel("Age Gap")
+    plt.ylabel("Couples")
+    plt.title("Distribution of age gaps > 5 years where the main character is a woman")
+    plt.tight_layout()
+    return fig
+
+def chart_age_gaps():
+    df = woman_age_gaps()
+
+    # one bar per movie (movies with several couples keep their largest gap), the 40 largest
+    # gaps get their own bar and the rest share one, so the chart stays readable at any size
+    bars = reduce_bars(df, "movie_name", "age_gap", max_bars=40, duplicates="max")
+    chart("age_gaps/woman_age_gaps", draw_age_gaps, bars)
+
+    chart("age_gaps/woman_age_gap_histogram", draw_age_gap_histogram, histogram(df["age_gap"]))
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [chart_age_gaps]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
+
+if __name__ == '__main__':
+    main()
@@ -1,115 +1,288 @@
-import matplotlib.pyplot as plt
-import pandas as pd
+import json
 import sqlite3
 from pathlib import Path
-import os
+import sys
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.fetch import table_is_current
+from pydy.ingest import percent_to_number
+from pydy.sync import on_change, sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from pydy.dimensions import clean_text
+
+plt = lazy_import('matplotlib.pyplot')
+np = lazy_import('numpy')
 
 # import the data from github
 # database url
 url = 'https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2022/2022-01-18/chocolate.csv'
 
-# read in csv file
-chocolate_rating = pd.read_csv(url)
+# words that only join characteristics together ("nutty and bitter", "fruity then nutty")
+CONNECTORS = {'a', 'and', 'but', 'in', 'of', 'the', 'then', 'to', 'w', 'with'}
+
+# one (characteristic, chocolate_id, rating) row per word of most_memorable_characteristics
+def characteristic_pairs(df):
+    words = df['most_memorable_characteristics'].fillna('').str.lower().str.findall(r'[a-z]+')
+    pairs = (
+        df[['chocolate_id', 'rating']]
+        .assign(characteristic=words)
+        .explode('characteristic')
+        .dropna(subset=['characteristic'])
+    )
+    return pairs[~pairs['characteristic'].isin(CONNECTORS)].drop_duplicates(['characteristic', 'chocolate_id'])
 
-# create database
-db_path = Path('chocolate.db')
-if not db_path.exists():
-    print(f'Data base {db_path} not found, created the database. 📊')
+# split most_memorable_characteristics into words and store one row per chocolate and word,
+# so keyword searches and facet counts are index lookups instead of LIKE over the whole table
+def build_characteristic_index(db_path):
+    df = read_sql(db_path, '''
+        SELECT rowid AS chocolate_id, most_memorable_characteristics, rating
+        FROM chocolate_rating
+        ''')
+    pairs = characteristic_pairs(df)
 
-    # connect to database and create the data table
     with sqlite3.connect(db_path) as con:
-        chocolate_rating.to_sql('chocolate_rating', con, if_exists='replace', index=False)
-        print('Data table chocolate_rating has been created. 🧮')
+        con.execute('DROP TABLE IF EXISTS chocolate_characteristics')
+        con.execute('''
+            CREATE TABLE chocolate_characteristics (
+                characteristic TEXT NOT NULL,
+                chocolate_id INTEGER NOT NULL,
+                rating REAL
+            )
+            ''')
+        con.executemany(
+            'INSERT INTO chocolate_characteristics VALUES (?, ?, ?)',
+            pairs[['characteristic', 'chocolate_id', 'rating']].itertuples(index=False, name=None),
+        )
+        # covering index: keyword -> chocolates and keyword -> ratings never touch the table
+        con.execute('''
+            CREATE INDEX ix_chocolate_characteristics_characteristic
+            ON chocolate_characteristics (characteristic, chocolate_id, rating)
+            ''')
+    print(f'Indexed {len(pairs)} characteristic words for {len(df)} chocolates. 🍫')
 
-else:
-    print('Database already exists. 🤓')
+# after a sync only the chocolates that were added, changed or removed are split again
+def update_characteristic_index(db_path, changes):
+    if changes['full'] or not table_is_current(db_path, 'chocolate_characteristics'):
+        build_characteristic_index(db_path)
+        return
 
-# find the avarage rating per cacoa percentage
-def rating_percentage():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT cocoa_percent, rating
+    stale = changes['rows']['updated'] + changes['rows']['deleted']
+    fresh = changes['rows']['inserted'] + changes['rows']['updated']
+    df = read_sql(db_path, '''
+        SELECT rowid AS chocolate_id, most_memorable_characteristics, rating
         FROM chocolate_rating
-        '''
-    df = pd.read_sql_query(query, con)
- 
- # Ensure cocoa_percent is numeric
-    df['cocoa_percent'] = df['cocoa_percent'].str.replace('%', '').astype(float)
+        WHERE rowid IN (SELECT value FROM json_each(?))
+        ''', [json.dumps(fresh)], cache=False)
+    pairs = characteristic_pairs(df)
 
-    # Group by cocoa percent and calculate mean + std
-    summary = df.groupby('cocoa_percent')['rating'].agg(['mean', 'std']).reset_index()
-    print(summary)
-
-def flav_char():
     with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT company_manufacturer, country_of_bean_origin, cocoa_percent, most_memorable_characteristics, rating
-        FROM chocolate_rating
-        WHERE most_memorable_characteristics LIKE '%nutty%'
+        con.execute('DELETE FROM chocolate_characteristics WHERE chocolate_id IN (SELECT value FROM json_each(?))',
+                    [json.dumps(stale)])
+        con.executemany(
+            'INSERT INTO chocolate_characteristics VALUES (?, ?, ?)',
+            pairs[['characteristic', 'chocolate_id', 'rating']].itertuples(index=False, name=None),
+        )
+    print(f'Updated the characteristic words of {len(set(stale) | set(fresh))} chocolates. 🍫')
+
+on_change('chocolate_rating', update_characteristic_index)
+
+# cocoa_percent is stored as a number ('76%' -> 76.0) so queries can filter and group on it
+SCHEMA = {'cocoa_percent': 'REAL'}
+
+def normalize_chocolate(chunk):
+    return chunk.assign(cocoa_percent=percent_to_number(chunk['cocoa_percent']))
+
+# makers and bean origins repeat on every review, so each name is stored once in a
+# dim_<column> table and chocolate_rating keeps its integer <column>_id code
+DIMENSIONS = {'company_manufacturer': clean_text, 'country_of_bean_origin': clean_text}
+
+# the database lives next to this file, wherever it is run from
+db_path = Path(__file__).with_name('chocolate.db')
+
+# chocolates having every word in all_of and at least one word in any_of
+def characteristic_query(all_of=(), any_of=()):
+    if not all_of and not any_of:
+        raise ValueError('Give at least one characteristic to search for')
+
+    lookups, params = [], []
+    for word in all_of:
+        lookups.append('SELECT chocolate_id FROM chocolate_characteristics WHERE characteristic = ?')
+        params.append(word.lower())
+    if any_of:
+        placeholders = ', '.join('?' * len(any_of))
+        lookups.append(f'SELECT chocolate_id FROM chocolate_characteristics WHERE characteristic IN ({placeholders})')
+        params.extend(word.lower() for word in any_of)
+
+    sql = f'''
+        SELECT m.value AS company_manufacturer, o.value AS country_of_bean_origin,
+               c.cocoa_percent, c.most_memorable_characteristics, c.rating
+        FROM chocolate_rating c
+        LEFT JOIN dim_company_manufacturer m ON m.id = c.company_manufacturer_id
+        LEFT JOIN dim_country_of_bean_origin o ON o.id = c.country_of_bean_origin_id
+        WHERE c.rowid IN ({' INTERSECT '.join(lookups)})
         '''
-    
-    df = pd.read_sql_query(query, con)
+    return sql, params
 
-    # save results into a new table called nutty_chocolates
-    with sqlite3.connect(db_path) as con:
-        df.to_sql("nutty_chocolates", con, if_exists="replace", index=False)
-        print(f"Table 'nutty_chocolates' created/updated in {db_path} ({len(df)} rows)")
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    # count and mean per percentage, then the squared deviations from that mean in a
+    # second pass (sum of squares minus n * mean^2 cancels badly for close ratings)
+    'rating_percentage': '''
+        WITH groups AS (
+            SELECT cocoa_percent, COUNT(rating) AS n, AVG(rating) AS mean
+            FROM chocolate_rating
+            WHERE cocoa_percent IS NOT NULL
+            GROUP BY cocoa_percent
+        )
+        SELECT
+            g.cocoa_percent,
+            g.n,
+            g.mean,
+            SUM((r.rating - g.mean) * (r.rating - g.mean)) AS sum_sq_dev
+        FROM groups g
+        JOIN chocolate_rating r ON r.cocoa_percent = g.cocoa_percent
+        GROUP BY g.cocoa_percent
+        ORDER BY g.cocoa_percent
+        ''',
+    'flav_char': characteristic_query(['nutty']),
+    # top characteristics by mean rating (min count, limit)
+    'characteristic_facets': ('''
+        SELECT characteristic, COUNT(*) AS chocolates, AVG(rating) AS mean_rating
+        FROM chocolate_characteristics
+        GROUP BY characteristic
+        HAVING COUNT(*) >= ?
+        ORDER BY mean_rating DESC
+        LIMIT ?
+        ''', [10, 20]),
+    # chocolates per origin, counted on the integer code
+    'chart_origin_pie': '''
+        SELECT o.value AS country_of_bean_origin, COUNT(*) AS chocolates
+        FROM chocolate_rating c
+        JOIN dim_country_of_bean_origin o ON o.id = c.country_of_bean_origin_id
+        GROUP BY c.country_of_bean_origin_id
+        ORDER BY country_of_bean_origin
+        ''',
+    # blank origins are NULL codes, counted as Unknown
+    'chart_origin_bar': '''
+        SELECT IFNULL(o.value, 'Unknown') AS country_of_bean_origin, COUNT(*) AS chocolates
+        FROM chocolate_rating c
+        LEFT JOIN dim_country_of_bean_origin o ON o.id = c.country_of_bean_origin_id
+        GROUP BY c.country_of_bean_origin_id
+        ORDER BY chocolates DESC
+        ''',
+}
+
+_prepared = False
+
+# create database and indexes once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+
+    # create database (loaded from scratch when the table is missing or has an older schema,
+    # otherwise only the rows that changed in the csv are written). reviews have no unique
+    # id, so a changed row is replaced; update_characteristic_index follows every change
+    sync_csv(db_path, 'chocolate_rating', url, transform=normalize_chocolate, schema=SCHEMA, dimensions=DIMENSIONS)
+
+    # databases built before the characteristic index get it on their first run
+    if not table_is_current(db_path, 'chocolate_characteristics'):
+        build_characteristic_index(db_path)
+
+    # index the columns the queries filter and group on
+    build_indexes(db_path, QUERIES)
+    _prepared = True
+
+# find the avarage rating per cacoa percentage
+def rating_percentage():
+    prepare()
+    # cocoa_percent is numeric in the table, so sqlite groups and averages
+    df = read_sql(db_path, QUERIES['rating_percentage'])
+
+    # sample std from the squared deviations (NaN for a single rating, same as pandas)
+    df['std'] = np.sqrt((df['sum_sq_dev'] / (df['n'] - 1)).where(df['n'] > 1))
+
+    summary = df[['cocoa_percent', 'mean', 'std']]
+    print(summary)
+    return summary
+
+# find chocolates by characteristic words, e.g. flav_char(['nutty']) or flav_char(any_of=['fruity', 'floral'])
+def flav_char(all_of=('nutty',), any_of=()):
+    prepare()
+    sql, params = characteristic_query(all_of, any_of)
+    df = read_sql(db_path, sql, params=params)
 
     # preview results
     if not df.empty:
         print(df.to_string(index=False))
     else:
-        print("No rows matched the filter (nutty).")
+        print(f"No rows matched the filter ({', '.join([*all_of, *any_of])}).")
+    return df
+
+# top characteristics by mean rating, counted straight from the index
+def characteristic_facets(top=20, min_count=10):
+    prepare()
+    sql, _ = QUERIES['characteristic_facets']
+    df = read_sql(db_path, sql, params=[min_count, top])
+    print(df.to_string(index=False))
+    return df
 
 def chart_origin_pie():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT country_of_bean_origin
-        FROM chocolate_rating
-        '''
-    df = pd.read_sql_query(query, con)
+    prepare()
+    df = read_sql(db_path, QUERIES['chart_origin_pie'])
+
+    # chocolates per origin, already counted by sqlite
+    origin_counts = df.set_index('country_of_bean_origin')['chocolates']
 
-    # group by origin and find percentage
-    origin_counts = df.value_counts().sort_index()
+    chart('chocolate/origin_pie', draw_origin_pie, origin_counts)
 
-    # create a pie chart 
-    plt.figure(figsize=(10, 10))
+# create a pie chart 
+def draw_origin_pie(origin_counts):
+    fig = plt.figure(figsize=(10, 10))
     plt.pie(origin_counts, labels=origin_counts.index,
             autopct='%1.1f%%', startangle=140)
     plt.title('Percentage by Origin of the Beans')
-    plt.show()
+    return fig
 
 def chart_origin_bar():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT country_of_bean_origin
-        FROM chocolate_rating
-        '''
-    df = pd.read_sql_query(query, con)
-
-    # Count frequencies per origin (clean up blanks/NaNs)
-    counts = (
-        df['country_of_bean_origin']
-        .fillna("Unknown")
-        .astype(str)
-        .str.strip()
-        .replace({"": "Unknown"})
-        .value_counts()
-        .sort_values(ascending=False)
-    )
+    prepare()
+    df = read_sql(db_path, QUERIES['chart_origin_bar'])
+
+    # frequencies per origin (blanks were cleaned at load time and count as Unknown)
+    counts = df.set_index('country_of_bean_origin')['chocolates']
+
+    chart('chocolate/origin_bar', draw_origin_bar, counts)
 
-    # create bar chart 
-    plt.figure(figsize=(10, 6))
+# create bar chart 
+def draw_origin_bar(counts):
+    fig = plt.figure(figsize=(10, 6))
     plt.bar(counts.index, counts.values)
     plt.xticks(rotation=90)
     plt.xlabel('Origin')
     plt.ylabel('Total')
     plt.title('Frequency of Bean Country of Origin')
     plt.tight_layout()
-    plt.show()
+    return fig
+
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [
+    # rating_percentage,
+    # flav_char,
+    # characteristic_facets,
+    # chart_origin_pie,
+    # chart_origin_bar,
+]
 
+def main():
+    prepare()
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
 
-# rating_percentage()
-# flav_char()
-# chart_origin_pie()
-# chart_origin_bar()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,76 @@
 # data on Flint water lead concentration
 
-import pandas as pd
-import os
-import sqlite3
-from scipy import stats
-import matplotlib.pyplot as plt
-import numpy as np
-
-# # create variable for base url
-# url ='https://raw.githubusercontent.com/rfordatascience/tidytuesday/master/data/2025/2025-11-11/diabetes.csv'
-
-# # create df for data
-# diabetes = pd.read_csv(url)
-
-# # create database and import files
-# db_name = "IndianDiabetes.db"
-
-# def create_sql(db_name):
-#     if not os.path.exists(db_name):
-#         print(f'Database not found, creating {db_name}. 🤓')
-#         with sqlite3.connect (db_name) as con:
-#             diabetes.to_sql('diabetes', con, if_exists='replace', index=False)
-#             print(f"Database {db_name} created with table 'diabetes'. 👍")
-#     else:
-#         print('Database already exists. 🧮')
-
-# create_sql(db_name)
+import sys
+from functools import partial
+from pathlib import Path
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.sync import sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.store import export_columnar, read_table, select_sql
+from pydy.charts import chart, render_charts
+from resampling import resample_groups
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+plt = lazy_import('matplotlib.pyplot')
+stats = lazy_import('scipy.stats')
+
+# create variable for base url
+url ='https://raw.githubusercontent.com/rfordatascience/tidytuesday/master/data/2025/2025-11-11/diabetes.csv'
+
+# create database and import files (next to this file, wherever it is run from)
+db_name = Path(__file__).with_name("IndianDiabetes.db")
+
+def create_sql(db_name):
+    # stream the csv into the diabetes table the first time, later runs only write the
+    # rows that changed (there is no patient id, so a changed row is replaced)
+    sync_csv(db_name, 'diabetes', url)
+
+# factors compared between the diabetes groups
+factors = ['age', 'pregnancy_num', 'triceps_mm', 'bmi']
+
+# every read returns the rows in csv order ('False' is the csv's leftover row index), so
+# sqlite and the parquet copy give the same frame
+ROW_ORDER = ['False']
+
+# read_table arguments pulling only the status and one factor
+def factor_scan(factor):
+    return {'columns': ['diabetes_5y', factor], 'filters': [(factor, 'not null', None)], 'order_by': ROW_ORDER}
+
+# the same read as (sql, params) on sqlite, for the indexer
+def factor_query(factor):
+    return select_sql('diabetes', **factor_scan(factor))
+
+# every query this script runs, so the indexer can see them
+QUERIES = {factor: factor_query(factor) for factor in factors}
+
+# the diabetes table for the parquet backend (pydy/store.py), stored in the order it is read;
+# every read picks a few of its columns
+COLUMNAR_TABLES = {'diabetes': tuple(ROW_ORDER)}
+
+_prepared = False
+
+# sync the table with the csv and index the factor columns the queries filter on, once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+    create_sql(db_name)
+    build_indexes(db_name, QUERIES)
+
+    # the parquet copy, when that backend is in use
+    export_columnar(db_name, COLUMNAR_TABLES)
+    _prepared = True
 
 # create function to test significant difference of diabtetes status and secondary column
 def test_of_sig(db_path, factor):
-    with sqlite3.connect(db_path) as con:
-        # Query data (only pull needed columns)
-        query = f"""
-            SELECT diabetes_5y, {factor}
-            FROM diabetes
-            WHERE {factor} IS NOT NULL
-        """
-        df = pd.read_sql_query(query, con)
+    prepare()
+    # Query data (only pull needed columns)
+    df = read_table(db_path, 'diabetes', **factor_scan(factor))
 
     # Split into positive and negative groups
     pos_group = df[df['diabetes_5y'] == 'pos'][factor].dropna()
@@ -64,21 +98,105 @@ def test_of_sig(db_path, factor):
         'result': result
     }
 
-test_of_sig('IndianDiabetes.db', 'age')
-test_of_sig('IndianDiabetes.db', 'pregnancy_num')
-test_of_sig('IndianDiabetes.db', 'triceps_mm')
-test_of_sig('IndianDiabetes.db', 'bmi')
+# every numeric column of the diabetes table ('False' is a leftover row index from the export)
+def numeric_factors(db_path):
+    info = read_sql(db_path, 'PRAGMA table_info(diabetes)')
+    numeric = info[info['type'].isin(['INTEGER', 'REAL'])]['name']
+    return [name for name in numeric if name != 'False']
+
+# adjust p-values for testing many factors at once (holm or benjamini-hochberg)
+def adjust_pvalues(p_values, method='holm'):
+    p = np.asarray(p_values, dtype=float)
+    m = len(p)
+    order = np.argsort(p)
+    ranked = p[order]
+
+    if method == 'holm':
+        adjusted = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == 'bh':
+        adjusted = np.minimum.accumulate((m / np.arange(m, 0, -1) * ranked[::-1]))[::-1]
+    else:
+        raise ValueError(f"Unknown correction method '{method}', use 'holm' or 'bh'")
+
+    out = np.empty(m)
+    out[order] = np.minimum(adjusted, 1.0)
+    return out
+
+# welch t-test for every factor in one table scan, computed column-wise on a 2-D array
+def test_all_factors(db_path, factors=None, alpha=0.05, correction='holm'):
+    prepare()
+    if factors is None:
+        factors = numeric_factors(db_path)
+
+    df = read_table(db_path, 'diabetes', columns=['diabetes_5y', *factors], order_by=ROW_ORDER)
+
+    # rows = people, columns = factors, NaN where a value is missing
+    values = df[factors].to_numpy(dtype=float)
+    pos = values[(df['diabetes_5y'] == 'pos').to_numpy()]
+    neg = values[(df['diabetes_5y'] == 'neg').to_numpy()]
+
+    n_pos = np.sum(~np.isnan(pos), axis=0)
+    n_neg = np.sum(~np.isnan(neg), axis=0)
+    mean_pos = np.nanmean(pos, axis=0)
+    mean_neg = np.nanmean(neg, axis=0)
+    se_pos = np.nanvar(pos, axis=0, ddof=1) / n_pos
+    se_neg = np.nanvar(neg, axis=0, ddof=1) / n_neg
+
+    # same statistic and welch-satterthwaite degrees of freedom as stats.ttest_ind(equal_var=False)
+    t_stat = (mean_pos - mean_neg) / np.sqrt(se_pos + se_neg)
+    dof = (se_pos + se_neg) ** 2 / (se_pos ** 2 / (n_pos - 1) + se_neg ** 2 / (n_neg - 1))
+    p_value = 2 * stats.t.sf(np.abs(t_stat), dof)
+    p_adjusted = adjust_pvalues(p_value, correction)
+
+    results = pd.DataFrame({
+        'factor': factors,
+        'n_pos': n_pos,
+        'n_neg': n_neg,
+        'mean_pos': mean_pos,
+        'mean_neg': mean_neg,
+        't_stat': t_stat,
+        'p_value': p_value,
+        'p_adjusted': p_adjusted,
+    })
+    results['result'] = np.where(
+        results['p_adjusted'] < alpha, 'Significant difference', 'No significant difference'
+    )
+
+    print(f'Welch t-tests for {len(factors)} factors ({correction} corrected):')
+    print(results.to_string(index=False, float_format='%.3f'))
+    print('')
+    return results
+
+# permutation p-values and bootstrap intervals for the mean / median differences graphed below.
+# seed makes the run reproducible, max_memory_mb caps each worker's resample blocks
+def resample_factors(db_path, factors=None, n_resamples=10_000, seed=None, max_memory_mb=256, workers=None):
+    prepare()
+    if factors is None:
+        factors = numeric_factors(db_path)
+
+    df = read_table(db_path, 'diabetes', columns=['diabetes_5y', *factors], order_by=ROW_ORDER)
+
+    # Split every factor into positive and negative groups
+    is_pos = df['diabetes_5y'] == 'pos'
+    is_neg = df['diabetes_5y'] == 'neg'
+    groups = {
+        factor: (df.loc[is_pos, factor].dropna().to_numpy(), df.loc[is_neg, factor].dropna().to_numpy())
+        for factor in factors
+    }
+
+    results = resample_groups(
+        groups, n_resamples=n_resamples, seed=seed, max_memory_mb=max_memory_mb, workers=workers
+    )
+    print(f'Permutation tests and bootstrap 95% intervals ({n_resamples:,} resamples):')
+    print(results.to_string(index=False, float_format='%.3f'))
+    print('')
+    return results
 
 # graph of the mean per group
 def graph_aves(db_path, factor):
-    with sqlite3.connect(db_path) as con:
-        # Query data (only pull needed columns)
-        query = f"""
-            SELECT diabetes_5y, {factor}
-            FROM diabetes
-            WHERE {factor} IS NOT NULL
-        """
-        df = pd.read_sql_query(query, con)
+    prepare()
+    # Query data (only pull needed columns)
+    df = read_table(db_path, 'diabetes', **factor_scan(factor))
 
     # Split into positive and negative groups
     pos_group = df[df['diabetes_5y'] == 'pos'][factor].dropna()
@@ -89,17 +207,24 @@ def graph_aves(db_path, factor):
     median_pos, median_neg = pos_group.median(), neg_group.median()
 
     # Data structure for plotting
-    labels = ['Mean', 'Median']
-    pos_values = [mean_pos, median_pos]
-    neg_values = [mean_neg, median_neg]
+    averages = pd.DataFrame({
+        'Statistic': ['Mean', 'Median'],
+        'Positive': [mean_pos, median_pos],
+        'Negative': [mean_neg, median_neg]
+    })
 
+    chart(f'diabetes/aves_{factor}', draw_aves, averages, factor=factor)
+    return averages
+
+def draw_aves(averages, factor):
     # Plot setup
+    labels = averages['Statistic']
     x = np.arange(len(labels))
     width = 0.35
 
-    plt.figure(figsize=(7, 5))
-    plt.bar(x - width/2, pos_values, width=width, color='red', label='Positive')
-    plt.bar(x + width/2, neg_values, width=width, color='blue', label='Negative')
+    fig = plt.figure(figsize=(7, 5))
+    plt.bar(x - width/2, averages['Positive'], width=width, color='red', label='Positive')
+    plt.bar(x + width/2, averages['Negative'], width=width, color='blue', label='Negative')
 
     # Labels & formatting
     plt.xticks(x, labels)
@@ -107,15 +232,18 @@ def graph_aves(db_path, factor):
     plt.title(f'{factor.capitalize()} — Mean and Median by Diabetes Status')
     plt.legend()
     plt.tight_layout()
-    plt.show()
+    return fig
 
-    return pd.DataFrame({
-        'Statistic': ['Mean', 'Median'],
-        'Positive': pos_values,
-        'Negative': neg_values
-    })
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [
+    partial(test_all_factors, db_name, factors),
+    *(partial(graph_aves, db_name, factor) for factor in factors),
+]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
 
-graph_aves('IndianDiabetes.db', 'age')
-graph_aves('IndianDiabetes.db', 'pregnancy_num')
-graph_aves('IndianDiabetes.db', 'triceps_mm')
-graph_aves('IndianDiabetes.db', 'bmi')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# permutation tests and bootstrap confidence intervals for the diabetes group comparisons
+#
+# resamples are drawn as 2-D numpy blocks (one row per resample) instead of a python
+# loop, with the block size picked so a block stays under a memory ceiling. several
+# factors are spread over a process pool. a seed makes every run reproducible: each
+# factor gets its own child seed, so results do not depend on how the pool schedules work.
+#
+# this module only holds pure functions so the process pool can import it without
+# re-running the analysis script.
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.trace import traced
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# statistics the tests can compare, by numpy reduction name
+STATISTICS = ('mean', 'median')
+
+
+def statistic_fn(name):
+    if name not in STATISTICS:
+        raise ValueError(f"Unknown statistic '{name}', use one of {', '.join(STATISTICS)}")
+    return getattr(np, name)
+
+
+# bytes a resample holds per value at its peak: the bootstrap's int64 index array, the
+# float64 values gathered with it and the copy np.median partitions (a permutation
+# needs less: the shuffled block and the median's copy)
+BYTES_PER_VALUE = 3 * 8
+
+
+def block_size(n_values, max_memory_mb):
+    # how many resamples of n_values fit under the memory ceiling
+    return max(1, int(max_memory_mb * 1024 * 1024 // (BYTES_PER_VALUE * max(n_values, 1))))
+
+
+def permutation_test(pos, neg, statistic='mean', n_resamples=10_000, rng=None, max_memory_mb=256):
+    # two-sided p-value for "no difference between the groups"
+    rng = np.random.default_rng(rng)
+    stat = statistic_fn(statistic)
+    pooled = np.concatenate([pos, neg])
+    n_pos = len(pos)
+    observed = stat(pos) - stat(neg)
+
+    extreme = 0
+    block = block_size(len(pooled), max_memory_mb)
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        shuffled = rng.permuted(np.broadcast_to(pooled, (size, len(pooled))), axis=1)
+        null = stat(shuffled[:, :n_pos], axis=1) - stat(shuffled[:, n_pos:], axis=1)
+        extreme += np.count_nonzero(np.abs(null) >= abs(observed))
+
+    return observed, (extreme + 1) / (n_resamples + 1)
+
+
+def bootstrap_ci(pos, neg, statistic='mean', n_resamples=10_000, confidence=0.95, rng=None, max_memory_mb=256):
+    # percentile interval for the difference pos - neg
+    # one stream per group, so the draws do not depend on the block size
+    pos_rng, neg_rng = np.random.default_rng(rng).spawn(2)
+    stat = statistic_fn(statistic)
+
+    diffs = np.empty(n_resamples)
+    block = block_size(len(pos) + len(neg), max_memory_mb)
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        pos_sample = pos[pos_rng.integers(0, len(pos), size=(size, len(pos)))]
+        neg_sample = neg[neg_rng.integers(0, len(neg), size=(size, len(neg)))]
+        diffs[start:start + size] = stat(pos_sample, axis=1) - stat(neg_sample, axis=1)
+
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(diffs, [tail, 1 - tail])
+    return low, high
+
+
+def resample_factor(factor, pos, neg, statistics=('mean', 'median'), n_resamples=10_000,
+                    confidence=0.95, seed=None, max_memory_mb=256):
+    pos = np.asarray(pos, dtype=float)
+    neg = np.asarray(neg, dtype=float)
+    # separate generators per test keep results identical for any memory ceiling
+    rngs = iter(np.random.default_rng(seed).spawn(2 * len(statistics)))
+
+    rows = []
+    for statistic in statistics:
+        observed, p_perm = permutation_test(pos, neg, statistic, n_resamples, next(rngs), max_memory_mb)
+        low, high = bootstrap_ci(pos, neg, statistic, n_resamples, confidence, next(rngs), max_memory_mb)
+        rows.append({
+            'factor': factor,
+            'statistic': statistic,
+            'difference': observed,
+            'ci_low': low,
+            'ci_high': high,
+            'p_perm': p_perm,
+            'n_resamples': n_resamples,
+        })
+    return rows
+
+
+def _resample_job(args):
+    factor, pos, neg, options = args
+    return resample_factor(factor, pos, neg, **options)
+
+
+@traced()
+def resample_groups(groups, statistics=('mean', 'median'), n_resamples=10_000, confidence=0.95,
+                    seed=None, max_memory_mb=256, workers=None):
+    # groups maps factor -> (pos values, neg values); returns one tidy frame
+    factors = list(groups)
+    seeds = np.random.SeedSequence(seed).spawn(len(factors))
+    jobs = [
+        (factor, *groups[factor], {
+            'statistics': statistics,
+            'n_resamples': n_resamples,
+            'confidence': confidence,
+            'seed': child,
+            'max_memory_mb': max_memory_mb,
+        })
+        for factor, child in zip(factors, seeds)
+    ]
+
+    if workers == 1 or len(jobs) < 2:
+        results = [_resample_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_resample_job, jobs))
+
+    return pd.DataFrame([row for rows in results for row in rows])
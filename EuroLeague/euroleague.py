@@ -1,74 +1,110 @@
 # Pydy Tuesday EuroLeague Basketball
 
-import pandas as pd
-import sqlite3
-import os
-import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.ingest import first_number
+from pydy.sync import sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from pydy.dimensions import clean_text
+
+plt = lazy_import('matplotlib.pyplot')
 
 # load the dataset from github
 url = 'https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2025/2025-10-07/euroleague_basketball.csv'
 
-# save data to a dataframe
-euroleague = pd.read_csv(url)
+# name database (next to this file, wherever it is run from)
+db_name = Path(__file__).with_name('EuroLeague.db')
+
+# seats of the first arena listed ('8,000, 15,705' -> 8000), stored next to the raw Capacity text
+SCHEMA = {'capacity_seats': 'INTEGER'}
+
+def normalize_capacity(chunk):
+    return chunk.assign(capacity_seats=first_number(chunk['Capacity']))
+
+# countries are stored once in dim_Country, basketball keeps the integer Country_id
+DIMENSIONS = {'Country': clean_text}
+
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    'arenas_by_capacity': '''
+        SELECT b.Arena, b.Capacity, c.value AS Country
+        FROM basketball b
+        LEFT JOIN dim_Country c ON c.id = b.Country_id
+        ORDER BY b.capacity_seats
+    ''',
+    # group by country and sum capacities (some countries have multiple arenas)
+    'capacity_by_country': '''
+        SELECT c.value AS Country, SUM(b.capacity_seats) AS Capacity
+        FROM basketball b
+        JOIN dim_Country c ON c.id = b.Country_id
+        GROUP BY b.Country_id
+        ORDER BY Capacity DESC
+    ''',
+}
+
+_prepared = False
+
+# create database and indexes once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
 
-# name database
-db_name = 'EuroLeague.db'
+    # create database (loaded from scratch when the table is missing or has an older schema,
+    # otherwise only the teams whose row changed in the csv are written)
+    sync_csv(db_name, 'basketball', url, key='Team', transform=normalize_capacity, schema=SCHEMA,
+             dimensions=DIMENSIONS)
 
-# create database
-if not os.path.exists(db_name):
-    print(f'Database not found. Creating {db_name}. 🤓')
-    # connect and create
-    with sqlite3.connect(db_name) as con:
-        euroleague.to_sql('basketball', con, if_exists='replace', index=False)
-        print(f"Database {db_name} created with table 'basketball'. 👍")
-else:
-    print('Database already exists. 🧮')
+    # index the columns the queries sort and group on
+    build_indexes(db_name, QUERIES)
+    _prepared = True
 
 # query organizing arenas by capacity
-with sqlite3.connect(db_name) as con:
-    query = '''
-        SELECT Arena, Capacity, Country
-        FROM basketball
-        ORDER BY Capacity
-    '''
-    df = pd.read_sql_query(query, con)
-
-# print the results to the terminal
-print("\nArenas Organized by Capacity:\n")
-print(df.to_string(index=False))
-
-with sqlite3.connect(db_name) as con:
-    query = '''
-        SELECT Country, Capacity
-        FROM basketball
-    '''
-    df = pd.read_sql_query(query, con)
-
-# clean the Capacity column to keep only the first number
-df['Capacity'] = (
-    df['Capacity']
-    .astype(str)                             # ensure all values are strings
-    .str.extract(r'(\d[\d,]*)')[0]           # extract the first numeric group
-    .str.replace(',', '', regex=False)       # remove commas
-    .astype(float)                           # convert to numeric
-)
-
-# group by country and sum capacities (some countries have multiple arenas)
-country_capacity = df.groupby('Country', as_index=False)['Capacity'].sum()
-
-# sort by capacity (descending)
-country_capacity = country_capacity.sort_values(by='Capacity', ascending=False)
-
-# print results to terminal
-print("\n🏀 Total Seating Capacity by Country:\n")
-print(country_capacity.to_string(index=False))
+def arenas_by_capacity():
+    prepare()
+    df = read_sql(db_name, QUERIES['arenas_by_capacity'])
+
+    # print the results to the terminal
+    print("\nArenas Organized by Capacity:\n")
+    print(df.to_string(index=False))
+    return df
+
+# capacity is parsed to a number at load time, so sqlite sums and sorts per country
+def capacity_by_country():
+    prepare()
+    country_capacity = read_sql(db_name, QUERIES['capacity_by_country'])
+
+    # print results to terminal
+    print("\n🏀 Total Seating Capacity by Country:\n")
+    print(country_capacity.to_string(index=False))
+
+    chart('euroleague/capacity_by_country', draw_capacity, country_capacity)
+    return country_capacity
 
 # plot bar chart
-plt.figure(figsize=(10, 6))
-plt.bar(country_capacity['Country'], country_capacity['Capacity'])
-plt.ylabel('Total Seating Capacity')
-plt.xlabel('Country')
-plt.title('EuroLeague Arena Seating Capacity by Country')
-plt.xticks(rotation=45, ha='right')  # rotate country labels for readability
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+def draw_capacity(country_capacity):
+    fig = plt.figure(figsize=(10, 6))
+    plt.bar(country_capacity['Country'], country_capacity['Capacity'])
+    plt.ylabel('Total Seating Capacity')
+    plt.xlabel('Country')
+    plt.title('EuroLeague Arena Seating Capacity by Country')
+    plt.xticks(rotation=45, ha='right')  # rotate country labels for readability
+    plt.tight_layout()
+    return fig
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [arenas_by_capacity, capacity_by_country]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,131 @@
 # imports
-import pandas as pd
-import matplotlib.pyplot as plt
-import sqlite3
+import sys
 from pathlib import Path
 
-# database URL
-url = 'https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2024/2024-05-07/rolling_stone.csv'
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.sync import sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from pydy.reduce import reduce_bars
+from pydy.store import export_columnar
+from trajectories import (LISTS, TRAJECTORY_INDEXES, TRAJECTORY_SCHEMA, add_trajectory_columns, decade_query,
+                          movers_query, trajectories)
 
-# read in csv files
-album_ranks = pd.read_csv(url)
+plt = lazy_import('matplotlib.pyplot')
 
-# create the database
-db_path = Path('RollingStone.db')
-if not db_path.exists():
-    print(f'Data base {db_path} not found, created the database. 📊')
-
-    # connect to database and create the data table
-    with sqlite3.connect(db_path) as con:
-        album_ranks.to_sql('album_ranks', con, if_exists='replace', index=False)
-        print('Data table album_ranks has been created. 🧮')
+# database URL
+url = 'https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2024/2024-05-07/rolling_stone.csv'
 
-else:
-    print('Database already exists. 🤓')
+# the database lives next to this file, wherever it is run from
+db_path = Path(__file__).with_name('RollingStone.db')
 
-# create a function to read store all albums who charted for 100+ weeks
-def over_100_weeks():
-    with sqlite3.connect(db_path) as con:
-        query = '''
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    'over_100_weeks': '''
         SELECT album, weeks_on_billboard AS charts
         FROM album_ranks
         WHERE weeks_on_billboard > 99
-        '''
-        df = pd.read_sql_query(query, con)
+        ''',
+    'largest_decline': '''
+        SELECT clean_name, differential
+        FROM album_ranks
+        WHERE differential < -249 AND rank_2020 IS NOT NULL
+        ''',
+    'release_rank': '''
+        SELECT rank_2020, release_year
+        FROM album_ranks
+        WHERE rank_2020 < 51
+        ''',
+    # release_decade is stored with every album, so sqlite does the bucketing
+    'album_decades': '''
+        SELECT release_decade AS decade, COUNT(*) AS albums
+        FROM album_ranks
+        WHERE rank_2020 IS NOT NULL
+        GROUP BY release_decade
+        ORDER BY release_decade
+        ''',
+    # slices over the precomputed trajectory columns
+    'decade_1970s_2020': decade_query(1970),
+    'decade_1970s_all_lists': decade_query(1970, min_lists=3),
+    'biggest_risers': movers_query('move_2003_2020', risers=True),
+    'biggest_fallers_2012_2020': movers_query('move_2012_2020', risers=False),
+}
+
+# album_ranks for the parquet backend (pydy/store.py), read whole by trajectories()
+COLUMNAR_TABLES = {'album_ranks': ('album_id',)}
+
+_prepared = False
+
+# create the database (afterwards only albums that changed in the csv are written) and index it, once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+
+    # stream the csv file into the data table, albums matched on their spotify album_id;
+    # every album gets its decade and rank moves (trajectories.py) on the way in
+    sync_csv(db_path, 'album_ranks', url, key='album_id', transform=add_trajectory_columns,
+             schema=TRAJECTORY_SCHEMA, indexes=TRAJECTORY_INDEXES)
+
+    # index the columns the queries filter on
+    build_indexes(db_path, QUERIES)
+
+    # the parquet copy, when that backend is in use
+    export_columnar(db_path, COLUMNAR_TABLES)
+    _prepared = True
 
-    # create bar chart of album names and weeks on top of charts
-    plt.figure(figsize=(15, 8))
+# create a function to read store all albums who charted for 100+ weeks
+def over_100_weeks():
+    prepare()
+    df = read_sql(db_path, QUERIES['over_100_weeks'])
+
+    # albums sharing a title become one bar, and only the 40 longest-charting keep their own
+    df = reduce_bars(df, 'album', 'charts', max_bars=40, duplicates='max')
+    chart('rolling_stones/over_100_weeks', draw_over_100_weeks, df)
+
+# create bar chart of album names and weeks on top of charts
+def draw_over_100_weeks(df):
+    fig = plt.figure(figsize=(15, 8))
     plt.bar(df['album'], df['charts'])
     plt.xticks(rotation=90)
     plt.xlabel('Album Name')
     plt.ylabel('Weeks')
     plt.title('Albums on billboard chart for 100+ weeks')
     plt.tight_layout()
-    plt.show()
+    return fig
 
 # create function to see artist who declined in ranks more than 250 positions
 def largest_decline():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT clean_name, differential
-        FROM album_ranks
-        WHERE differential < -249 AND rank_2020 IS NOT NULL
-        '''
-    df = pd.read_sql_query(query, con)
+    prepare()
+    df = read_sql(db_path, QUERIES['largest_decline'])
 
-    # create bar chart 
-    plt.figure(figsize=(10, 6))
+    # one bar per artist (their biggest drop), the 40 biggest drops get their own bar
+    df = reduce_bars(df, 'clean_name', 'differential', max_bars=40, duplicates='min', ascending=True)
+    chart('rolling_stones/largest_decline', draw_largest_decline, df)
+
+# create bar chart 
+def draw_largest_decline(df):
+    fig = plt.figure(figsize=(10, 6))
     plt.bar(df['clean_name'], df['differential'])
     plt.xticks(rotation=90)
     plt.xlabel('Artist')
     plt.ylabel('Positions Dropped')
     plt.title('Artist who dropped 250+ positions in rank')
     plt.tight_layout()
-    plt.show()
+    return fig
 
 def release_rank():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT rank_2020, release_year
-        FROM album_ranks
-        WHERE rank_2020 < 51
-        '''
-    df = pd.read_sql_query(query, con)
+    prepare()
+    df = read_sql(db_path, QUERIES['release_rank'])
 
-    # create scatter plot
-    plt.figure(figsize=(10, 6))
+    chart('rolling_stones/release_rank', draw_release_rank, df)
+
+# create scatter plot
+def draw_release_rank(df):
+    fig = plt.figure(figsize=(10, 6))
     plt.scatter(df['release_year'], df['rank_2020'], alpha=0.7)
     plt.xlabel("Year of Release")
     plt.ylabel("Ranking")
@@ -81,30 +133,75 @@ def release_rank():
 
     # invert y-axis because position 1 is best
     plt.gca().invert_yaxis()
-    plt.show()
+    return fig
 
 # create a pie chart of release decade of ranked albums in 2020
 def album_decades():
-    with sqlite3.connect(db_path) as con:
-        query = '''
-        SELECT release_year
-        FROM album_ranks
-        WHERE rank_2020 IS NOT NULL
-        '''
+    prepare()
+    # albums per decade of release, counted in sql
+    df = read_sql(db_path, QUERIES['album_decades'])
+    decade_counts = df.set_index('decade')['albums']
 
-    # group by decade of release
-    df = pd.read_sql_query(query, con)
-    df['decade'] = (df['release_year'] // 10) * 10
-    decade_counts = df['decade'].value_counts().sort_index()
+    chart('rolling_stones/album_decades', draw_album_decades, decade_counts)
 
-       # Plot pie chart
-    plt.figure(figsize=(8, 8))
+# Plot pie chart
+def draw_album_decades(decade_counts):
+    fig = plt.figure(figsize=(8, 8))
     plt.pie(decade_counts, labels=decade_counts.index,
             autopct='%1.1f%%', startangle=140)
     plt.title('Percentage by Decade of Ranked Albums')
-    plt.show()
-
-over_100_weeks()
-largest_decline()
-release_rank()
-album_decades() 
\ No newline at end of file
+    return fig
+
+# how the albums of every decade moved between the lists, with the biggest risers and fallers
+def rank_trajectories(k=10):
+    prepare()
+    paths = trajectories(db_path, k=k)
+    print(paths['decades'].to_string(index=False))
+    print(f"Biggest risers from 2003 to 2020:\n{paths['risers'].to_string(index=False)}")
+    print(f"Biggest fallers from 2003 to 2020:\n{paths['fallers'].to_string(index=False)}")
+
+    chart('rolling_stones/decade_trajectories', draw_decade_trajectories, paths['decades'])
+    return paths
+
+# grouped bars: albums of each decade on each list
+def draw_decade_trajectories(decades):
+    fig = plt.figure(figsize=(12, 6))
+    width = 0.8 / len(LISTS)
+    for i, year in enumerate(LISTS):
+        plt.bar(decades['decade'] + (i - 1) * width * 10, decades[f'on_{year}'], width=width * 10, label=str(year))
+    plt.xlabel('Decade of Release')
+    plt.ylabel('Albums on the List')
+    plt.title('Ranked Albums per Decade in 2003, 2012 and 2020')
+    plt.legend()
+    plt.tight_layout()
+    return fig
+
+# the 1970s albums on the 2020 list, and which of them are on all three lists
+def albums_1970s():
+    prepare()
+    df = read_sql(db_path, *QUERIES['decade_1970s_2020'])
+    all_lists = read_sql(db_path, *QUERIES['decade_1970s_all_lists'])
+    print(f'{len(df)} albums from the 1970s are on the 2020 list, {len(all_lists)} of them on all three lists:')
+    print(all_lists.to_string(index=False))
+    return {'on_2020': df, 'all_lists': all_lists}
+
+# the biggest climbs since 2003 and the biggest drops since 2012, read in move order
+def biggest_movers():
+    prepare()
+    risers = read_sql(db_path, *QUERIES['biggest_risers'])
+    fallers = read_sql(db_path, *QUERIES['biggest_fallers_2012_2020'])
+    print(f"Biggest risers from 2003 to 2020:\n{risers.to_string(index=False)}")
+    print(f"Biggest fallers from 2012 to 2020:\n{fallers.to_string(index=False)}")
+    return {'risers': risers, 'fallers': fallers}
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [over_100_weeks, largest_decline, release_rank, album_decades, rank_trajectories, albums_1970s,
+            biggest_movers]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# how every album moved across the 2003, 2012 and 2020 Rolling Stone lists
+#
+# the csv's differential is rank_2003 - rank_2020 with an album missing from a list
+# counted as rank 501 (just off the bottom). the same is precomputed at load time for
+# the two steps in between (move_2003_2012, move_2012_2020), along with the release
+# decade and the number of lists an album is on, so slices like "the 1970s albums on
+# the 2020 list", "the ones on all three lists" or "the 20 biggest risers since 2012"
+# are index lookups instead of a scan plus pandas afterwards. a positive move is a
+# climb.
+#
+# trajectories() reads the ranks and the stored moves once (from sqlite or the parquet
+# copy, pydy/store.py) and works out each album's path, the decade and genre rollups
+# (including how many of the lists their albums are on) and the biggest risers and
+# fallers from the same numpy arrays.
+
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.store import read_table
+from pydy.trace import traced
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+LISTS = (2003, 2012, 2020)
+RANKS = [f'rank_{year}' for year in LISTS]
+# the rank an album that is not on a list counts as
+OFF_LIST = 501
+# the three moves and the columns they are stored in; 2003 -> 2020 is the csv's own
+# differential
+MOVES = {
+    'move_2003_2012': 'move_2003_2012',
+    'move_2012_2020': 'move_2012_2020',
+    'move_2003_2020': 'differential',
+}
+
+# derived columns stored with the table, pinned to INTEGER
+TRAJECTORY_SCHEMA = {
+    'release_decade': 'INTEGER',
+    'lists': 'INTEGER',
+    'move_2003_2012': 'INTEGER',
+    'move_2012_2020': 'INTEGER',
+}
+
+# the decade slices read (decade, list rank) and the mover slices read in move order
+TRAJECTORY_INDEXES = [
+    ('release_decade', 'rank_2020'),
+    ('move_2003_2012',),
+    ('move_2012_2020',),
+    ('differential',),
+]
+
+
+def add_trajectory_columns(chunk):
+    # sync_csv transform: decade, lists and the two in-between moves for every album
+    ranks = {column: chunk[column].fillna(OFF_LIST) for column in RANKS}
+    return chunk.assign(
+        release_decade=(chunk['release_year'] // 10 * 10).astype('Int64'),
+        lists=chunk[RANKS].notna().sum(axis=1),
+        move_2003_2012=(ranks['rank_2003'] - ranks['rank_2012']).astype('Int64'),
+        move_2012_2020=(ranks['rank_2012'] - ranks['rank_2020']).astype('Int64'),
+    )
+
+
+def _move_column(move):
+    if move not in MOVES:
+        raise ValueError(f"move must be one of {', '.join(MOVES)}, got {move!r}")
+    return MOVES[move]
+
+
+def decade_query(decade, year=2020, min_lists=1):
+    # (sql, params): the albums of one release decade on one list, best rank first;
+    # min_lists keeps only the albums on at least that many of the three lists
+    if year not in LISTS:
+        raise ValueError(f"year must be one of {', '.join(map(str, LISTS))}, got {year}")
+    if not 1 <= min_lists <= len(LISTS):
+        raise ValueError(f'min_lists must be between 1 and {len(LISTS)}, got {min_lists}')
+    sql = f'''
+        SELECT clean_name, album, rank_{year} AS rank, lists
+        FROM album_ranks
+        WHERE release_decade = ? AND rank_{year} IS NOT NULL AND lists >= ?
+        ORDER BY rank_{year}
+        '''
+    return sql, [int(decade), int(min_lists)]
+
+
+def movers_query(move='move_2003_2020', k=20, risers=True):
+    # (sql, params): the k albums that climbed (or fell) furthest over one move
+    column = _move_column(move)
+    sql = f'''
+        SELECT clean_name, album, {', '.join(RANKS)}, {column} AS move
+        FROM album_ranks
+        ORDER BY {column} {'DESC' if risers else 'ASC'}
+        LIMIT ?
+        '''
+    return sql, [int(k)]
+
+
+def _rollup(codes, labels, ranks, lists, moves, name):
+    # per group: albums, albums on each list and on all of them, mean lists per album,
+    # mean move per step and risers / fallers from 2003 to 2020
+    n = len(labels)
+    albums = np.bincount(codes, minlength=n)
+    frame = pd.DataFrame({name: labels, 'albums': albums})
+    for year, on_list in zip(LISTS, (ranks < OFF_LIST).T):
+        frame[f'on_{year}'] = np.bincount(codes, weights=on_list, minlength=n).astype(np.int64)
+    frame['on_all'] = np.bincount(codes, weights=lists == len(LISTS), minlength=n).astype(np.int64)
+    frame['mean_lists'] = np.bincount(codes, weights=lists, minlength=n) / np.maximum(albums, 1)
+    for move, values in moves.items():
+        frame[f'mean_{move}'] = np.bincount(codes, weights=values, minlength=n) / np.maximum(albums, 1)
+    frame['risers'] = np.bincount(codes, weights=moves['move_2003_2020'] > 0, minlength=n).astype(np.int64)
+    frame['fallers'] = np.bincount(codes, weights=moves['move_2003_2020'] < 0, minlength=n).astype(np.int64)
+    return frame
+
+
+def _extremes(move, k, risers):
+    # positions of the k largest (or smallest) moves, largest climb / drop first
+    k = min(k, len(move))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    key = -move if risers else move
+    top = np.argpartition(key, k - 1)[:k]
+    # ties in album order, so the result does not depend on the partition
+    return top[np.lexsort((top, key[top]))]
+
+
+@traced()
+def trajectories(db_path, k=20):
+    # {'albums': one row per album and its path over the lists, 'decades': ...,
+    #  'genres': ..., 'risers': ..., 'fallers': ...}
+    columns = ['album_id', 'clean_name', 'album', 'genre', 'release_decade', 'lists', *RANKS, *MOVES.values()]
+    albums = read_table(db_path, 'album_ranks', columns=columns, order_by=['album_id'])
+    albums = albums.rename(columns={column: move for move, column in MOVES.items()})
+    ranks = np.nan_to_num(albums[RANKS].to_numpy(dtype=float), nan=OFF_LIST)
+    lists = albums['lists'].to_numpy(dtype=np.int64)
+    moves = {move: albums[move].to_numpy(dtype=float) for move in MOVES}
+
+    # new: missing from 2003; dropped: gone by 2020; otherwise the sign of the move
+    total = moves['move_2003_2020']
+    path = np.select(
+        [ranks[:, 0] == OFF_LIST, ranks[:, 2] == OFF_LIST, total > 0, total < 0],
+        ['new', 'dropped', 'rose', 'fell'],
+        'steady',
+    )
+    albums = albums.assign(path=path)
+
+    decade_codes, decades = pd.factorize(albums['release_decade'], sort=True, use_na_sentinel=False)
+    genre_codes, genres = pd.factorize(albums['genre'], sort=True, use_na_sentinel=False)
+    columns = ['clean_name', 'album', *RANKS, 'move_2003_2020']
+    return {
+        'albums': albums,
+        'decades': _rollup(decade_codes, np.asarray(decades), ranks, lists, moves, 'decade'),
+        'genres': _rollup(genre_codes, np.asarray(genres), ranks, lists, moves, 'genre'),
+        'risers': albums.iloc[_extremes(total, k, risers=True)][columns].reset_index(drop=True),
+        'fallers': albums.iloc[_extremes(total, k, risers=False)][columns].reset_index(drop=True),
+    }
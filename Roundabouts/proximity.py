@@ -0,0 +1,240 @@
+# spatial index and proximity lookups on the roundabout coordinates
+#
+# the lat / long of every roundabout is copied into an sqlite R*Tree (roundabouts_rtree,
+# keyed on the roundabouts rowid), so a bounding box is an index search instead of a
+# scan of the table. the R*Tree keeps its boxes as 32-bit floats, rounded outwards, so
+# the exact coordinates ride along as auxiliary columns and every lookup filters on
+# those. nearest() grows a box around a point until it holds the k closest roundabouts.
+#
+# for many points at once (nearest_many, count_within_many) and for density grids the
+# coordinates are loaded once per database version into numpy arrays and a scipy
+# KD-tree over points on the unit sphere, where the straight-line distance orders
+# points the same way as the great-circle one. distances are great-circle km.
+
+import contextlib
+import json
+import math
+import sqlite3
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.db import connect, database_version, is_current
+from pydy.fetch import table_is_current
+from pydy.trace import traced
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+spatial = lazy_import('scipy.spatial')
+
+RTREE = 'roundabouts_rtree'
+EARTH_KM = 6371.0088
+
+# every roundabout with usable coordinates, as a point box plus the exact values
+_INSERT = f'''
+    INSERT INTO {RTREE}
+    SELECT rowid, lat, lat, long, long, lat, long
+    FROM roundabouts
+    WHERE lat BETWEEN -90 AND 90 AND long BETWEEN -180 AND 180
+'''
+
+# roundabouts in a box: south, north, west, east for the R*Tree, then again for the exact values
+_BOX = f'''
+    FROM {RTREE}
+    WHERE max_lat >= ? AND min_lat <= ? AND max_long >= ? AND min_long <= ?
+      AND lat BETWEEN ? AND ? AND long BETWEEN ? AND ?
+'''
+
+_points = {}
+
+
+def has_coordinates(db_path):
+    with contextlib.closing(sqlite3.connect(db_path)) as con:
+        columns = {row[1] for row in con.execute('PRAGMA table_info(roundabouts)')}
+    return {'lat', 'long'} <= columns
+
+
+def has_spatial_index(db_path):
+    return table_is_current(db_path, RTREE)
+
+
+def build_spatial_index(db_path):
+    if not has_coordinates(db_path):
+        print('The roundabouts table has no lat / long columns, no spatial index built.')
+        return 0
+    with contextlib.closing(sqlite3.connect(db_path)) as con, con:
+        con.execute(f'DROP TABLE IF EXISTS {RTREE}')
+        con.execute(f'CREATE VIRTUAL TABLE {RTREE} USING rtree(id, min_lat, max_lat, min_long, max_long, +lat, +long)')
+        con.execute(_INSERT)
+        rows = con.execute(f'SELECT COUNT(*) FROM {RTREE}').fetchone()[0]
+    print(f'Indexed the locations of {rows:,} roundabouts. 🗺️')
+    return rows
+
+
+# after a sync only the roundabouts that were added, changed or removed are re-indexed
+def update_spatial_index(db_path, changes):
+    if changes['full'] or not has_spatial_index(db_path):
+        build_spatial_index(db_path)
+        return
+
+    stale = changes['rows']['updated'] + changes['rows']['deleted']
+    fresh = changes['rows']['inserted'] + changes['rows']['updated']
+    with contextlib.closing(sqlite3.connect(db_path)) as con, con:
+        con.execute(f'DELETE FROM {RTREE} WHERE id IN (SELECT value FROM json_each(?))', [json.dumps(stale)])
+        con.execute(_INSERT + ' AND rowid IN (SELECT value FROM json_each(?))', [json.dumps(fresh)])
+    print(f'Updated the locations of {len(set(stale) | set(fresh))} roundabouts. 🗺️')
+
+
+def _long_ranges(west, east):
+    # a box across the antimeridian (west > east) is searched as two boxes
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east)]
+
+
+def _in_box(con, columns, south, west, north, east):
+    rows = []
+    for low, high in _long_ranges(west, east):
+        rows += con.execute(f'SELECT {columns}' + _BOX, [south, north, low, high, south, north, low, high]).fetchall()
+    return rows
+
+
+def count_in_box(db_path, south, west, north, east):
+    # roundabouts with south <= lat <= north and west <= long <= east
+    con = connect(db_path)
+    return sum(count for count, in _in_box(con, 'COUNT(*)', south, west, north, east))
+
+
+def circle_box(lat, long, km):
+    # smallest lat / long box holding every point within km of (lat, long)
+    angle = km / EARTH_KM
+    south = lat - math.degrees(angle)
+    north = lat + math.degrees(angle)
+    if south <= -90 or north >= 90:
+        # the circle holds a pole, so every longitude
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+
+    spread = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    if spread >= 180:
+        return south, -180.0, north, 180.0
+    west, east = long - spread, long + spread
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+
+def haversine_km(lat, long, lats, longs):
+    lat, long, lats, longs = (np.radians(value) for value in (lat, long, lats, longs))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((longs - long) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def nearest(db_path, lat, long, k=5, km=10.0):
+    # the k roundabouts closest to (lat, long). the search box starts at km around the
+    # point and grows until k roundabouts lie within the circle it was drawn around
+    con = connect(db_path)
+    while True:
+        rows = np.array(_in_box(con, 'id, lat, long', *circle_box(lat, long, km)), dtype=float).reshape(-1, 3)
+        distances = haversine_km(lat, long, rows[:, 1], rows[:, 2])
+        close = distances <= km
+        # half way round the earth the circle covers everything
+        if close.sum() >= k or km >= math.pi * EARTH_KM:
+            break
+        km *= 4
+
+    order = np.argsort(distances[close], kind='stable')[:k]
+    found = rows[close][order]
+    ids = found[:, 0].astype(np.int64).tolist()
+    details = {row[0]: row[1:] for row in con.execute('''
+        SELECT r.rowid, r.name, t.value, c.value
+        FROM roundabouts r
+        LEFT JOIN dim_town_city t ON t.id = r.town_city_id
+        LEFT JOIN dim_country c ON c.id = r.country_id
+        WHERE r.rowid IN (SELECT value FROM json_each(?))
+        ''', [json.dumps(ids)])}
+    return pd.DataFrame({
+        'id': ids,
+        'name': [details[i][0] for i in ids],
+        'town_city': [details[i][1] for i in ids],
+        'country': [details[i][2] for i in ids],
+        'lat': found[:, 1],
+        'long': found[:, 2],
+        'distance_km': distances[close][order],
+    })
+
+
+def _unit_vectors(lats, longs):
+    lats, longs = np.radians(lats), np.radians(longs)
+    return np.column_stack([np.cos(lats) * np.cos(longs), np.cos(lats) * np.sin(longs), np.sin(lats)])
+
+
+def points(db_path):
+    # ids, coordinates and KD-tree of every indexed roundabout, loaded once per
+    # version of the database
+    path = Path(db_path).resolve()
+    con = connect(path)
+    version = database_version(path, con)
+    cached = _points.get(path)
+    if cached is not None and is_current(cached['version'], version):
+        return cached
+
+    rows = np.array(con.execute(f'SELECT id, lat, long FROM {RTREE} ORDER BY id').fetchall(), dtype=float).reshape(-1, 3)
+    cached = _points[path] = {
+        'version': version,
+        'ids': rows[:, 0].astype(np.int64),
+        'lat': rows[:, 1],
+        'long': rows[:, 2],
+        'tree': spatial.cKDTree(_unit_vectors(rows[:, 1], rows[:, 2])),
+    }
+    return cached
+
+
+@traced()
+def nearest_many(db_path, lats, longs, k=1):
+    # the k closest roundabouts for every point: one row per point and rank
+    found = points(db_path)
+    k = min(k, len(found['ids']))
+    chords, index = found['tree'].query(_unit_vectors(lats, longs), k=k)
+    chords, index = np.asarray(chords).reshape(-1, k), np.asarray(index).reshape(-1, k)
+    return pd.DataFrame({
+        'point': np.repeat(np.arange(len(chords)), k),
+        'rank': np.tile(np.arange(1, k + 1), len(chords)),
+        'id': found['ids'][index.ravel()],
+        'distance_km': 2 * EARTH_KM * np.arcsin(np.clip(chords.ravel() / 2, 0, 1)),
+    })
+
+
+@traced()
+def count_within_many(db_path, lats, longs, km):
+    # number of roundabouts within km of every point
+    found = points(db_path)
+    chord = 2 * math.sin(min(km / EARTH_KM, math.pi) / 2)
+    # a hair wider, so a roundabout exactly km away is not lost to rounding
+    return found['tree'].query_ball_point(_unit_vectors(lats, longs), r=chord * (1 + 1e-12), return_length=True)
+
+
+@traced()
+def density_grid(db_path, cell=1.0, box=None):
+    # roundabouts per cell of cell x cell degrees, for the cells that have any; box is
+    # (south, west, north, east) to count only part of the map
+    found = points(db_path)
+    lats, longs = found['lat'], found['long']
+    if box is not None:
+        south, west, north, east = box
+        keep = (lats >= south) & (lats <= north)
+        keep &= np.logical_or.reduce([(longs >= low) & (longs <= high) for low, high in _long_ranges(west, east)])
+        lats, longs = lats[keep], longs[keep]
+
+    columns = math.ceil(360 / cell)
+    rows = np.minimum(np.floor((lats + 90) / cell), math.ceil(180 / cell) - 1).astype(np.int64)
+    cols = np.minimum(np.floor((longs + 180) / cell), columns - 1).astype(np.int64)
+    cells, counts = np.unique(rows * columns + cols, return_counts=True)
+    return pd.DataFrame({
+        'lat': cells // columns * cell - 90,
+        'long': cells % columns * cell - 180,
+        'roundabouts': counts,
+    })
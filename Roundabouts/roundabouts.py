@@ -1,68 +1,120 @@
-import sqlite3
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.sync import on_change, sync_csv
+from pydy.indexer import build_indexes
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from pydy.dimensions import clean_text, decode, upper_text
+from proximity import (build_spatial_index, density_grid, has_coordinates, has_spatial_index, nearest_many,
+                       update_spatial_index)
+
+plt = lazy_import('matplotlib.pyplot')
+px = lazy_import('plotly.express')
 
 # bring in url and store csv file
 url = ('https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2025/2025-12-16/roundabouts_clean.csv')
-roundabouts = pd.read_csv(url)
 
-db_name = 'Roundabouts.db'
+# the database lives next to this file, wherever it is run from
+db_name = Path(__file__).with_name('Roundabouts.db')
 
-# create database
-def create_database(db_name):
-    if not os.path.exists(db_name):
-        print(f'Data base {db_name} does not exists. Creating database.')
-
-        with sqlite3.connect(db_name) as con:
-            roundabouts.to_sql('roundabouts', con, if_exists='replace', index=False)
-            print(f'Database {db_name} created.')
+# place names repeat on thousands of rows, so they are stored once per value in dim_<column>
+# tables (trimmed; state codes in capitals) and the table keeps integer <column>_id codes
+DIMENSIONS = {'town_city': clean_text, 'state_region': upper_text, 'country': clean_text}
+# state_count reads the states of one country straight from this index
+INDEXES = [('country_id', 'state_region_id')]
 
-    else:
-        print('The data base already exists.')
+# create database, later runs only write the roundabouts that changed in the csv
+# (there is no id column, so a changed row is replaced as a whole)
+def create_database(db_name):
+    sync_csv(db_name, 'roundabouts', url, indexes=INDEXES, dimensions=DIMENSIONS)
 
-create_database(db_name)
+# the R*Tree over lat / long follows every sync of the table
+on_change('roundabouts', update_spatial_index)
 
-# create a sql query to count and print number of roundabouts in each city
-def count_by_city():
-    with sqlite3.connect(db_name) as con:
-        # sql query
-        query = '''
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    # blanks are stored as NULL codes, which the joins leave out
+    'count_by_city': '''
         SELECT 
-            town_city,
+            t.value AS town_city,
             COUNT(*) AS roundabout_count
-        FROM roundabouts
-        WHERE town_city IS NOT NULL AND town_city <> ''
-        GROUP BY town_city
+        FROM roundabouts r
+        JOIN dim_town_city t ON t.id = r.town_city_id
+        GROUP BY r.town_city_id
         ORDER BY roundabout_count desc
-        '''
+        ''',
+    'count_by_country': '''
+        SELECT
+            c.value AS country,
+            count(*) AS country_count
+        FROM roundabouts r
+        JOIN dim_country c ON c.id = r.country_id
+        GROUP BY r.country_id
+        HAVING COUNT(*) > 99
+        ORDER BY country_count desc
+        ''',
+    # state codes are trimmed and in capitals already, so this groups on the integer code
+    'state_count': '''
+        SELECT
+            s.value AS state_region,
+            COUNT(*) AS state_count
+        FROM roundabouts r
+        JOIN dim_state_region s ON s.id = r.state_region_id
+        WHERE r.country_id = (SELECT id FROM dim_country WHERE value = 'United States')
+          AND LENGTH(s.value) = 2
+        GROUP BY r.state_region_id
+        HAVING COUNT(*) > 10
+        ORDER BY state_count DESC
+        ''',
+    'approaches_count': '''
+        SELECT 
+            approaches,
+            count(*) as total
+        FROM roundabouts
+        WHERE 
+            approaches IS NOT NULL
+            AND approaches <> ''
+        Group BY approaches
+        ORDER BY total desc
+        ''',
+}
+
+_prepared = False
+
+# create the database and index the columns the queries filter and group on, once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+    create_database(db_name)
+    # databases built before the spatial index get it on their first run
+    if has_coordinates(db_name) and not has_spatial_index(db_name):
+        build_spatial_index(db_name)
+    build_indexes(db_name, QUERIES)
+    _prepared = True
 
-        df = pd.read_sql_query(query, con)
+# create a sql query to count and print number of roundabouts in each city
+def count_by_city():
+    prepare()
+    # sql query
+    df = read_sql(db_name, QUERIES['count_by_city'])
 
-        print(df.head(10))
-        return df
-    
-count_by_city()
+    print(df.head(10))
+    return df
 
 # count by country and make a bar graph for countries with roundabouts 100+
 def count_by_country():
-    with sqlite3.connect(db_name) as con:
-        query = '''
-        SELECT
-            country,
-            count(*) AS country_count
-        FROM roundabouts
-        WHERE country IS NOT NULL AND country <> ''
-        GROUP BY country
-        HAVING COUNT(*) > 99
-        ORDER BY country_count desc
-        '''
+    prepare()
+    df_country = read_sql(db_name, QUERIES['count_by_country'])
+    chart('roundabouts/count_by_country', draw_count_by_country, df_country)
 
-        df_country = pd.read_sql_query(query, con)
-    
-    # create a bar graph 
-    plt.figure()
+# create a bar graph 
+def draw_count_by_country(df_country):
+    fig = plt.figure()
     plt.bar(df_country['country'], df_country['country_count'])
 
     plt.title('Countries with 100+ Roundabouts')
@@ -70,36 +122,22 @@ def count_by_country():
     plt.ylabel('Number of Roundabouts')
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
-
-    plt.show()
-
-count_by_country()
+    return fig
 
 # count by state for US roundabouts and choropleth map. Use length 2 to remove counties and only look at states.
 def state_count():
-    with sqlite3.connect(db_name) as con:
-        query = '''
-        SELECT
-            UPPER(TRIM(state_region)) AS state_region,
-            COUNT(*) AS state_count
-        FROM roundabouts
-        WHERE country = 'United States'
-          AND state_region IS NOT NULL
-          AND TRIM(state_region) <> ''
-          AND LENGTH(TRIM(state_region)) = 2
-        GROUP BY UPPER(TRIM(state_region))
-        HAVING COUNT(*) > 10
-        ORDER BY state_count DESC
-        '''
-        df_state = pd.read_sql_query(query, con)
-
-    # Normalize again (in case something slips through)
-    df_state['state_region'] = df_state['state_region'].astype(str).str.upper().str.strip()
+    prepare()
+    # state codes are cleaned once at load time (see DIMENSIONS)
+    df_state = read_sql(db_name, QUERIES['state_count'])
 
     # Safety check: if this prints 0 rows, that's the issue
     print('Rows to plot:', len(df_state))
     print(df_state.head(10))
 
+    chart('roundabouts/state_count', draw_state_count, df_state)
+    return df_state
+
+def draw_state_count(df_state):
     fig = px.choropleth(
         df_state,
         locations='state_region',
@@ -114,29 +152,82 @@ def state_count():
     # These settings make filled states visually obvious
     fig.update_traces(marker_line_width=0.5)
     fig.update_layout(margin={'r': 0, 't': 60, 'l': 0, 'b': 0})
-
-    fig.show()
-    return df_state
-
-df_state = state_count()
+    return fig
 
 # list how many approaches and stat which is most common?
 def approaches_count():
-    with sqlite3.connect(db_name) as con: 
-        query = '''
-        SELECT 
-            approaches,
-            count(*) as total
+    prepare()
+    df_approaches = read_sql(db_name, QUERIES['approaches_count'])
+    print(df_approaches)
+
+    print(f"The most common number of approaches for a roundabout is {df_approaches['approaches'].iloc[0]} approaches with {df_approaches['total'].iloc[0]} total roundabouts.")
+    return df_approaches
+
+# roundabouts per 2 x 2 degree cell, drawn as a map
+def density_map():
+    prepare()
+    if not has_spatial_index(db_name):
+        print('No roundabout locations to map.')
+        return None
+    df_density = density_grid(db_name, cell=2.0)
+    print(f"Roundabouts fall in {len(df_density)} cells, the busiest holds {df_density['roundabouts'].max()}.")
+    chart('roundabouts/density_map', draw_density_map, df_density)
+    return df_density
+
+def draw_density_map(df_density):
+    fig = plt.figure(figsize=(12, 6))
+    plt.scatter(df_density['long'] + 1, df_density['lat'] + 1, c=df_density['roundabouts'],
+                s=12, marker='s', cmap='viridis', norm='log')
+    plt.colorbar(label='Roundabouts per 2° cell')
+    plt.xlim(-180, 180)
+    plt.ylim(-90, 90)
+    plt.title('Where the Roundabouts Are')
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
+    plt.tight_layout()
+    return fig
+
+# how far apart roundabouts are: median distance to the nearest other roundabout, by country
+def spacing_by_country():
+    prepare()
+    if not has_spatial_index(db_name):
+        print('No roundabout locations to compare.')
+        return None
+    df = decode(db_name, read_sql(db_name, '''
+        SELECT rowid AS id, country_id, lat, long
         FROM roundabouts
-        WHERE 
-            approaches IS NOT NULL
-            AND approaches <> ''
-        Group BY approaches
-        ORDER BY total desc
-        '''
-        df_approaches = pd.read_sql_query(query, con)
-        print(df_approaches)
+        WHERE rowid IN (SELECT id FROM roundabouts_rtree)
+        '''), 'country')
+    # a country needs two roundabouts for a spacing
+    df = df.dropna(subset=['country'])
+    df = df[df.groupby('country', observed=True)['country'].transform('size') >= 2].reset_index(drop=True)
+    if df.empty:
+        print('No country has two roundabout locations to compare.')
+        return None
+
+    # every roundabout at once; rank 1 is the roundabout itself, and a point without a
+    # second neighbour gets NaN
+    neighbours = nearest_many(db_name, df['lat'].to_numpy(), df['long'].to_numpy(), k=2)
+    second = neighbours.loc[neighbours['rank'] == 2].set_index('point')['distance_km']
+    df['nearest_km'] = second.reindex(range(len(df))).to_numpy()
+
+    df_spacing = (
+        df.groupby('country', observed=True)['nearest_km']
+        .agg(roundabouts='size', median_km='median')
+        .query('roundabouts > 99')
+        .sort_values('median_km')
+        .reset_index()
+    )
+    print(df_spacing.to_string(index=False, float_format='%.2f'))
+    return df_spacing
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [count_by_city, count_by_country, state_count, approaches_count, density_map, spacing_by_country]
 
-        print(f'The most common number of approaches for a roundabout is {df_approaches['approaches'].iloc[0]} approaches with {df_approaches['total'].iloc[0]} total roundabouts.')
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
 
-approaches_count()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
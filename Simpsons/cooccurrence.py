@@ -0,0 +1,105 @@
+# sparse character x location / episode / character counts for the simpsons tables
+#
+# script lines are the fact table of a small star schema: every line points at a
+# character, a location and an episode by integer id. instead of one sql self-join
+# per question, the (character, location, episode) triples are read once and turned
+# into scipy.sparse matrices, and every count is a sparse matrix product on those.
+# a scene is one location within one episode.
+
+import sqlite3
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.store import read_table
+from pydy.trace import traced
+from pydy.ingest import create_indexes
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+sparse = lazy_import('scipy.sparse')
+
+# integer keys of the star schema: dimension ids and the fact table's foreign keys
+STAR_INDEXES = {
+    "simpsons_characters": [("id",)],
+    "simpsons_locations": [("id",)],
+    "simpsons_episodes": [("id", "season")],
+    "simpsons_script_lines": [("character_id",), ("location_id",), ("episode_id", "character_id", "is_speaking")],
+}
+
+
+def build_star_schema(db_path):
+    with sqlite3.connect(db_path) as con:
+        for table, indexes in STAR_INDEXES.items():
+            create_indexes(con, table, indexes)
+
+
+def _codes(values):
+    # dense 0..n-1 codes for the ids so they can index matrix rows and columns
+    ids, codes = np.unique(values, return_inverse=True)
+    return ids, codes
+
+
+@traced()
+def incidence(db_path):
+    # from sqlite or the parquet copy of script lines (pydy/store.py)
+    keys = ["character_id", "location_id", "episode_id"]
+    lines = read_table(db_path, "simpsons_script_lines", columns=keys,
+                       filters=[(key, "not null", None) for key in keys])
+    character_ids, char_codes = _codes(lines["character_id"].to_numpy(dtype=np.int64))
+    location_ids, loc_codes = _codes(lines["location_id"].to_numpy(dtype=np.int64))
+    episode_ids, ep_codes = _codes(lines["episode_id"].to_numpy(dtype=np.int64))
+
+    # one scene per (episode, location) pair
+    scene_keys = ep_codes.astype(np.int64) * len(location_ids) + loc_codes
+    _, scene_codes = _codes(scene_keys)
+
+    ones = np.ones(len(lines), dtype=np.int32)
+    n_chars = len(character_ids)
+
+    def counts(codes, n_cols):
+        # duplicates are summed when converting, so each cell is a line count
+        return sparse.coo_matrix((ones, (char_codes, codes)), shape=(n_chars, n_cols)).tocsr()
+
+    return {
+        "character_ids": character_ids,
+        "location_ids": location_ids,
+        "episode_ids": episode_ids,
+        "character_location": counts(loc_codes, len(location_ids)),
+        "character_episode": counts(ep_codes, len(episode_ids)),
+        "character_scene": counts(scene_codes, scene_codes.max() + 1 if len(scene_codes) else 0),
+    }
+
+
+@traced()
+def shared_scenes(inc):
+    # character x character: number of scenes both characters speak in.
+    # the diagonal is each character's own scene count.
+    in_scene = (inc["character_scene"] > 0).astype(np.int32)
+    return (in_scene @ in_scene.T).tocsr()
+
+
+@traced()
+def shared_episodes(inc):
+    # character x character: number of episodes both characters appear in
+    in_episode = (inc["character_episode"] > 0).astype(np.int32)
+    return (in_episode @ in_episode.T).tocsr()
+
+
+@traced()
+def top_cells(matrix, row_ids, col_ids, k=20, skip_diagonal=False):
+    # largest k entries of a sparse matrix as a tidy frame of (row id, col id, count)
+    cells = sparse.triu(matrix, k=1).tocoo() if skip_diagonal else matrix.tocoo()
+    if cells.nnz == 0:
+        return pd.DataFrame(columns=["row_id", "col_id", "count"])
+
+    k = min(k, cells.nnz)
+    top = np.argpartition(cells.data, -k)[-k:]
+    top = top[np.argsort(cells.data[top])[::-1]]
+    return pd.DataFrame({
+        "row_id": row_ids[cells.row[top]],
+        "col_id": col_ids[cells.col[top]],
+        "count": cells.data[top],
+    })
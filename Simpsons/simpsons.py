@@ -1,39 +1,181 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import sqlite3
+import zlib
+import sys
 from pathlib import Path
-import numpy as np
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.fetch import table_is_current
+from pydy.sync import on_change, sync_all
+from pydy.indexer import build_indexes
+from pydy.store import export_columnar
+from pydy.db import read_sql
+from pydy.charts import chart, render_charts
+from cooccurrence import STAR_INDEXES, build_star_schema, incidence, shared_scenes, top_cells
+
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+np = lazy_import('numpy')
 
 # URLs to the datasets
 base_url = "https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2025/2025-02-04/"
 
-# Read each CSV into a pandas DataFrame
-simpsons_characters = pd.read_csv(base_url + "simpsons_characters.csv")
-simpsons_episodes = pd.read_csv(base_url + "simpsons_episodes.csv")
-simpsons_locations = pd.read_csv(base_url + "simpsons_locations.csv")
-simpsons_script_lines = pd.read_csv(base_url + "simpsons_script_lines.csv")
+# speaking_line arrives as text/bool ('true', 'False', 'n', ...); it is turned into a
+# 0/1 is_speaking column once at load time instead of being lowered and cast per query.
+# the foreign keys are pinned to INTEGER (pandas reads id columns with gaps as floats)
+LINES_SCHEMA = {
+    "is_speaking": "INTEGER",
+    "episode_id": "INTEGER",
+    "character_id": "INTEGER",
+    "location_id": "INTEGER",
+}
+NOT_SPEAKING = ["false", "0", "no", "n", "f"]
+
+def normalize_lines(chunk):
+    flag = chunk["speaking_line"].astype("string").str.strip().str.lower()
+    is_speaking = chunk["speaking_line"].notna() & ~flag.isin(NOT_SPEAKING).fillna(False)
+    return chunk.assign(is_speaking=is_speaking.astype(int))
+
+# column types of every csv, so the parser never has to guess them (ids with gaps stay
+# integers, and a text column of digits stays text)
+DTYPES = {
+    "simpsons_characters": {"id": "Int64", "name": "string", "normalized_name": "string", "gender": "string"},
+    "simpsons_locations": {"id": "Int64", "name": "string", "normalized_name": "string"},
+    "simpsons_episodes": {
+        "id": "Int64", "image_url": "string", "imdb_rating": "float64", "imdb_votes": "float64",
+        "number_in_season": "Int64", "number_in_series": "Int64", "original_air_date": "string",
+        "original_air_year": "Int64", "production_code": "string", "season": "Int64", "title": "string",
+        "us_viewers_in_millions": "float64", "video_url": "string", "views": "float64",
+    },
+    "simpsons_script_lines": {
+        "id": "Int64", "episode_id": "Int64", "number": "Int64", "raw_text": "string",
+        "timestamp_in_ms": "Int64", "speaking_line": "string", "character_id": "Int64",
+        "location_id": "Int64", "raw_character_text": "string", "raw_location_text": "string",
+        "spoken_words": "string", "normalized_text": "string", "word_count": "Int64",
+    },
+}
 
-# create database for simpsons data
-db_path = Path('simpsons.db')
-if not db_path.exists():
-    print('Database not found, creating simpsons.db. 🤓')
+# script lines in episode order for the parquet backend (pydy/store.py)
+COLUMNAR_TABLES = {"simpsons_script_lines": ("episode_id", "character_id")}
 
-    # Create/connect DB and save create data talbles
+# per-table load options: script lines gets the flag, and every table gets its star-schema keys indexed
+LOAD_OPTIONS = {table: {"indexes": indexes, "dtype": DTYPES[table]} for table, indexes in STAR_INDEXES.items()}
+LOAD_OPTIONS["simpsons_script_lines"].update(transform=normalize_lines, schema=LINES_SCHEMA)
+
+# fingerprint of one script line, covering only what the aggregate depends on
+def line_crc(line_id, character_id, is_speaking):
+    return zlib.crc32(f"{line_id}|{character_id}|{is_speaking}".encode())
+
+# materialized speaking lines per episode x character and season x character.
+# only episodes whose lines or season changed since the last refresh are recomputed;
+# episodes without a season stay out of the season table.
+def refresh_season_lines(db_path):
     with sqlite3.connect(db_path) as con:
-        con.execute("PRAGMA foreign_keys = ON;")
+        con.create_function("line_crc", 3, line_crc, deterministic=True)
+        con.executescript("""
+            CREATE TABLE IF NOT EXISTS simpsons_episode_character_lines (
+                episode_id INTEGER NOT NULL,
+                season INTEGER,
+                character_id INTEGER NOT NULL,
+                speaking_lines INTEGER NOT NULL,
+                PRIMARY KEY (episode_id, character_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS simpsons_season_character_lines (
+                character_id INTEGER NOT NULL,
+                season INTEGER NOT NULL,
+                speaking_lines INTEGER NOT NULL,
+                PRIMARY KEY (character_id, season)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS simpsons_episode_fingerprints (
+                episode_id INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL
+            );
+        """)
+
+        # the episode's season is part of its fingerprint, so moving an episode to
+        # another season refreshes it too
+        current = dict(con.execute("""
+            SELECT s.episode_id,
+                   COUNT(*) || ':' || SUM(line_crc(s.id, s.character_id, s.is_speaking)) || ':' || IFNULL(e.season, '')
+            FROM simpsons_script_lines s
+            LEFT JOIN simpsons_episodes e
+              ON e.id = s.episode_id
+            WHERE s.episode_id IS NOT NULL
+            GROUP BY s.episode_id
+        """).fetchall())
+        stored = dict(con.execute("SELECT episode_id, fingerprint FROM simpsons_episode_fingerprints").fetchall())
+
+        changed = [episode for episode, fingerprint in current.items() if stored.get(episode) != fingerprint]
+        removed = [episode for episode in stored if episode not in current]
+        if not changed and not removed:
+            print(f"Season aggregate is up to date ({len(current)} episodes). 🍩")
+            return []
+
+        con.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_episodes (episode_id INTEGER PRIMARY KEY)")
+        con.execute("DELETE FROM temp.refresh_episodes")
+        con.executemany("INSERT INTO temp.refresh_episodes VALUES (?)", [(e,) for e in changed + removed])
 
-        simpsons_characters.to_sql("simpsons_characters", con, if_exists="replace", index=False)
-        simpsons_episodes.to_sql("simpsons_episodes", con, if_exists="replace", index=False)
-        simpsons_locations.to_sql("simpsons_locations", con, if_exists="replace", index=False)
-        simpsons_script_lines.to_sql("simpsons_script_lines", con, if_exists="replace", index=False)
+        # seasons touched before and after the refresh
+        seasons = {row[0] for row in con.execute("""
+            SELECT DISTINCT season FROM simpsons_episode_character_lines
+            WHERE episode_id IN (SELECT episode_id FROM temp.refresh_episodes)
+            UNION
+            SELECT DISTINCT season FROM simpsons_episodes
+            WHERE id IN (SELECT episode_id FROM temp.refresh_episodes)
+        """)}
 
-    print(f"simpsons.db created at {db_path.resolve()} ✅")
+        con.execute("""
+            DELETE FROM simpsons_episode_character_lines
+            WHERE episode_id IN (SELECT episode_id FROM temp.refresh_episodes)
+        """)
+        con.execute("""
+            INSERT INTO simpsons_episode_character_lines (episode_id, season, character_id, speaking_lines)
+            SELECT s.episode_id, e.season, s.character_id, SUM(s.is_speaking)
+            FROM simpsons_script_lines s
+            JOIN simpsons_episodes e
+              ON s.episode_id = e.id
+            WHERE s.episode_id IN (SELECT episode_id FROM temp.refresh_episodes)
+              AND s.character_id IS NOT NULL
+            GROUP BY s.episode_id, s.character_id
+            HAVING SUM(s.is_speaking) > 0
+        """)
 
-else:
-    print(f"Database already exists at {db_path.resolve()} 🪇.")
+        seasons.discard(None)
+        season_marks = ",".join("?" * len(seasons))
+        con.execute(f"DELETE FROM simpsons_season_character_lines WHERE season IN ({season_marks})", list(seasons))
+        con.execute(f"""
+            INSERT INTO simpsons_season_character_lines (character_id, season, speaking_lines)
+            SELECT character_id, season, SUM(speaking_lines)
+            FROM simpsons_episode_character_lines
+            WHERE season IN ({season_marks}) AND season IS NOT NULL
+            GROUP BY character_id, season
+        """, list(seasons))
+
+        con.executemany("DELETE FROM simpsons_episode_fingerprints WHERE episode_id = ?", [(e,) for e in removed])
+        con.executemany(
+            "INSERT OR REPLACE INTO simpsons_episode_fingerprints VALUES (?, ?)",
+            [(episode, current[episode]) for episode in changed],
+        )
+
+    print(f"Refreshed the season aggregate for {len(changed) + len(removed)} of {len(current)} episodes. 🍩")
+    return changed + removed
+
+# the database lives next to this file, wherever it is run from
+db_path = Path(__file__).with_name("simpsons.db")
+tables = ["simpsons_characters", "simpsons_episodes", "simpsons_locations", "simpsons_script_lines"]
+
+# synced script lines or episodes bring the season aggregate up to date (it only
+# recomputes the episodes whose lines or season changed). on a first build the
+# episodes arrive before the script lines, whose own sync does the refresh then
+def refresh_after_sync(db_path, changes):
+    if table_is_current(db_path, "simpsons_script_lines"):
+        refresh_season_lines(db_path)
+
+on_change("simpsons_script_lines", refresh_after_sync)
+on_change("simpsons_episodes", refresh_after_sync)
 
 # Query: count speaking lines by season for the given character
-db_path = "simpsons.db"
 
 # Character IDs
 characters = {
@@ -44,60 +186,137 @@ characters = {
     "Maggie": 105,
 }
 
-# Build the SQL with an IN (...) list for the characters
-placeholders = ",".join(["?"] * len(characters))
-sql = f"""
-SELECT
-  e.season AS season,
-  s.character_id,
-  COUNT(*) AS speaking_lines
-FROM simpsons_script_lines s
-JOIN simpsons_episodes e
-  ON s.episode_id = e.id
-WHERE
-  s.character_id IN ({placeholders})
-  AND CASE
-        WHEN s.speaking_line IS NULL THEN 0
-        WHEN LOWER(CAST(s.speaking_line AS TEXT)) IN ('false','0','no','n','f') THEN 0
-        ELSE 1
-      END = 1
-GROUP BY e.season, s.character_id
-ORDER BY e.season, s.character_id;
-"""
-
-with sqlite3.connect(db_path) as con:
-    df_long = pd.read_sql_query(sql, con, params=list(characters.values()))
-
-# Pivot: rows = season, columns = character name, values = speaking_lines
-id_to_name = {v: k for k, v in characters.items()}
-df_long["character"] = df_long["character_id"].map(id_to_name)
-
-df = (
-    df_long
-    .pivot_table(index="season", columns="character", values="speaking_lines", aggfunc="sum", fill_value=0)
-    .sort_index()
-)
-
-# Ensure all seasons 1..28 appear even if zeros
-all_seasons = pd.Index(range(21, 27), name="season")
-df = df.reindex(all_seasons, fill_value=0)
-
-print(df.head(10))  # peek
+# any set of characters and season range is a primary-key lookup on the aggregate
+def season_lines_query(character_ids, first_season=None, last_season=None):
+    placeholders = ",".join(["?"] * len(character_ids))
+    sql = f"""
+    SELECT season, character_id, speaking_lines
+    FROM simpsons_season_character_lines
+    WHERE character_id IN ({placeholders})
+      AND season BETWEEN ? AND ?
+    ORDER BY season, character_id
+    """
+    params = [*character_ids, first_season or 0, last_season or 10_000]
+    return sql, params
+
+sql, params = season_lines_query(list(characters.values()))
+
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    "season_lines": (sql, params),
+}
+
+_prepared = False
+
+# create the database, the aggregate and the indexes once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+
+    # Fetch the four CSVs together and parse the changed ones side by side, then write each
+    # table in chunks; after the first run only rows whose id is new, changed or gone are written
+    sync_all(db_path, {
+        table: {"url": base_url + table + ".csv", "key": "id", **LOAD_OPTIONS.get(table, {})}
+        for table in tables
+    })
+
+    # databases built before the aggregate existed get it on their first run
+    if not table_is_current(db_path, "simpsons_season_character_lines"):
+        refresh_season_lines(db_path)
+
+    # make sure the star-schema indexes exist (no-op once they do)
+    build_star_schema(db_path)
+
+    # index the columns the queries filter on (the aggregate is already keyed on them)
+    build_indexes(db_path, QUERIES)
+
+    # the parquet copy of script lines, when that backend is in use
+    export_columnar(db_path, COLUMNAR_TABLES)
+    _prepared = True
+
+# speaking lines per season for the characters above, as a season x character table
+def season_lines():
+    prepare()
+    df_long = read_sql(db_path, sql, params=params)
+
+    # Pivot: rows = season, columns = character name, values = speaking_lines
+    id_to_name = {v: k for k, v in characters.items()}
+    df_long["character"] = df_long["character_id"].map(id_to_name)
+
+    df = (
+        df_long
+        .pivot_table(index="season", columns="character", values="speaking_lines", aggfunc="sum", fill_value=0)
+        .sort_index()
+    )
+
+    # Ensure all seasons 1..28 appear even if zeros
+    all_seasons = pd.Index(range(21, 27), name="season")
+    df = df.reindex(all_seasons, fill_value=0)
+
+    print(df.head(10))  # peek
+
+    chart("simpsons/season_lines", draw_season_lines, df)
+    return df
 
 # ---- Plot: grouped bar by season ----
-fig, ax = plt.subplots()  # (use subplots to avoid plt.figure issues)
-n_chars = df.shape[1]
-x = np.arange(len(df.index))  # seasons positions
-width = 0.8 / n_chars         # total width split among characters
-
-for i, col in enumerate(df.columns):
-    ax.bar(x + i*width - (width*(n_chars-1)/2), df[col].values, width, label=col)
-
-ax.set_xlabel("Season")
-ax.set_ylabel("Number of speaking lines")
-ax.set_title("Speaking lines by season")
-ax.set_xticks(x)
-ax.set_xticklabels(df.index)
-ax.legend(title="Character")
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+def draw_season_lines(df):
+    fig, ax = plt.subplots()  # (use subplots to avoid plt.figure issues)
+    n_chars = df.shape[1]
+    x = np.arange(len(df.index))  # seasons positions
+    width = 0.8 / n_chars         # total width split among characters
+
+    for i, col in enumerate(df.columns):
+        ax.bar(x + i*width - (width*(n_chars-1)/2), df[col].values, width, label=col)
+
+    ax.set_xlabel("Season")
+    ax.set_ylabel("Number of speaking lines")
+    ax.set_title("Speaking lines by season")
+    ax.set_xticks(x)
+    ax.set_xticklabels(df.index)
+    ax.legend(title="Character")
+    plt.tight_layout()
+    return fig
+
+# characters who share the most scenes (same location in the same episode), from one sparse product
+def shared_scene_pairs(top=20):
+    prepare()
+    inc = incidence(db_path)
+    ids = inc["character_ids"]
+    pairs = top_cells(shared_scenes(inc), ids, ids, k=top, skip_diagonal=True)
+
+    names = read_sql(db_path, "SELECT id, name FROM simpsons_characters").set_index("id")["name"]
+    pairs["character_1"] = pairs["row_id"].map(names)
+    pairs["character_2"] = pairs["col_id"].map(names)
+    pairs = pairs.rename(columns={"count": "shared_scenes"})[["character_1", "character_2", "shared_scenes"]]
+    print(pairs.to_string(index=False))
+    return pairs
+
+# where a character speaks the most, from the character x location matrix
+def character_locations(character_id, top=10):
+    prepare()
+    inc = incidence(db_path)
+    row = np.searchsorted(inc["character_ids"], character_id)
+    if row == len(inc["character_ids"]) or inc["character_ids"][row] != character_id:
+        raise ValueError(f"Character {character_id} has no lines with a location")
+
+    counts = inc["character_location"][row].toarray().ravel()
+    order = np.argsort(counts)[::-1][:top]
+    names = read_sql(db_path, "SELECT id, name FROM simpsons_locations").set_index("id")["name"]
+    df = pd.DataFrame({"location": names.reindex(inc["location_ids"][order]).to_numpy(), "lines": counts[order]})
+    df = df[df["lines"] > 0]
+    print(df.to_string(index=False))
+    return df
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [season_lines]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
+    # shared_scene_pairs()
+    # character_locations(characters["Homer"])
+
+if __name__ == '__main__':
+    main()
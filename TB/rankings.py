@@ -0,0 +1,98 @@
+# top-k / bottom-k rankings, means and percentile cut points for the WHO TB metrics
+#
+# instead of one full sort per question (a mean, a top 20, a bottom 20, ...), each
+# metric is read once in (year, metric) order. that order comes straight off an index
+# on (year, metric), so sqlite does no sorting, and inside every year the rows are
+# already ranked: the bottom k are the first k rows, the top k the last k, and any
+# percentile is a position in between. all of it is numpy slicing on that one scan,
+# for one year or every year at once.
+#
+# the scan goes through pydy.store.read_table, so it reads tbdata from sqlite or from
+# its parquet copy (PYDY_BACKEND=parquet) and comes back the same either way.
+
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.store import read_table, select_sql
+from pydy.trace import traced
+from pydy.dimensions import decode
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def ranking_scan(metric, year=None):
+    # read_table arguments for the ordered scan; year=None scans every year.
+    # ties keep the country order the (year, metric, country_id) index has
+    filters = [(metric, 'not null', None)]
+    if year is not None:
+        filters.insert(0, ('year', '=', int(year)))
+    return {'columns': ['year', 'country_id', metric], 'filters': filters, 'order_by': ['year', metric, 'country_id']}
+
+
+def ranking_query(metric, year=None):
+    # (sql, params) of the scan on sqlite, for the indexer
+    return select_sql('tbdata', **ranking_scan(metric, year))
+
+
+def _group_bounds(years):
+    # start/end offsets of every year in the sorted scan
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(years) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], len(years)]
+    return starts, ends
+
+
+def _slice_ranks(scan, starts, ends, k, descending):
+    # the k rows at one end of every year, with ranks 1..k
+    take = np.minimum(ends - starts, k)
+    rank = np.concatenate([np.arange(1, n + 1) for n in take]) if len(take) else np.array([], dtype=np.int64)
+    if descending:
+        positions = np.repeat(ends, take) - rank
+    else:
+        positions = np.repeat(starts, take) + rank - 1
+
+    frame = scan.iloc[positions].reset_index(drop=True)
+    frame.insert(1, 'rank', rank)
+    return frame
+
+
+@traced()
+def rank_years(db_path, metric, k=20, percentiles=PERCENTILES, year=None):
+    # {'top': ..., 'bottom': ..., 'summary': ...} for one year or, with year=None, every year
+    scan = read_table(db_path, 'tbdata', **ranking_scan(metric, year)).rename(columns={metric: 'value'})
+    scan = decode(db_path, scan, 'country')
+    years = scan['year'].to_numpy()
+    values = scan['value'].to_numpy(dtype=float)
+    starts, ends = _group_bounds(years)
+    counts = ends - starts
+
+    summary = pd.DataFrame({
+        'year': years[starts],
+        'n': counts,
+        'mean': np.add.reduceat(values, starts) / counts if len(starts) else [],
+    })
+    # linear interpolation between the closest ranks, same as np.percentile
+    for p in percentiles:
+        position = starts + (counts - 1) * p / 100
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        summary[f'p{p:g}'] = values[low] + (values[high] - values[low]) * (position - low)
+
+    return {
+        'top': _slice_ranks(scan, starts, ends, k, descending=True),
+        'bottom': _slice_ranks(scan, starts, ends, k, descending=False),
+        'summary': summary,
+    }
+
+
+def ranking(db_path, metric, year, k=20, percentiles=PERCENTILES):
+    # one year's rankings; the summary is a single row
+    result = rank_years(db_path, metric, k, percentiles, year)
+    if result['summary'].empty:
+        raise ValueError(f'No {metric} values for {year}')
+    return result
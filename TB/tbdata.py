@@ -1,114 +1,163 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import sqlite3
-import os
-import numpy as np 
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this script is run directly
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.ingest import to_number
+from pydy.sync import sync_csv
+from pydy.dimensions import clean_text
+from pydy.indexer import build_indexes
+from pydy.store import export_columnar
+from pydy.charts import chart, render_charts
+from rankings import rank_years, ranking, ranking_query
+from trends import build_trend_index, changes_query, compare_years, year_over_year, streaks
+
+plt = lazy_import('matplotlib.pyplot')
 
 # create variable for url
 base_url = 'https://raw.githubusercontent.com/rfordatascience/tidytuesday/main/data/2025/2025-11-18/who_tb_data.csv' 
 
-# create pd for TB data
-whotbdata = pd.read_csv(base_url)
+#create database (next to this file, wherever it is run from)
+db_name = Path(__file__).with_name('WHOTB.db')
 
-#create database
-db_name = 'WHOTB.db'
+# rate and count columns are parsed to numbers at load time (anything else becomes NULL),
+# so queries can filter and average them in sql without pd.to_numeric afterwards
+METRICS = [
+    'c_cdr', 'c_newinc_100k', 'cfr', 'e_inc_100k', 'e_mort_100k', 'e_mort_exc_tbhiv_100k',
+    'e_mort_exc_tbhiv_num', 'e_mort_num', 'e_mort_tbhiv_100k', 'e_mort_tbhiv_num',
+]
+SCHEMA = {'year': 'INTEGER', **{metric: 'REAL' for metric in METRICS}}
 
+def normalize_tb(chunk):
+    return chunk.assign(**{metric: to_number(chunk[metric]) for metric in METRICS})
+
+# country names are stored once in dim_country, tbdata keeps the integer country_id
+DIMENSIONS = {'country': clean_text}
+
+# stream the TB data into the tbdata table the first time; after that a new csv only
+# writes the country-years that were added, revised or dropped
 def create_tb_database(db_name):
-    if not os.path.exists(db_name):
-        print(f'Database not found, creating {db_name}. 🤓')
-        with sqlite3.connect(db_name) as con:
-            whotbdata.to_sql('tbdata', con, if_exists='replace', index=False)
-            print(f"Database {db_name} created with table 'tbdata'. 👍")
-    else:
-            print('Database already exists. 🧮')
-
- # create_tb_database(db_name)
-
-# create query for deaths per 100k in 2023
-with sqlite3.connect(db_name) as con:
-    query = '''
-    SELECT e_mort_100k
-    FROM tbdata
-    WHERE year = 2023
-    '''
-
-# create dataframe from the query
-    df = pd.read_sql_query(query, con)
+    sync_csv(db_name, 'tbdata', base_url, key=('country_id', 'year'), transform=normalize_tb, schema=SCHEMA,
+             dimensions=DIMENSIONS)
+
+# tbdata in year order for the parquet backend, so a one-year scan reads one row group
+COLUMNAR_TABLES = {'tbdata': ('year', 'country_id')}
+
+# every query this script runs, so the indexer can see them
+QUERIES = {
+    # mortality in 2023 in (year, e_mort_100k) order: mean, top 20 and bottom 20 from one scan
+    'mort_ranking_2023': ranking_query('e_mort_100k', 2023),
+    # the same scan over every year for the batch rankings
+    'mort_ranking_all_years': ranking_query('e_mort_100k'),
+    # 3-year changes in mortality (2020 -> 2023 and every other 3-year gap)
+    'halved_2020_2023': changes_query(['e_mort_100k'], periods=3),
+}
+
+_prepared = False
+
+# create the database and indexes once per run
+def prepare():
+    global _prepared
+    if _prepared:
+        return
+    create_tb_database(db_name)
+
+    # country/year index for the change queries (no-op once it exists)
+    build_trend_index(db_name)
+
+    # index the columns the queries filter, join and sort on
+    build_indexes(db_name, QUERIES)
+
+    # the parquet copy, when that backend is in use
+    export_columnar(db_name, COLUMNAR_TABLES)
+    _prepared = True
 
 # function to calculate average deaths per 100k in 2023
-def avg_deaths_per_100k_2023(df):
-    # ensure numeric and drop missing values
-    values = pd.to_numeric(df['e_mort_100k'], errors='coerce').dropna()
-    avg = values.mean()
-    return avg
-
-average_2023 = avg_deaths_per_100k_2023(df)
-print(f"Average estimated TB deaths per 100k in 2023: {average_2023:.1f}")
-
-# create query for top 20 countries for mortality rates
-with sqlite3.connect(db_name) as con:
-    query = '''
-    SELECT country, e_mort_100k
-    FROM tbdata
-    WHERE year = 2023 AND e_mort_100k IS NOT NULL
-    ORDER BY e_mort_100k DESC
-    LIMIT 20
-    '''
-# create df from the query
-    df = pd.read_sql_query(query, con)
-
-# create a bar chart of countries with highest mortality
-fig, ax = plt.subplots(figsize=(12, 6))
-bars = ax.bar(df['country'], df['e_mort_100k'], color='tomato', edgecolor='black')
-
-ax.bar_label(bars, fmt='%.1f', padding=3, rotation=45, fontsize=9)
-
-ax.set_ylabel('TB deaths per 100k')
-ax.set_xlabel('Country')
-ax.set_title('Top 20 Countries by TB Deaths per 100k (2023)')
-plt.xticks(rotation=45, ha='right')
-plt.tight_layout()
-plt.show()
-
-# create a table of 10 countries with lowest mortality 
-with sqlite3.connect(db_name) as con:
-    query = '''
-    SELECT country, e_mort_100k
-    FROM tbdata
-    WHERE year = 2023 and e_mort_100k IS NOT NULL
-    ORDER BY e_mort_100k ASC
-    LIMIT 20
-    '''
-
-# create df from the query
-    df = pd.read_sql_query(query, con)
-
-# create a bar chart of countries with lowest mortality
-fig, ax = plt.subplots(figsize=(12, 6))
-bars = ax.bar(df['country'], df['e_mort_100k'], color='deepskyblue', edgecolor='black')
-
-ax.bar_label(bars, fmt='%.2f', padding=3, rotation=45, fontsize=9)
-
-ax.set_ylabel('TB deaths per 100k')
-ax.set_xlabel('Country')
-ax.set_title('Countries with 20 lowest TB Deaths per 100k (2023)')
-plt.xticks(rotation=45, ha='right')
-plt.tight_layout()
-plt.show()
-
-# create a table of countries who reduced mortality rate by 50% from
-with sqlite3.connect(db_name) as con:
-    query = '''
-    SELECT t2023.country
-    FROM tbdata AS t2023
-    JOIN tbdata AS t2020
-      ON t2023.country = t2020.country
-    WHERE t2023.year = 2023
-      AND t2020.year = 2020
-      AND t2023.e_mort_100k <= 0.5 * t2020.e_mort_100k
-    '''
-
-# create df from the query 
-    df = pd.read_sql_query(query, con)
-
-print(df)
\ No newline at end of file
+def avg_deaths_per_100k_2023(summary):
+    # missing values are skipped by the ranking scan, like AVG in sql
+    return summary['mean'].iloc[0]
+
+# bar chart of mortality per country
+def draw_mortality(df, title, color, fmt):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    bars = ax.bar(df['country'], df['e_mort_100k'], color=color, edgecolor='black')
+
+    ax.bar_label(bars, fmt=fmt, padding=3, rotation=45, fontsize=9)
+
+    ax.set_ylabel('TB deaths per 100k')
+    ax.set_xlabel('Country')
+    ax.set_title(title)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    return fig
+
+# 2023 mortality: the mean, top 20 and bottom 20 all come from the same ranking scan
+def mortality_2023():
+    prepare()
+    mort_2023 = ranking(db_name, 'e_mort_100k', 2023, k=20)
+
+    average_2023 = avg_deaths_per_100k_2023(mort_2023['summary'])
+    print(f"Average estimated TB deaths per 100k in 2023: {average_2023:.1f}")
+
+    # top 20 countries for mortality rates
+    df = mort_2023['top'].rename(columns={'value': 'e_mort_100k'})
+
+    # create a bar chart of countries with highest mortality
+    chart('tb/top_20_2023', draw_mortality, df,
+          title='Top 20 Countries by TB Deaths per 100k (2023)', color='tomato', fmt='%.1f')
+
+    # create a table of 20 countries with lowest mortality
+    df = mort_2023['bottom'].rename(columns={'value': 'e_mort_100k'})
+
+    # create a bar chart of countries with lowest mortality
+    chart('tb/bottom_20_2023', draw_mortality, df,
+          title='Countries with 20 lowest TB Deaths per 100k (2023)', color='deepskyblue', fmt='%.2f')
+    return mort_2023
+
+# create a table of countries who reduced mortality rate by 50% from 2020 to 2023
+# the change comes from one window pass instead of a self-join on country
+def halved_2020_2023():
+    prepare()
+    changes = compare_years(db_name, 2020, 2023, ['e_mort_100k'])
+    df = changes.loc[changes['value_2023'] <= 0.5 * changes['value_2020'], ['country']].reset_index(drop=True)
+
+    print(df)
+    return df
+
+# every metric from 2000 to 2023 in one pass
+def metric_changes(start=2000, end=2023, metrics=METRICS):
+    prepare()
+    changes = compare_years(db_name, start, end, metrics)
+    summary = changes.groupby('metric')['pct_change'].describe()
+    print(summary)
+    return changes
+
+# countries with the longest runs of falling mortality
+def mortality_streaks(metric='e_mort_100k', top=10):
+    prepare()
+    runs = streaks(year_over_year(db_name, [metric]), direction='down')
+    runs = runs.sort_values(['longest', 'current'], ascending=False).head(top)
+    print(runs.to_string(index=False))
+    return runs
+
+# mean, percentiles and top/bottom 10 for every year in one scan
+def mortality_rankings(metric='e_mort_100k', k=10):
+    prepare()
+    ranks = rank_years(db_name, metric, k=k)
+    print(ranks['summary'].to_string(index=False))
+    return ranks
+
+# what main() runs; python -m pydy.run runs each one as its own task
+ANALYSES = [mortality_2023, halved_2020_2023]
+
+def main():
+    for analysis in ANALYSES:
+        analysis()
+    render_charts()
+    # metric_changes()
+    # mortality_streaks()
+    # mortality_rankings()
+
+if __name__ == '__main__':
+    main()
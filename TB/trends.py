@@ -0,0 +1,148 @@
+# year-over-year and n-year changes for the WHO TB metrics
+#
+# one window pass over tbdata (partitioned by country, ordered by year) pulls the value
+# n years earlier for every requested metric at once, so comparing any pair of years
+# or metrics does not need a self-join per question. the window frame is the row whose
+# year is exactly n years back (a RANGE frame, looked up by year rather than by row
+# position), so a country missing some year in between still gets its change, and a
+# country missing the earlier year itself gets NULL.
+#
+# results go through read_sql, so the same comparison against an unchanged database
+# comes back from the query cache; every start/end pair with the same gap reuses one query.
+# with PYDY_BACKEND=parquet the metrics are read from the parquet copy of tbdata instead
+# and the earlier row is looked up by (country, year - n) in the scanned columns.
+
+import sqlite3
+import sys
+from pathlib import Path
+
+# make the shared pydy helpers importable when this module is used from the script
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.lazy import lazy_import
+from pydy.db import read_sql
+from pydy.trace import traced
+from pydy.ingest import create_indexes
+from pydy.dimensions import decode
+from pydy.store import backend, read_table
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# the window partitions by country (its integer code) and orders by year
+TREND_INDEXES = [('country_id', 'year')]
+
+
+def build_trend_index(db_path):
+    with sqlite3.connect(db_path) as con:
+        create_indexes(con, 'tbdata', TREND_INDEXES)
+
+
+def _periods(periods):
+    periods = int(periods)
+    if periods < 1:
+        raise ValueError(f'periods must be at least 1, got {periods}')
+    return periods
+
+
+def changes_query(metrics, periods=1):
+    periods = _periods(periods)
+
+    columns = []
+    for metric in metrics:
+        columns.append(f'"{metric}"')
+        # the frame is empty when the country has no row for that year, which gives NULL
+        columns.append(f'FIRST_VALUE("{metric}") OVER w AS "{metric}_prior"')
+
+    return f'''
+    SELECT country_id, year, {', '.join(columns)}
+    FROM tbdata
+    WINDOW w AS (PARTITION BY country_id ORDER BY year RANGE BETWEEN {periods} PRECEDING AND {periods} PRECEDING)
+    ORDER BY country_id, year
+    '''
+
+
+def lagged(db_path, metrics, periods=1):
+    # what changes_query returns, from a plain scan of the columns
+    periods = _periods(periods)
+    scan = read_table(db_path, 'tbdata', columns=['country_id', 'year', *metrics], order_by=['country_id', 'year'])
+    # position of the same country's row `periods` years back, -1 where there is none
+    key = pd.MultiIndex.from_arrays([scan['country_id'], scan['year']])
+    earlier = key.get_indexer(pd.MultiIndex.from_arrays([scan['country_id'], scan['year'] - periods]))
+    valid = earlier >= 0
+
+    for metric in metrics:
+        values = scan[metric].to_numpy(dtype=float)
+        prior = np.full(len(scan), np.nan)
+        prior[valid] = values[earlier[valid]]
+        scan.insert(scan.columns.get_loc(metric) + 1, f'{metric}_prior', prior)
+    return scan
+
+
+@traced()
+def year_over_year(db_path, metrics, periods=1):
+    # tidy frame: one row per country, year and metric with the value, the value
+    # `periods` years earlier, the change and the percent change. country is a Categorical
+    if backend() == 'sqlite':
+        wide = read_sql(db_path, changes_query(metrics, periods))
+    else:
+        wide = lagged(db_path, metrics, periods)
+    wide = decode(db_path, wide, 'country')
+
+    frames = []
+    for metric in metrics:
+        value = wide[metric]
+        prior = wide[f'{metric}_prior']
+        change = value - prior
+        frames.append(pd.DataFrame({
+            'country': wide['country'],
+            'year': wide['year'],
+            'metric': metric,
+            'value': value,
+            'prior': prior,
+            'change': change,
+            # a change from zero has no percentage
+            'pct_change': (change / prior.where(prior != 0)) * 100,
+        }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare_years(db_path, start, end, metrics):
+    # every country's change from start to end for each metric
+    if end <= start:
+        raise ValueError(f'end year must be after start year, got {start} -> {end}')
+
+    changes = year_over_year(db_path, metrics, periods=end - start)
+    changes = changes[changes['year'] == end].rename(columns={'prior': f'value_{start}', 'value': f'value_{end}'})
+    return changes.drop(columns='year').reset_index(drop=True)
+
+
+@traced()
+def streaks(changes, direction='down'):
+    # runs of consecutive yearly declines (or increases) per country and metric,
+    # from a year_over_year frame with periods=1
+    if direction not in ('down', 'up'):
+        raise ValueError(f"direction must be 'down' or 'up', got {direction!r}")
+
+    changes = changes.sort_values(['metric', 'country', 'year'], ignore_index=True)
+    moving = changes['change'] < 0 if direction == 'down' else changes['change'] > 0
+    keys = [changes['metric'], changes['country']]
+
+    # every year that does not move starts a new run, so a cumulative sum inside
+    # (metric, country, run) is the length of the streak ending in that year.
+    # country is a Categorical, only the countries present are grouped
+    run = (~moving).groupby(keys, observed=True).cumsum()
+    streak = moving.astype(np.int64).groupby(keys + [run], observed=True).cumsum()
+    changes = changes.assign(streak=streak)
+
+    grouped = changes.groupby(['metric', 'country'], sort=False, observed=True)
+    longest_row = grouped['streak'].idxmax()
+    longest = grouped['streak'].max()
+    longest_end = pd.Series(changes.loc[longest_row, 'year'].to_numpy(), index=longest.index)
+    summary = pd.DataFrame({
+        'longest': longest,
+        # a longest streak of zero has no end year
+        'longest_end': longest_end.where(longest > 0).astype('Int64'),
+        'current': grouped['streak'].last(),
+    })
+    return summary.reset_index()
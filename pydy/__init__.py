@@ -0,0 +1 @@
+# shared helpers for the Pydy Tuesday dataset scripts
@@ -0,0 +1,280 @@
+# scaling benchmarks on synthetic data
+#
+#   python -m pydy.bench [dataset ...] [--scales 1 10 100] [--repeat 3] [--seed 0]
+#                        [--out benchmarks.json] [--compare baseline.json] [--tolerance 0.25]
+#                        [--backends sqlite parquet]
+#
+# for every scale the synthetic csv files (pydy.synthetic) are written to a scratch folder
+# and each dataset script runs against them, with its database in that folder too. every
+# dataset is timed in four steps:
+#   ingest     prepare(): csv -> sqlite, derived tables and indexes
+#   query      time spent in read_sql by each analysis function
+#   transform  the rest of that function: pandas work and preparing chart data
+#   render     render_charts() for the charts the function queued, drawn headless
+# each run starts from an empty database and the fastest of --repeat runs is kept (the
+# first run also pays for importing pandas, matplotlib and plotly).
+# with --backends sqlite parquet every dataset that has COLUMNAR_TABLES runs once per
+# storage backend (pydy/store.py); its ingest then includes writing the parquet copies.
+# results are written as json; with --compare an earlier result file is the baseline and
+# any step that got more than --tolerance slower fails the run (exit code 1).
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import version
+from pathlib import Path
+
+from pydy import datasets, db, store, synthetic
+from pydy.run import analysis_name
+
+STEPS = ('ingest', 'query', 'transform', 'render')
+SCALES = (1, 10, 100)
+TOLERANCE = 0.25
+# differences below this are timer noise, never a regression
+MIN_DELTA = 0.02
+
+# analyses main() leaves commented out, benchmarked as well
+EXTRA_ANALYSES = {
+    'chocolate': ['rating_percentage', 'flav_char', 'characteristic_facets', 'chart_origin_pie', 'chart_origin_bar'],
+    'simpsons': ['shared_scene_pairs'],
+    'tb': ['metric_changes', 'mortality_streaks', 'mortality_rankings'],
+}
+
+_original_db = {}
+
+
+def _db_attr(module):
+    return 'db_path' if hasattr(module, 'db_path') else 'db_name'
+
+
+def use_database(module, folder):
+    # point the module at a database in folder, same file name as the real one
+    attr = _db_attr(module)
+    original = _original_db.setdefault(module.__name__, Path(getattr(module, attr)))
+    path = Path(folder) / original.name
+    setattr(module, attr, path)
+    return path
+
+
+def analyses(name, module, path):
+    # (label, function) for everything that gets timed; partials bound to the real
+    # database (diabetes) are rebound to the benchmark one
+    original = _original_db[module.__name__]
+    functions = [*getattr(module, 'ANALYSES', []),
+                 *(getattr(module, extra) for extra in EXTRA_ANALYSES.get(name, []))]
+    bound = []
+    for function in functions:
+        if isinstance(function, functools.partial):
+            args = [path if isinstance(arg, Path) and arg == original else arg for arg in function.args]
+            function = functools.partial(function.func, *args, **function.keywords)
+        bound.append((analysis_name(function), function))
+    return bound
+
+
+def reset(module, path):
+    # empty database, no open connections and no cached results from the last run
+    db.close_all()
+    db.query_cache.clear()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    shutil.rmtree(store.columnar_dir(path), ignore_errors=True)
+    module._prepared = False
+
+
+def table_rows(path, tables):
+    uri = f'{Path(path).resolve().as_uri()}?mode=ro'
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as con:
+        return {table: con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def _timed(function):
+    # seconds taken, with the script's own printing kept out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+
+def backends_for(module, backends):
+    # only datasets with parquet copies have anything to compare
+    return [backend for backend in backends if backend == 'sqlite' or getattr(module, 'COLUMNAR_TABLES', None)]
+
+
+def bench_dataset(name, folder, scale, repeat, backend='sqlite'):
+    os.environ['PYDY_BACKEND'] = backend
+    module = datasets.load(name)
+    path = use_database(module, folder)
+    functions = analyses(name, module, path)
+    runs = []
+    for run in range(repeat):
+        reset(module, path)
+        # a fresh chart folder, so no chart is skipped as unchanged
+        os.environ['PYDY_RENDER_DIR'] = str(Path(folder) / 'charts' / f'{name}-{backend}-{run}')
+
+        runs.append(('ingest', 'prepare', _timed(module.prepare), None))
+        for label, function in functions:
+            with db.query_timer() as timer:
+                total = _timed(function)
+            runs.append(('query', label, timer['seconds'], timer['queries']))
+            runs.append(('transform', label, total - timer['seconds'], None))
+            runs.append(('render', label, _timed(module.render_charts), None))
+
+    rows = table_rows(path, synthetic.tables_for([name]))
+    results = []
+    for step, label in dict.fromkeys((step, label) for step, label, _, _ in runs):
+        timings = [(seconds, count) for s, l, seconds, count in runs if (s, l) == (step, label)]
+        result = {
+            'dataset': name,
+            'scale': scale,
+            'backend': backend,
+            'step': step,
+            'name': label,
+            'seconds': min(seconds for seconds, _ in timings),
+            'runs': [seconds for seconds, _ in timings],
+        }
+        if step == 'ingest':
+            result['rows'] = rows
+        if step == 'query':
+            result['queries'] = timings[0][1]
+        results.append(result)
+    return results
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=datasets.REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def environment():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version,
+        **{package: version(package) for package in ('numpy', 'pandas', 'matplotlib', 'pyarrow')},
+    }
+
+
+def run(names, scales=SCALES, repeat=3, seed=0, work_dir=None, backends=('sqlite',)):
+    results = []
+    with contextlib.ExitStack() as stack:
+        root = Path(work_dir) if work_dir else Path(stack.enter_context(tempfile.TemporaryDirectory(prefix='pydy-bench-')))
+        for scale in scales:
+            folder = root / f'scale-{scale:g}'
+            shutil.rmtree(folder, ignore_errors=True)
+            for table in synthetic.write_mirror(folder / 'mirror', scale, seed, names):
+                print(f"Generated {table['table']} at {scale:g}x: {table['rows']:,} rows in {table['seconds']:.2f}s. 🧪")
+            os.environ['PYDY_MIRROR'] = str(folder / 'mirror')
+
+            for name in names:
+                for backend in backends_for(datasets.load(name), backends):
+                    dataset_results = bench_dataset(name, folder, scale, repeat, backend)
+                    results.extend(dataset_results)
+                    totals = {step: sum(r['seconds'] for r in dataset_results if r['step'] == step) for step in STEPS}
+                    print(f'{name} at {scale:g}x on {backend}: '
+                          + ', '.join(f'{step} {totals[step]:.3f}s' for step in STEPS) + ' ⏱️')
+    os.environ.pop('PYDY_BACKEND', None)
+    return results
+
+
+def backend_table(results):
+    # query and transform time per analysis on every backend, side by side
+    backends = list(dict.fromkeys(r['backend'] for r in results))
+    if len(backends) < 2:
+        return
+    seconds = {}
+    for r in results:
+        if r['step'] in ('query', 'transform'):
+            key = (r['dataset'], r['scale'], r['name'])
+            seconds.setdefault(key, {}).setdefault(r['backend'], 0.0)
+            seconds[key][r['backend']] += r['seconds']
+
+    print('\n' + f"{'analysis':<40} {'scale':>6} " + ' '.join(f'{backend:>10}' for backend in backends))
+    for (name, scale, label), times in seconds.items():
+        if len(times) < len(backends):
+            continue
+        print(f'{name + ":" + label:<40} {scale:>6g} ' + ' '.join(f'{times[backend]:>9.3f}s' for backend in backends))
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # steps that are slower than the baseline by more than tolerance (and timer noise)
+    # results from before there were backends ran on sqlite
+    def key(r):
+        return r['dataset'], r['scale'], r.get('backend', 'sqlite'), r['step'], r['name']
+
+    before = {key(r): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        if result['seconds'] > old * (1 + tolerance) and result['seconds'] - old > MIN_DELTA:
+            regressions.append({**result, 'baseline': old})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every dataset on synthetic data at growing scales.')
+    parser.add_argument('datasets', nargs='*', help=f"datasets to benchmark (default: all of {', '.join(datasets.DATASETS)})")
+    parser.add_argument('--scales', type=float, nargs='+', default=list(SCALES),
+                        help='multiples of the real row counts (1 to 1000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=Path, default=datasets.REPO_ROOT / 'benchmarks.json')
+    parser.add_argument('--compare', type=Path, help='earlier result file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed slowdown against --compare, as a fraction')
+    parser.add_argument('--work-dir', type=Path, help='keep the generated csv files and databases here')
+    parser.add_argument('--backends', nargs='+', choices=store.BACKENDS, default=['sqlite'],
+                        help='storage backends to run the analyses on')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in datasets.DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+
+    # headless and one chart at a time, so render times are comparable between runs
+    os.environ['PYDY_RENDER_DIR'] = tempfile.gettempdir()
+    os.environ['PYDY_RENDER_WORKERS'] = '1'
+
+    names = args.datasets or list(datasets.DATASETS)
+    results = run(names, args.scales, args.repeat, args.seed, args.work_dir, args.backends)
+    backend_table(results)
+    report = {
+        'environment': environment(),
+        'settings': {'datasets': names, 'scales': args.scales, 'repeat': args.repeat, 'seed': args.seed,
+                     'backends': args.backends},
+        'results': results,
+    }
+    args.out.write_text(json.dumps(report, indent=2))
+    print(f'Wrote {len(results)} timings to {args.out}. 📝')
+
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        for r in regressions:
+            print(f"❌ {r['dataset']} {r['scale']:g}x {r['backend']} {r['step']} {r['name']}: "
+                  f"{r['baseline']:.3f}s -> {r['seconds']:.3f}s")
+        if regressions:
+            print(f'{len(regressions)} steps got more than {args.tolerance:.0%} slower than {args.compare}.')
+            return 1
+        print(f'No step got more than {args.tolerance:.0%} slower than {args.compare}. ✅')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
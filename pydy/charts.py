@@ -0,0 +1,205 @@
+# chart output for the analyses: interactive windows or files for scheduled runs
+#
+# every script hands its charts to chart(name, draw, data): draw(data) builds the figure
+# (matplotlib, or a plotly figure it returns) and data is everything draw needs.
+#
+# normally the chart is drawn and shown right away, same as plt.show() / fig.show().
+# with PYDY_RENDER_DIR set, matplotlib switches to the Agg backend and charts are queued
+# instead; render_charts() then draws the whole queue in a process pool and writes
+# <dir>/<name>.png (or svg with PYDY_RENDER_FORMAT=svg). each chart records a fingerprint
+# of its data, draw function and options next to the file, and a chart whose fingerprint
+# has not changed is skipped. plotly figures need kaleido for png/svg and fall back to html.
+
+import atexit
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pydy import trace
+from pydy.lazy import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+pd = lazy_import('pandas')
+
+FORMATS = ('png', 'svg')
+
+
+def render_dir():
+    path = os.environ.get('PYDY_RENDER_DIR')
+    return Path(path) if path else None
+
+
+def render_format():
+    fmt = os.environ.get('PYDY_RENDER_FORMAT', 'png').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f'PYDY_RENDER_FORMAT must be one of {FORMATS}, got {fmt!r}')
+    return fmt
+
+
+def render_workers():
+    return int(os.environ.get('PYDY_RENDER_WORKERS', os.cpu_count() or 1))
+
+
+# no windows in render mode, whatever backend the environment picked. pyplot reads
+# MPLBACKEND when it is first imported; if it already is, switch it directly
+if render_dir() is not None:
+    os.environ['MPLBACKEND'] = 'Agg'
+    if 'matplotlib.pyplot' in sys.modules:
+        plt.switch_backend('Agg')
+
+_queue = []
+
+
+def _data_digest(data, digest):
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        labels = data.columns if isinstance(data, pd.DataFrame) else data.name
+        digest.update(repr(labels).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            _data_digest(item, digest)
+    else:
+        digest.update(pickle.dumps(data))
+
+
+def fingerprint(draw, data, options, fmt):
+    # changes whenever the data, the drawing code or its options change
+    digest = hashlib.sha256()
+    digest.update(f'{fmt}|{draw.__module__}.{draw.__qualname__}|{sorted(options.items())!r}'.encode())
+    try:
+        digest.update(inspect.getsource(draw).encode())
+    except (OSError, TypeError):
+        pass
+    _data_digest(data, digest)
+    return digest.hexdigest()
+
+
+def _is_plotly(fig):
+    return hasattr(fig, 'write_image')
+
+
+def _stamp_path(path):
+    return path.with_name(path.name + '.json')
+
+
+def _unchanged(path, stamp):
+    try:
+        recorded = json.loads(_stamp_path(path).read_text())
+    except (OSError, ValueError):
+        return False
+    return recorded.get('fingerprint') == stamp and Path(recorded.get('output', '')).exists()
+
+
+def _render(job):
+    # runs in a pool worker: draw one chart and write it to disk
+    start = time.perf_counter()
+    path = Path(job['path'])
+    with trace.span(job['name'], 'render'):
+        fig = job['draw'](job['data'], **job['options'])
+
+        if _is_plotly(fig):
+            try:
+                fig.write_image(path, format=job['format'])
+            except Exception:
+                # static export needs kaleido; an html file still opens anywhere
+                path = path.with_suffix('.html')
+                fig.write_html(path)
+        else:
+            fig = fig if fig is not None else plt.gcf()
+            fig.savefig(path, format=job['format'])
+            plt.close(fig)
+
+    return {
+        'name': job['name'],
+        'output': str(path),
+        'start': start,
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+
+def chart(name, draw, data, **options):
+    out_dir = render_dir()
+    if out_dir is None:
+        # interactive run: draw and show right away
+        with trace.span(name, 'render'):
+            fig = draw(data, **options)
+        if _is_plotly(fig):
+            fig.show()
+        else:
+            plt.show()
+        return
+
+    fmt = render_format()
+    path = out_dir / f'{name}.{fmt}'
+    stamp = fingerprint(draw, data, options, fmt)
+    if _unchanged(path, stamp):
+        print(f'{name} unchanged, skipped. 💤')
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _queue.append({
+        'name': name,
+        'draw': draw,
+        'data': data,
+        'options': options,
+        'format': fmt,
+        'path': str(path),
+        'fingerprint': stamp,
+    })
+
+
+def _pool_context():
+    # queued draw functions usually live in the running script, which forked workers
+    # already have; spawned workers would re-run the whole script, so those render inline
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def render_charts(workers=None):
+    # draw every queued chart, independent charts in parallel; returns per-chart timings
+    jobs = list(_queue)
+    _queue.clear()
+    if not jobs:
+        return []
+
+    start = time.perf_counter()
+    workers = min(workers or render_workers(), len(jobs))
+    context = _pool_context()
+    if workers > 1 and context is not None:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(_render, jobs))
+        # spans recorded in the workers stay there, so add them from the timings
+        for result in results:
+            trace.record(result['name'], 'render', result['start'], result['seconds'], pid=result['pid'])
+    else:
+        results = [_render(job) for job in jobs]
+
+    for job, result in zip(jobs, results):
+        _stamp_path(Path(job['path'])).write_text(json.dumps({
+            'fingerprint': job['fingerprint'],
+            'output': result['output'],
+            'seconds': result['seconds'],
+        }))
+        print(f"Rendered {result['name']} -> {result['output']} in {result['seconds']:.2f}s. 🖼️")
+
+    print(f'Rendered {len(results)} charts in {time.perf_counter() - start:.2f}s. 🎨')
+    return results
+
+
+def _render_leftovers():
+    # charts queued after the script's last render_charts() call; the pool cannot be
+    # started during interpreter shutdown, so these are drawn one by one
+    if _queue:
+        render_charts(workers=1)
+
+
+atexit.register(_render_leftovers)
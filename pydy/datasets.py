@@ -0,0 +1,53 @@
+# registry of the dataset modules
+#
+# the dataset folders have spaces in their names ("Age Gaps", "Rolling Stones"), so they
+# cannot be imported as packages. load('tb') imports TB/tbdata.py from its file path
+# instead (with its folder on sys.path for sibling modules like trends.py), and gives
+# back the same module object on every call. importing a dataset module has no side
+# effects: nothing is downloaded, queried or drawn until one of its functions is called.
+
+import importlib.util
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+DATASETS = {
+    'age_gaps': 'Age Gaps/age_gaps.py',
+    'chocolate': 'Chocolate/chocolate.py',
+    'diabetes': 'Diabetes/diabetes.py',
+    'euroleague': 'EuroLeague/euroleague.py',
+    'rolling_stones': 'Rolling Stones/album_ranks.py',
+    'roundabouts': 'Roundabouts/roundabouts.py',
+    'simpsons': 'Simpsons/simpsons.py',
+    'tb': 'TB/tbdata.py',
+}
+
+
+def path(name):
+    try:
+        return REPO_ROOT / DATASETS[name]
+    except KeyError:
+        raise KeyError(f"Unknown dataset {name!r}, expected one of {', '.join(DATASETS)}") from None
+
+
+def load(name):
+    file = path(name)
+    module_name = file.stem
+    module = sys.modules.get(module_name)
+    if module is not None and Path(getattr(module, '__file__', '')).resolve() == file:
+        return module
+
+    folder = str(file.parent)
+    if folder not in sys.path:
+        sys.path.append(folder)
+
+    spec = importlib.util.spec_from_file_location(module_name, file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
@@ -0,0 +1,283 @@
+# shared sqlite connections for the analyses
+#
+# instead of a new sqlite3.connect per query, every database file gets one pool and
+# every thread gets its own connection from it (sqlite connections should not be used
+# from two threads at once). connections stay open for the whole run, so the page
+# cache, the mmap and sqlite3's prepared-statement cache are reused between queries.
+# analyses read through read-only uri connections.
+#
+# read_sql also memoizes results: the same sql + params against an unchanged database
+# comes back from an in-process lru cache. an entry is only served to the connection
+# that produced it, and is stale once the mtime/size of the file or its -wal change,
+# PRAGMA data_version moves on that connection, or a load or sync in this process
+# (mark_changed) committed to the database. the cache is bounded by
+# PYDY_QUERY_CACHE_MB (default 256).
+#
+# inside a query_timer() block every read_sql call (and every pydy.store parquet read)
+# adds its time to the timer, which is how the benchmarks tell time spent reading from
+# time spent in pandas afterwards.
+
+import atexit
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from pydy import trace
+from pydy.indexer import query_plan
+from pydy.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+CACHE_SIZE_KB = 64_000            # PRAGMA cache_size, negative value means KiB
+MMAP_SIZE = 256 * 1024 * 1024     # PRAGMA mmap_size in bytes
+CACHED_STATEMENTS = 256           # prepared statements kept per connection
+
+
+class ConnectionPool:
+    def __init__(self, db_path, read_only=True):
+        self.db_path = Path(db_path).resolve()
+        self.read_only = read_only
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        uri = self.db_path.as_uri()
+        if self.read_only:
+            uri += '?mode=ro'
+        con = sqlite3.connect(
+            uri, uri=True, check_same_thread=False, cached_statements=CACHED_STATEMENTS
+        )
+        con.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        con.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        # id(con) comes back for later connections, a serial number never does
+        _serials[id(con)] = next(_serial_numbers)
+        return con
+
+    def connection(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = self._connect()
+            self._local.con = con
+            with self._lock:
+                self._connections.append(con)
+        return con
+
+    def close(self):
+        with self._lock:
+            for con in self._connections:
+                _serials.pop(id(con), None)
+                con.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_serials = {}
+_serial_numbers = itertools.count(1)
+
+# commits made to each database from this process, see mark_changed()
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def mark_changed(db_path):
+    # called by the writers (ingest.load_csv, sync.sync_csv) once they commit, so no
+    # cached result from before survives, even while the write still sits in the -wal
+    key = Path(db_path).resolve()
+    with _generations_lock:
+        _generations[key] = _generations.get(key, 0) + 1
+
+
+def get_pool(db_path, read_only=True):
+    key = (Path(db_path).resolve(), read_only)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path, read_only)
+        return pool
+
+
+def connect(db_path, read_only=True):
+    # this thread's pooled connection for db_path
+    return get_pool(db_path, read_only).connection()
+
+
+class QueryCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and is_current(entry['version'], version):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['frame']
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, version, frame):
+        size = int(frame.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {'version': version, 'frame': frame, 'bytes': size}
+            self.bytes += size
+            # least recently used entries go first
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)['bytes']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def database_version(db_path, con):
+    # what a result read from db_path on con depends on; keep it with anything cached
+    # and check it with is_current() before reuse.
+    # file stats (the -wal too) catch writes from anywhere, the generation commits from
+    # this process, and data_version commits sqlite saw from other connections even
+    # inside the same mtime tick
+    path = Path(db_path).resolve()
+    return {
+        'stat': (_file_stat(path), _file_stat(f'{path}-wal')),
+        'generation': _generations.get(path, 0),
+        'con': _serials.get(id(con), id(con)),
+        'data_version': con.execute('PRAGMA data_version').fetchone()[0],
+    }
+
+
+def is_current(cached, current):
+    # data_version is only comparable on the connection that produced it, so an entry
+    # from another connection counts as stale
+    return (cached['stat'] == current['stat'] and cached['generation'] == current['generation']
+            and cached['con'] == current['con'] and cached['data_version'] == current['data_version'])
+
+
+def _freeze(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+
+query_cache = QueryCache(int(os.environ.get('PYDY_QUERY_CACHE_MB', 256)) * 1024 * 1024)
+
+
+_timers = []
+
+
+@contextmanager
+def query_timer():
+    # seconds and number of read_sql calls made inside the block
+    timer = {'seconds': 0.0, 'queries': 0}
+    _timers.append(timer)
+    try:
+        yield timer
+    finally:
+        _timers.remove(timer)
+
+
+@contextmanager
+def timed_query():
+    # counts the block as one query on every open query_timer
+    if not _timers:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        for timer in _timers:
+            timer['seconds'] += time.perf_counter() - start
+            timer['queries'] += 1
+
+
+def read_sql(db_path, sql, params=None, cache=True, **kwargs):
+    with timed_query():
+        return _read_sql(db_path, sql, params, cache, **kwargs)
+
+
+def _read_sql(db_path, sql, params, cache, **kwargs):
+    # pd.read_sql_query on the pooled read-only connection, memoized on sql + params
+    pool = get_pool(db_path)
+    con = pool.connection()
+    if trace.enabled() and not trace.has_plan(sql):
+        try:
+            trace.query_plan(sql, query_plan(con, sql, params or ()))
+        except sqlite3.Error:
+            pass
+
+    with trace.span('read_sql', 'sql', db=pool.db_path.name, sql=' '.join(sql.split())[:200]) as current:
+        if not cache:
+            frame = pd.read_sql_query(sql, con, params=params, **kwargs)
+            current['rows'] = len(frame)
+            return frame
+
+        key = (str(pool.db_path), sql, _freeze(params), repr(sorted(kwargs.items())))
+        version = database_version(pool.db_path, con)
+        frame = query_cache.get(key, version)
+        current['cached'] = frame is not None
+        if frame is None:
+            frame = pd.read_sql_query(sql, con, params=params, **kwargs)
+            query_cache.put(key, version, frame)
+        current['rows'] = len(frame)
+
+        # callers are free to modify what they get back
+        return frame.copy()
+
+
+def cache_info():
+    return query_cache.info()
+
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_all)
@@ -0,0 +1,71 @@
+# dictionary-encoded dimension tables for repeated text columns
+#
+# a column like country repeats a few hundred strings on every row. loading with
+# dimensions={'country': clean_text} stores each cleaned value once, in
+# dim_country (id INTEGER PRIMARY KEY, value TEXT UNIQUE), and the table gets an
+# integer country_id column in place of the text: a smaller database, and GROUP BY /
+# joins on an integer an index can serve. values get their code the first time they
+# are seen and keep it for the life of the database (nothing is ever renumbered), so
+# a synced table and a fresh load agree on every code.
+#
+# queries join dim_<column> when they want the text; pandas code can select the codes
+# and decode() them into a Categorical instead.
+
+import json
+
+from pydy.db import read_sql
+from pydy.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+def dimension_table(column):
+    return f'dim_{column}'
+
+
+def code_column(column):
+    return f'{column}_id'
+
+
+def clean_text(series):
+    # trimmed, inner whitespace collapsed, blanks missing
+    text = series.astype('string').str.strip().str.replace(r'\s+', ' ', regex=True)
+    return text.mask(text == '')
+
+
+def upper_text(series):
+    # clean_text in capitals ('ca ', 'Ca' and 'CA' are one value)
+    return clean_text(series).str.upper()
+
+
+def encode(con, chunk, dimensions):
+    # replace every dimension column of chunk by its codes (same position in the
+    # layout); values not seen before are added to the dimension table on con
+    for column, canonical in dimensions.items():
+        table = dimension_table(column)
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)')
+
+        values = canonical(chunk[column]) if canonical is not None else chunk[column].astype('string')
+        distinct = json.dumps(values.dropna().unique().tolist())
+        # new values are numbered in the order they first appear
+        con.execute(f'INSERT OR IGNORE INTO "{table}" (value) SELECT value FROM json_each(?) ORDER BY key', [distinct])
+        codes = dict(con.execute(f'SELECT value, id FROM "{table}" WHERE value IN (SELECT value FROM json_each(?))',
+                                 [distinct]))
+
+        position = chunk.columns.get_loc(column)
+        chunk = chunk.drop(columns=column)
+        chunk.insert(position, code_column(column), values.map(codes).astype('Int64'))
+    return chunk
+
+
+def decode(db_path, frame, column):
+    # frame's <column>_id codes as a Categorical <column>, categories in alphabetical order
+    dimension = read_sql(db_path, f'SELECT id, value FROM "{dimension_table(column)}" ORDER BY value')
+    position = pd.Series(np.arange(len(dimension)), index=dimension['id'])
+    codes = frame[code_column(column)].map(position).fillna(-1).astype(np.int64)
+
+    at = frame.columns.get_loc(code_column(column))
+    frame = frame.drop(columns=code_column(column))
+    frame.insert(at, column, pd.Categorical.from_codes(codes, categories=dimension['value']))
+    return frame
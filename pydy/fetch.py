@@ -0,0 +1,188 @@
+# shared download cache for the tidytuesday csv files
+#
+# every file is stored once under its sha256 (content addressed) and an index maps
+# each url to the hash plus the etag / last-modified headers github sent back, so a
+# second run only does a cheap conditional request (or nothing at all when offline).
+#
+# environment switches:
+#   PYDY_CACHE_DIR  where the cache lives (default: .pydy_cache in the repo root)
+#   PYDY_MIRROR     local directory holding copies of the csv files, used instead of the network,
+#                   or the http(s) url of a stand-in server with the files by name (downloaded
+#                   and cached like github's)
+#   PYDY_OFFLINE=1  never touch the network, only the mirror or the cache
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlparse
+
+from pydy import trace
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# several files can be fetched at once (pydy/prefetch.py); the index is shared
+_index_lock = threading.Lock()
+
+
+def cache_dir():
+    return Path(os.environ.get('PYDY_CACHE_DIR', REPO_ROOT / '.pydy_cache'))
+
+
+def is_offline():
+    return os.environ.get('PYDY_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def _index_path():
+    return cache_dir() / 'index.json'
+
+
+def _load_index():
+    path = _index_path()
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_index(index):
+    path = _index_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temp file of our own first, so a crash never leaves half an index
+    # behind and two processes sharing the cache (pydy.run workers, pydy.bench) never
+    # write into the same file. the last replace wins; an entry lost that way only
+    # means the next fetch downloads the file again
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=path.parent, prefix='index.',
+                                     suffix='.tmp', delete=False) as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(f.name, path)
+
+
+def _object_path(sha256):
+    return cache_dir() / 'objects' / sha256[:2] / sha256
+
+
+def _is_url(mirror):
+    return mirror.startswith(('http://', 'https://'))
+
+
+def _mirror_url(url):
+    # the same file on an http stand-in for github
+    mirror = os.environ.get('PYDY_MIRROR')
+    if not mirror or not _is_url(mirror):
+        return url
+    return f"{mirror.rstrip('/')}/{Path(urlparse(url).path).name}"
+
+
+def _mirror_path(url):
+    mirror = os.environ.get('PYDY_MIRROR')
+    if not mirror or _is_url(mirror):
+        return None
+
+    # accept either the full url path (data/2023/...) or just the file name
+    url_path = urlparse(url).path.lstrip('/')
+    for candidate in (Path(mirror) / url_path, Path(mirror) / Path(url_path).name):
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def _store(response):
+    # stream the body to disk while hashing it, then move it into the object store
+    objects = cache_dir() / 'objects'
+    objects.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=objects, delete=False) as tmp:
+        for block in iter(lambda: response.read(1 << 20), b''):
+            digest.update(block)
+            tmp.write(block)
+    sha256 = digest.hexdigest()
+    target = _object_path(sha256)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp.name, target)
+    return sha256
+
+
+def fetch_csv(url, timeout=60):
+    # returns a local path for the url, downloading only when the cached copy is stale
+    with trace.span('fetch_csv', 'io', url=url):
+        return _fetch_csv(url, timeout)
+
+
+def _fetch_csv(url, timeout):
+    mirrored = _mirror_path(url)
+    if mirrored is not None:
+        return mirrored
+    url = _mirror_url(url)
+
+    with _index_lock:
+        entry = _load_index().get(url)
+    cached = _object_path(entry['sha256']) if entry else None
+    if cached is not None and not cached.exists():
+        entry, cached = None, None
+
+    if is_offline():
+        if cached is None:
+            raise FileNotFoundError(f'{url} is not cached and PYDY_OFFLINE is set')
+        return cached
+
+    # conditional request: github answers 304 when nothing changed
+    request = urllib.request.Request(url)
+    if entry and entry.get('etag'):
+        request.add_header('If-None-Match', entry['etag'])
+    if entry and entry.get('last_modified'):
+        request.add_header('If-Modified-Since', entry['last_modified'])
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            sha256 = _store(response)
+            headers = response.headers
+    except urllib.error.HTTPError as err:
+        if err.code == 304 and cached is not None:
+            return cached
+        raise
+    except urllib.error.URLError as err:
+        if cached is not None:
+            print(f'Could not reach {url} ({err.reason}), using the cached copy. 📦')
+            return cached
+        raise
+
+    # read again under the lock, other threads may have added their files meanwhile
+    with _index_lock:
+        index = _load_index()
+        index[url] = {
+            'sha256': sha256,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        _save_index(index)
+    return _object_path(sha256)
+
+
+def table_is_current(db_path, table, schema=None):
+    # a table that already exists with rows (and the declared column types, when a
+    # schema is given) means there is nothing to download
+    if not Path(db_path).exists():
+        return False
+
+    uri = f'{Path(db_path).resolve().as_uri()}?mode=ro'
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as con:
+        declared = {row[1]: row[2].upper() for row in con.execute(f'PRAGMA table_info("{table}")')}
+        if not declared:
+            return False
+        if any(declared.get(column) != kind.upper() for column, kind in (schema or {}).items()):
+            return False
+        return con.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone() is not None
+
+
+def clear_cache():
+    shutil.rmtree(cache_dir(), ignore_errors=True)
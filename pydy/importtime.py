@@ -0,0 +1,75 @@
+# import-time budget for the dataset modules
+#
+#   python -m pydy.importtime [--budget-ms 250] [dataset ...]
+#
+# every dataset module is imported in a fresh interpreter, which reports how long the
+# import took and which heavy libraries it pulled in. a module fails the check when it
+# is over budget or imports pandas / numpy / matplotlib / scipy / plotly eagerly.
+# the exit code is non-zero when any module fails, so this can gate a scheduled job;
+# tests/test_importtime.py runs the same check for every dataset under pytest.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from pydy.datasets import DATASETS, REPO_ROOT
+
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'scipy', 'plotly')
+BUDGET_MS = float(os.environ.get('PYDY_IMPORT_BUDGET_MS', 250))
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import pydy.datasets
+pydy.datasets.load({name!r})
+ms = (time.perf_counter() - start) * 1000
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{'ms': ms, 'heavy': heavy}}))
+'''
+
+
+def measure(name):
+    probe = _PROBE.format(name=name, heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, '-c', probe], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def check(names=None, budget_ms=BUDGET_MS):
+    results = []
+    for name in names or DATASETS:
+        result = measure(name)
+        result['name'] = name
+        result['ok'] = result['ms'] <= budget_ms and not result['heavy']
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import time of the dataset modules.')
+    parser.add_argument('datasets', nargs='*', help=f"datasets to check (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+
+    results = check(args.datasets, args.budget_ms)
+    for result in results:
+        mark = '✅' if result['ok'] else '❌'
+        heavy = f" (imported {', '.join(result['heavy'])})" if result['heavy'] else ''
+        print(f"{mark} {result['name']}: {result['ms']:.1f} ms{heavy}")
+
+    failed = [r['name'] for r in results if not r['ok']]
+    if failed:
+        print(f"Over the {args.budget_ms:g} ms import budget or eager heavy imports: {', '.join(failed)}")
+        return 1
+    print(f'All {len(results)} dataset modules import within {args.budget_ms:g} ms. ⏱️')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# automatic index builder driven by the sql each analysis actually runs
+#
+# every dataset script keeps its sql in a QUERIES dict. build_indexes runs
+# EXPLAIN QUERY PLAN on each one, and for every table the plan has to scan it builds
+# a composite index out of the columns the query filters, joins, groups and sorts on
+# (plus the selected columns so the index covers the query when it is small enough).
+# an index is only kept when it actually changes the plan.
+
+import contextlib
+import re
+import sqlite3
+import time
+
+from pydy import trace
+
+MAX_INDEX_COLUMNS = 4
+
+CLAUSE = re.compile(r'\b(SELECT|FROM|JOIN|ON|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b', re.I)
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|GROUP\b|ORDER\b|LIMIT\b)(\w+))?', re.I)
+COLUMN_REF = re.compile(r'(?:\b(\w+)\.)?"?\b(\w+)\b"?')
+EQUALITY = re.compile(r'\s*(=|IN\b)', re.I)
+
+
+def _split_query(query):
+    # QUERIES values are either plain sql or (sql, params)
+    if isinstance(query, str):
+        return query, ()
+    return query[0], tuple(query[1])
+
+
+def query_plan(con, sql, params=()):
+    return [row[3] for row in con.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def time_query(con, sql, params=(), repeat=3):
+    # best of a few runs, in milliseconds
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _table_refs(sql):
+    # alias -> table for everything in FROM / JOIN
+    return {(alias or table): table for table, alias in TABLE_REF.findall(sql)}
+
+
+def _clauses(sql):
+    parts = CLAUSE.split(sql)
+    # parts = [before, keyword, text, keyword, text, ...]
+    return [(re.sub(r'\s+', ' ', parts[i]).upper(), parts[i + 1]) for i in range(1, len(parts), 2)]
+
+
+def candidate_columns(sql, alias, columns, single_table):
+    # order the columns the way a composite index wants them:
+    # equality filters, join columns, then group by (or a single range column), then
+    # order by, then everything else the query reads so the index can cover it
+    equality, joins, ranges, grouping, ordering, other = [], [], [], [], [], []
+
+    for clause, text in _clauses(sql):
+        for match in COLUMN_REF.finditer(text):
+            qualifier, name = match.groups()
+            if name not in columns:
+                continue
+            if qualifier is None and not single_table:
+                continue
+            if qualifier is not None and qualifier != alias:
+                continue
+
+            if clause == 'ON':
+                joins.append(name)
+            elif clause == 'WHERE':
+                before = text[:match.start()].rstrip()
+                after_equals = before.endswith('=') and not before.endswith(('<=', '>=', '!='))
+                if EQUALITY.match(text, match.end()) or after_equals:
+                    equality.append(name)
+                else:
+                    ranges.append(name)
+            elif clause == 'GROUP BY':
+                grouping.append(name)
+            elif clause == 'ORDER BY':
+                ordering.append(name)
+            else:
+                other.append(name)
+
+    # a plain projection has nothing an index could narrow down
+    if not (equality or joins or ranges or grouping or ordering):
+        return []
+
+    # a range column the query also sorts on is served by the order by part of the key,
+    # which lets the index hand rows back already sorted
+    leading_range = [] if ranges[:1] and ranges[0] in ordering else ranges[:1]
+    key = equality + joins + (grouping if grouping else leading_range) + ordering
+    ordered = []
+    for name in key + ranges + grouping + other:
+        if name not in ordered:
+            ordered.append(name)
+    return ordered[:MAX_INDEX_COLUMNS]
+
+
+def _scanned(plan, alias):
+    # a plain "SCAN alias" means every row of the table is read, and an automatic
+    # index is a throwaway index sqlite rebuilds from a full scan on every run
+    alias = re.escape(alias)
+    return any(
+        re.fullmatch(rf'SCAN {alias}', step) or re.match(rf'SEARCH {alias} USING AUTOMATIC', step)
+        for step in plan
+    )
+
+
+def build_indexes(db_path, queries, verbose=True):
+    report = []
+    with contextlib.closing(sqlite3.connect(db_path)) as con, con:
+        for name, query in queries.items():
+            with trace.span('build_indexes', 'index', query=name) as current:
+                created = _index_query(con, name, query, report)
+                current['created'] = created
+
+    if verbose:
+        print_report(report)
+    return report
+
+
+def _index_query(con, name, query, report):
+    # creates the indexes one query needs and adds them to report; returns their names
+    sql, params = _split_query(query)
+    refs = _table_refs(sql)
+    plan_before = query_plan(con, sql, params)
+    scanned = [alias for alias in refs if _scanned(plan_before, alias)]
+    if not scanned:
+        return []
+
+    ms_before = time_query(con, sql, params)
+    created = []
+    for alias in scanned:
+        table = refs[alias]
+        columns = {row[1] for row in con.execute(f'PRAGMA table_info("{table}")')}
+        wanted = candidate_columns(sql, alias, columns, len(refs) == 1)
+        if not wanted:
+            continue
+
+        index = f'ix_{table}_' + '_'.join(wanted)
+        if index in created:
+            # a self join can want the same index for both sides
+            continue
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", [index]).fetchone():
+            # built for another query or an earlier run, and the plan still scans with it;
+            # it is not this query's to drop
+            continue
+        column_sql = ', '.join(f'"{c}"' for c in wanted)
+        con.execute(f'CREATE INDEX "{index}" ON "{table}" ({column_sql})')
+        con.execute(f'ANALYZE "{table}"')
+
+        # keep the index only if the planner now uses it
+        if _scanned(query_plan(con, sql, params), alias):
+            con.execute(f'DROP INDEX "{index}"')
+        else:
+            created.append(index)
+
+    if not created:
+        return []
+
+    plan_after = query_plan(con, sql, params)
+    ms_after = time_query(con, sql, params)
+    report.append({
+        'query': name,
+        'indexes': created,
+        'plan_before': plan_before,
+        'plan_after': plan_after,
+        'ms_before': ms_before,
+        'ms_after': ms_after,
+    })
+    return created
+
+
+def print_report(report):
+    for row in report:
+        print(f"\n🔎 {row['query']}: {row['ms_before']:.2f} ms -> {row['ms_after']:.2f} ms")
+        print('   before: ' + ' | '.join(row['plan_before']))
+        print('   after:  ' + ' | '.join(row['plan_after']))
+        for index in row['indexes']:
+            print(f'   created {index}')
@@ -0,0 +1,155 @@
+# streaming csv -> sqlite loader used by every dataset's create-database step
+#
+# the csv is read in chunks and each chunk goes straight into sqlite with executemany,
+# so peak memory depends on chunksize and not on the size of the file. the whole load
+# runs in one transaction with bulk-load pragmas, and indexes are built afterwards.
+#
+# a dataset can pass a transform (run on every chunk) and a schema (column -> declared
+# sqlite type) so messy text like '76%' or '12,523, 5,556' is parsed once at load time
+# and stored as a real numeric column, instead of being re-parsed by every query.
+# dimensions (column -> cleaning function) moves repeated text columns into integer
+# coded dimension tables as they are loaded (see pydy/dimensions.py).
+
+import sqlite3
+import time
+
+from pydy import trace
+from pydy.db import mark_changed
+from pydy.dimensions import encode
+from pydy.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+CHUNKSIZE = 50_000
+
+# pragmas that make a one-off bulk load fast; durability does not matter because a
+# failed load is simply run again from the cached csv
+BULK_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA cache_size = -200000',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+def _end_bulk_load(con):
+    # back to sqlite's durable defaults and a single-file database, so the .db can be
+    # copied or committed as is. the journal mode cannot change while another
+    # connection has the file open (the pooled readers in pydy/db.py), so the mode
+    # sqlite reports back is checked instead of assumed
+    con.execute('PRAGMA synchronous = FULL')
+    try:
+        mode = con.execute('PRAGMA journal_mode = DELETE').fetchone()[0]
+    except sqlite3.OperationalError:
+        # another connection is inside a read
+        mode = con.execute('PRAGMA journal_mode').fetchone()[0]
+    if mode.lower() != 'delete':
+        print(f'⚠️ {con.execute("PRAGMA database_list").fetchone()[2]} is still in {mode} mode, '
+              f'another connection has it open; it goes back to one file on the next load.')
+    return mode
+
+
+def to_number(series):
+    # anything that is not a number becomes NULL
+    return pd.to_numeric(series, errors='coerce')
+
+
+def percent_to_number(series):
+    # '76%' -> 76.0
+    return to_number(series.astype('string').str.strip().str.rstrip('%'))
+
+
+def first_number(series):
+    # '12,523, 5,556' -> 12523.0 (first number, thousands separators removed)
+    first = series.astype('string').str.extract(r'(\d[\d,]*)', expand=False)
+    return to_number(first.str.replace(',', '', regex=False))
+
+
+def sqlite_type(dtype):
+    # same affinities DataFrame.to_sql would have picked
+    if dtype.kind in 'iub':
+        return 'INTEGER'
+    if dtype.kind == 'f':
+        return 'REAL'
+    return 'TEXT'
+
+
+def _rows(chunk):
+    # plain python objects with None for missing values, which is what sqlite3 can bind
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+
+def create_indexes(con, table, indexes):
+    for columns in indexes:
+        if isinstance(columns, str):
+            columns = (columns,)
+        name = f'ix_{table}_' + '_'.join(columns)
+        column_sql = ', '.join(f'"{c}"' for c in columns)
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_sql})')
+
+
+def read_chunks(source, chunksize=CHUNKSIZE, **read_csv_kwargs):
+    # chunks of a csv file, or of a frame that was already parsed (pydy/prefetch.py)
+    if isinstance(source, pd.DataFrame):
+        return (source.iloc[start:start + chunksize] for start in range(0, max(len(source), 1), chunksize))
+    return pd.read_csv(source, chunksize=chunksize, **read_csv_kwargs)
+
+
+def load_csv(db_path, table, source, chunksize=CHUNKSIZE, indexes=(), transform=None, schema=None,
+             dimensions=None, **read_csv_kwargs):
+    # source is anything pd.read_csv accepts (usually the path returned by fetch_csv),
+    # or a DataFrame parsed ahead of time.
+    # transform(chunk) -> chunk normalizes each chunk, schema pins declared column types
+    schema = schema or {}
+    start = time.perf_counter()
+    rows = 0
+
+    con = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for pragma in BULK_PRAGMAS:
+            con.execute(pragma)
+
+        con.execute('BEGIN')
+        con.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+        insert = None
+        reader = read_chunks(source, chunksize, **read_csv_kwargs)
+        for chunk in trace.spans(reader, 'read_csv', 'ingest', table=table):
+            if transform is not None:
+                with trace.span('transform', 'ingest', table=table, rows=len(chunk)):
+                    chunk = transform(chunk)
+            if dimensions:
+                with trace.span('encode', 'ingest', table=table, rows=len(chunk)):
+                    chunk = encode(con, chunk, dimensions)
+
+            if insert is None:
+                # the schema wins, otherwise the first chunk decides the table layout
+                column_sql = ', '.join(
+                    f'"{name}" {schema.get(name) or sqlite_type(dtype)}'
+                    for name, dtype in chunk.dtypes.items()
+                )
+                con.execute(f'CREATE TABLE "{table}" ({column_sql})')
+                placeholders = ', '.join('?' * len(chunk.columns))
+                insert = f'INSERT INTO "{table}" VALUES ({placeholders})'
+
+            with trace.span('insert', 'ingest', table=table, rows=len(chunk)):
+                con.executemany(insert, _rows(chunk))
+            rows += len(chunk)
+
+        with trace.span('create_indexes', 'ingest', table=table):
+            create_indexes(con, table, indexes)
+            con.execute('COMMIT')
+        mark_changed(db_path)
+        _end_bulk_load(con)
+    except BaseException:
+        if con.in_transaction:
+            con.execute('ROLLBACK')
+        raise
+    finally:
+        con.close()
+
+    seconds = time.perf_counter() - start
+    rate = rows / seconds if seconds else float('inf')
+    print(f'Loaded {rows:,} rows into {table} in {seconds:.2f}s ({rate:,.0f} rows/sec). ⚡')
+    return {'table': table, 'rows': rows, 'seconds': seconds, 'rows_per_sec': rate}
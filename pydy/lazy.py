@@ -0,0 +1,39 @@
+# deferred imports for the heavy libraries
+#
+# pandas, numpy, matplotlib, scipy and plotly make up most of a script's startup time.
+# lazy_import('pandas') returns a stand-in module that imports the real one the first
+# time one of its attributes is used, so importing an analysis module to call a single
+# function does not pay for libraries that function never touches.
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f'<lazy module {self.__name__!r} ({state})>'
+
+
+def lazy_import(name):
+    # the real module when something already imported it, a stand-in otherwise
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
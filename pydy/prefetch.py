@@ -0,0 +1,89 @@
+# fetch and parse all the csv files of a dataset at the same time
+#
+# a dataset with several tables (simpsons has four) used to download and parse its files
+# one after another. fetch_all() downloads every url on a thread pool, since a request
+# spends its time waiting on the network rather than on python, and parse_all() parses
+# the files on a thread pool with the pyarrow csv engine (multithreaded and outside the
+# GIL) using the dtypes the dataset declares, so no column type is guessed per chunk.
+# sync_all() in pydy/sync.py puts both in front of sync_csv and only parses the files
+# whose contents changed.
+#
+# each stage reports the bytes it handled, its wall time and the overlap it achieved:
+# the time each file was in progress, summed, over the wall time of the stage, i.e. how
+# many files were in flight on average (1.0x is one after another). files in flight only
+# finish sooner while there are idle cores or the network is the wait; on one core the
+# parse overlap mostly shows threads taking turns.
+#
+# PYDY_MIRROR points the downloads at a folder of csv files or at a local http stand-in,
+# e.g. python -m http.server 8000 --directory mirror and PYDY_MIRROR=http://localhost:8000
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydy import trace
+from pydy.fetch import fetch_csv
+from pydy.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+WORKERS = 8
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _stats(stage, seconds, wall, paths):
+    files = len(seconds)
+    size = sum(os.path.getsize(path) for path in paths)
+    busy = sum(seconds)
+    overlap = busy / wall if wall else 1.0
+    print(f'{stage} {files} files ({size / 2**20:.1f} MB) in {wall:.2f}s, '
+          f'{busy:.2f}s of file time, {overlap:.1f}x overlap. ⚡')
+    return {'files': files, 'bytes': size, 'seconds': wall, 'busy': busy, 'overlap': overlap}
+
+
+def fetch_all(urls, workers=WORKERS):
+    # ({url: local path}, {url: error}, stats); a url that cannot be fetched does not
+    # stop the others
+    urls = list(dict.fromkeys(urls))
+    paths, errors, seconds = {}, {}, []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as pool:
+        futures = {url: pool.submit(_timed, fetch_csv, url) for url in urls}
+        for url, future in futures.items():
+            try:
+                paths[url], took = future.result()
+            except OSError as err:
+                errors[url] = err
+                continue
+            seconds.append(took)
+    stats = _stats('Fetched', seconds, time.perf_counter() - start, paths.values())
+    return paths, errors, stats
+
+
+def parse_csv(path, dtype=None, **read_csv_kwargs):
+    # the whole file in one go with the pyarrow engine
+    with trace.span('parse_csv', 'io', file=Path(path).name) as current:
+        frame = pd.read_csv(path, engine='pyarrow', dtype=dtype, **read_csv_kwargs)
+        current['rows'] = len(frame)
+    return frame
+
+
+def parse_all(sources, options=None, workers=WORKERS):
+    # ({name: frame}, stats) for {name: path}; options[name] are read_csv arguments
+    options = options or {}
+    frames, seconds = {}, []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as pool:
+        futures = {name: pool.submit(_timed, parse_csv, path, **options.get(name, {}))
+                   for name, path in sources.items()}
+        for name, future in futures.items():
+            frames[name], took = future.result()
+            seconds.append(took)
+    stats = _stats('Parsed', seconds, time.perf_counter() - start, sources.values())
+    return frames, stats
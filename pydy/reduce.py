@@ -0,0 +1,61 @@
+# shrink chart data before it is drawn
+#
+# bar charts with one bar per row get slower (and unreadable) as the row count grows:
+# every bar is an artist and every rotated tick label goes through tight_layout. these
+# helpers cut a frame down to a fixed number of bars, so drawing time stays flat no
+# matter how many rows the query returns:
+#   - duplicate labels (remakes, reissues, artists with several albums) become one bar
+#   - only the top n labels keep their own bar, the rest share one "Other" bar
+#   - numeric values can be binned into a histogram instead of one bar per row
+
+from pydy.lazy import lazy_import
+from pydy.trace import traced
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+MAX_BARS = 30
+
+
+def aggregate_duplicates(df, label, value, how='max'):
+    # one row per label; how is any pandas aggregation ('max', 'sum', 'mean', ...)
+    if not df[label].duplicated().any():
+        return df[[label, value]].reset_index(drop=True)
+    return df.groupby(label, as_index=False, sort=False)[value].agg(how)
+
+
+def top_n(df, label, value, n=MAX_BARS, other='Other', other_how='mean', ascending=False):
+    # the n largest values (smallest with ascending=True) plus one bar for the rest,
+    # labelled with how many rows it stands for
+    ranked = df.sort_values(value, ascending=ascending, kind='stable')
+    if len(ranked) <= n:
+        return ranked.reset_index(drop=True)
+
+    kept = ranked.iloc[:n]
+    rest = ranked.iloc[n:]
+    bucket = pd.DataFrame({label: [f'{other} ({len(rest):,})'], value: [rest[value].agg(other_how)]})
+    return pd.concat([kept[[label, value]], bucket], ignore_index=True)
+
+
+@traced()
+def reduce_bars(df, label, value, max_bars=MAX_BARS, duplicates='max', other='Other',
+                other_how='mean', ascending=False):
+    # duplicate aggregation followed by top-n plus "Other"
+    deduped = aggregate_duplicates(df, label, value, duplicates)
+    return top_n(deduped, label, value, max_bars, other, other_how, ascending)
+
+
+@traced()
+def histogram(values, bins='auto', max_bins=MAX_BARS):
+    # counts per bin as a frame of (bin_start, bin_end, count, label)
+    values = pd.Series(values).dropna().to_numpy(dtype=float)
+    if isinstance(bins, str) and len(values):
+        # numpy's automatic choice can still produce hundreds of bins on wide data
+        bins = min(len(np.histogram_bin_edges(values, bins)) - 1, max_bins)
+    counts, edges = np.histogram(values, bins=bins if len(values) else 1)
+    return pd.DataFrame({
+        'bin_start': edges[:-1],
+        'bin_end': edges[1:],
+        'count': counts,
+        'label': [f'{low:.4g}–{high:.4g}' for low, high in zip(edges[:-1], edges[1:])],
+    })
@@ -0,0 +1,213 @@
+# build and analyze every dataset in one go
+#
+#   python -m pydy.run [dataset ...] [--workers N] [--per-db N] [--render DIR]
+#                      [--format png|svg] [--build-only]
+#
+# each dataset turns into a small dependency graph: one build task (download, load and
+# index its database through the module's prepare()) and one task per entry in its
+# ANALYSES list, which only start once the build has finished. the tasks of all
+# datasets share one process pool, so a slow download or build of one dataset never
+# holds up the analyses of another.
+#
+# sqlite allows a single writer per file: a build task has its database to itself, and
+# at most --per-db analyses read the same file at once. charts are always written to
+# files (charts/ by default) since the workers cannot open windows. at the end a
+# summary shows how long each stage (build, analyze, render) took in total and from
+# the first task starting to the last one finishing.
+# with PYDY_TRACE set (see pydy/trace.py) the spans
+# recorded in the workers are collected into one trace file.
+
+import argparse
+import contextlib
+import functools
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from pydy import datasets, trace
+
+STAGES = ('build', 'analyze', 'render')
+PER_DB = 2
+
+
+def db_file(module):
+    # the scripts name their database either db_path or db_name
+    return Path(getattr(module, 'db_path', None) or module.db_name).resolve()
+
+
+def analysis_name(analysis):
+    # test_all_factors, graph_aves(bmi), ... for the task list and the summary
+    if isinstance(analysis, functools.partial):
+        args = [str(arg) for arg in analysis.args if isinstance(arg, str)]
+        name = analysis.func.__name__
+        return f"{name}({', '.join(args)})" if args else name
+    return analysis.__name__
+
+
+def plan(names, build_only=False):
+    # every task as a dict; analyses depend on the build of their dataset
+    tasks = []
+    for name in names:
+        module = datasets.load(name)
+        db = db_file(module)
+        build = f'{name}:build'
+        tasks.append({'name': build, 'dataset': name, 'kind': 'build', 'index': None,
+                      'db': db, 'after': set()})
+        if build_only:
+            continue
+        for index, analysis in enumerate(getattr(module, 'ANALYSES', [])):
+            tasks.append({'name': f'{name}:{analysis_name(analysis)}', 'dataset': name,
+                          'kind': 'analysis', 'index': index, 'db': db, 'after': {build}})
+    return tasks
+
+
+def run_task(dataset, kind, index):
+    # runs in a pool worker; output is captured so the log of one task stays together.
+    # with tracing on, the spans go back to the parent with the result
+    trace.drain()
+    stages = {}
+    output = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            module = datasets.load(dataset)
+            start = time.time()
+            if kind == 'build':
+                with trace.span('prepare', 'build', dataset=dataset):
+                    module.prepare()
+                stages['build'] = (start, time.time())
+            else:
+                # the build task already prepared the database
+                module._prepared = True
+                analysis = module.ANALYSES[index]
+                with trace.span(analysis_name(analysis), 'analysis', dataset=dataset):
+                    analysis()
+                stages['analyze'] = (start, time.time())
+                start = time.time()
+                with trace.span('render_charts', 'render', dataset=dataset):
+                    module.render_charts()
+                stages['render'] = (start, time.time())
+        except Exception:
+            error = traceback.format_exc()
+    return {'stages': stages, 'output': output.getvalue(), 'error': error, 'trace': trace.drain()}
+
+
+def _can_start(task, done, running, per_db):
+    if not task['after'] <= done:
+        return False
+    on_db = [other for other in running if other['db'] == task['db']]
+    if task['kind'] == 'build':
+        return not on_db
+    return len(on_db) < per_db and all(other['kind'] != 'build' for other in on_db)
+
+
+def _report(task, result):
+    for line in result['output'].rstrip().splitlines():
+        print(f"  {line}")
+    timings = ', '.join(f'{stage} {end - start:.2f}s' for stage, (start, end) in result['stages'].items())
+    if result['error']:
+        print(f"❌ {task['name']} failed ({timings or 'no stage finished'})")
+        for line in result['error'].rstrip().splitlines():
+            print(f"  {line}")
+    else:
+        print(f"✅ {task['name']} ({timings})")
+
+
+def run(tasks, workers=None, per_db=PER_DB):
+    # schedule the graph on a process pool; returns the results and the failed tasks
+    pending = list(tasks)
+    done, failed, skipped = set(), set(), []
+    running = {}
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            # anything that depends on a failed task will never run
+            for task in [task for task in pending if task['after'] & failed]:
+                pending.remove(task)
+                failed.add(task['name'])
+                skipped.append(task['name'])
+                print(f"⏭️ {task['name']} skipped, {', '.join(sorted(task['after'] & failed))} failed")
+
+            for task in list(pending):
+                if _can_start(task, done, running.values(), per_db):
+                    pending.remove(task)
+                    future = pool.submit(run_task, task['dataset'], task['kind'], task['index'])
+                    running[future] = task
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    # the worker itself died (out of memory, killed, ...)
+                    result = {'stages': {}, 'output': '', 'error': traceback.format_exc()}
+                results[task['name']] = result
+                trace.merge(result.pop('trace', None))
+                _report(task, result)
+                if result['error']:
+                    failed.add(task['name'])
+                else:
+                    done.add(task['name'])
+
+    return results, failed - set(skipped), skipped
+
+
+def summary(results, wall, workers):
+    print('\nStage      tasks   task time   wall time')
+    busy = 0.0
+    for stage in STAGES:
+        spans = [result['stages'][stage] for result in results.values() if stage in result['stages']]
+        if not spans:
+            continue
+        total = sum(end - start for start, end in spans)
+        span = max(end for _, end in spans) - min(start for start, _ in spans)
+        busy += total
+        print(f'{stage:<10} {len(spans):>5} {total:>10.2f}s {span:>10.2f}s')
+    print(f'Total wall time {wall:.2f}s on {workers} workers, '
+          f'{busy / (wall * workers):.0%} of the pool kept busy. ⏱️')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and analyze the datasets on a process pool.')
+    parser.add_argument('datasets', nargs='*', help=f"datasets to run (default: all of {', '.join(datasets.DATASETS)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--per-db', type=int, default=PER_DB,
+                        help='most analyses reading one database at the same time')
+    parser.add_argument('--render', type=Path, default=datasets.REPO_ROOT / 'charts',
+                        help='folder the charts are written to')
+    parser.add_argument('--format', choices=('png', 'svg'), default='png')
+    parser.add_argument('--build-only', action='store_true', help='only build the databases')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in datasets.DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+
+    # set before the pool starts so every worker renders to files, one chart at a time
+    # (the pool already uses every core)
+    os.environ['PYDY_RENDER_DIR'] = str(args.render.resolve())
+    os.environ['PYDY_RENDER_FORMAT'] = args.format
+    os.environ['PYDY_RENDER_WORKERS'] = '1'
+
+    tasks = plan(args.datasets or list(datasets.DATASETS), args.build_only)
+    print(f'Running {len(tasks)} tasks on {args.workers} workers. 🚀')
+    start = time.time()
+    results, failed, skipped = run(tasks, args.workers, args.per_db)
+    summary(results, time.time() - start, args.workers)
+
+    if failed:
+        print(f"Failed: {', '.join(sorted(failed))}" + (f" ({len(skipped)} tasks skipped)" if skipped else ''))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# columnar copies of the wide tables, and reads that work against either storage
+#
+# every dataset is loaded and synced into sqlite, which stays the source of truth. a
+# dataset can list tables in COLUMNAR_TABLES: with PYDY_BACKEND=parquet its prepare()
+# also persists those as parquet files next to the database (WHOTB.db ->
+# WHOTB.parquet/tbdata.parquet), sorted on the columns they are usually filtered by so
+# the row group statistics let a filter skip most of the file.
+#
+# read_table() is how the column scans read: a table, the columns wanted, filters and an
+# order. on sqlite that becomes one SELECT through read_sql (pooled connection, query
+# cache); on parquet only the requested columns are decoded, row groups the filters
+# rule out are never read, the file is memory-mapped and the arrow buffers are handed
+# to pandas without keeping a second copy. both return the same dtypes.
+#
+# the tb rankings and trends, the simpsons co-occurrence matrices, the diabetes factor
+# tests and the rolling stone trajectories read through it. queries that aggregate,
+# join or window in sql, and the steps that build derived sqlite tables, stay on
+# sqlite whatever the backend, so COLUMNAR_TABLES only lists the tables those scans read.
+#
+# filters are (column, op, value) tuples, all of which must hold; op is one of
+# = != < <= > >= in, or 'not null' (value ignored). an export is redone when the
+# table changes: tables written by sync_csv are tracked by their source digest,
+# other tables by their row count and last rowid.
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from pydy import trace
+from pydy.db import read_sql, timed_query
+from pydy.lazy import lazy_import
+from pydy.sync import SOURCES
+
+pa = lazy_import('pyarrow')
+pc = lazy_import('pyarrow.compute')
+pq = lazy_import('pyarrow.parquet')
+
+BACKENDS = ('sqlite', 'parquet')
+ROW_GROUP_SIZE = 64_000
+EXPORT_CHUNKSIZE = 200_000
+
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+# the storage classes a column can hold, and the arrow type for each (the last one
+# present wins: a column with text in it is a string column, with blobs a binary one)
+_STORAGE = (('integer', 'int64'), ('real', 'float64'), ('text', 'string'), ('blob', 'binary'))
+# sqlite's type affinity rules, in the order sqlite applies them, for columns that only
+# hold NULLs; BLOB or no declared type keeps whatever is stored
+_AFFINITIES = (('INT', 'int64'), ('CHAR', 'string'), ('CLOB', 'string'), ('TEXT', 'string'),
+               ('BLOB', 'binary'), ('REAL', 'float64'), ('FLOA', 'float64'), ('DOUB', 'float64'))
+
+
+def _quote(columns):
+    return ', '.join(f'"{column}"' for column in columns)
+
+
+def backend():
+    name = os.environ.get('PYDY_BACKEND', 'sqlite')
+    if name not in BACKENDS:
+        raise ValueError(f"PYDY_BACKEND must be one of {', '.join(BACKENDS)}, got {name!r}")
+    return name
+
+
+def columnar_dir(db_path):
+    return Path(db_path).with_suffix('.parquet')
+
+
+def parquet_file(db_path, table):
+    return columnar_dir(db_path) / f'{table}.parquet'
+
+
+def _fingerprint(con, table):
+    # what the table's export was made from
+    try:
+        row = con.execute(f'SELECT sha256, key, rows FROM {SOURCES} WHERE name = ?', [table]).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is not None:
+        return json.dumps(['source', *row])
+    count, last = con.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{table}"').fetchone()
+    return json.dumps(['rows', count, last])
+
+
+def _exported(path):
+    if not path.exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(b'pydy_fingerprint', b'').decode()
+
+
+def _as_text(values):
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
+
+
+def _as_bytes(values):
+    return [value if value is None or isinstance(value, bytes) else str(value).encode() for value in values]
+
+
+def _arrow_schema(con, table):
+    # one arrow type per column, so every chunk is written alike. sqlite only applies the
+    # declared type where a value converts cleanly, so the type comes from the storage
+    # classes the column actually holds (one scan), and the declared one only when the
+    # column is all NULL. also returns {column: converter} for the text or bytes columns
+    # that hold other storage classes as well, whose values are converted before writing
+    info = [(name, declared) for _, name, declared, *_ in con.execute(f'PRAGMA table_info("{table}")')]
+    flags = ', '.join(f"MAX(typeof(\"{name}\") = '{storage}')" for name, _ in info for storage, _ in _STORAGE)
+    held = con.execute(f'SELECT {flags} FROM "{table}"').fetchone()
+
+    fields, convert = [], {}
+    for i, (name, declared) in enumerate(info):
+        present = [kind for (_, kind), flag in zip(_STORAGE, held[i * len(_STORAGE):]) if flag]
+        if present:
+            kind = present[-1]
+            if len(present) > 1 and kind in ('string', 'binary'):
+                convert[name] = _as_bytes if kind == 'binary' else _as_text
+        else:
+            kind = next((kind for part, kind in _AFFINITIES if part in declared.upper()), 'string')
+        fields.append(pa.field(name, getattr(pa, kind)()))
+    return pa.schema(fields), convert
+
+
+def export_table(db_path, table, sort_by=()):
+    # write table to its parquet file unless the file is already current; True when written
+    path = parquet_file(db_path, table)
+    with sqlite3.connect(db_path) as con:
+        fingerprint = _fingerprint(con, table)
+        if _exported(path) == fingerprint:
+            return False
+
+        with trace.span('export_table', 'store', table=table):
+            schema, convert = _arrow_schema(con, table)
+            schema = schema.with_metadata({'pydy_fingerprint': fingerprint})
+            order = f' ORDER BY {_quote(sort_by)}' if sort_by else ''
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_suffix('.partial')
+            rows = 0
+            with pq.ParquetWriter(partial, schema) as writer:
+                cursor = con.execute(f'SELECT * FROM "{table}"{order}')
+                while batch := cursor.fetchmany(EXPORT_CHUNKSIZE):
+                    columns = list(zip(*batch))
+                    arrays = [pa.array(convert[field.name](values) if field.name in convert else values, type=field.type)
+                              for values, field in zip(columns, schema)]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=ROW_GROUP_SIZE)
+                    rows += len(batch)
+            partial.replace(path)
+    print(f'Stored {rows:,} rows of {table} as parquet ({path.stat().st_size / 2**20:.1f} MB). 🧱')
+    return True
+
+
+def export_columnar(db_path, tables):
+    # prepare() step: the parquet copies of tables ({table: sort columns}), when the
+    # parquet backend is in use
+    if backend() != 'parquet':
+        return
+    for table, sort_by in tables.items():
+        export_table(db_path, table, sort_by)
+
+
+def _check(filters):
+    for column, op, _ in filters:
+        if op not in COMPARISONS and op not in ('in', 'not null'):
+            raise ValueError(f'unsupported filter {op!r} on {column}')
+
+
+def select_sql(table, columns=None, filters=(), order_by=()):
+    # (sql, params) of a read_table call on sqlite
+    _check(filters)
+    where, params = [], []
+    for column, op, value in filters:
+        if op == 'not null':
+            where.append(f'"{column}" IS NOT NULL')
+        elif op == 'in':
+            where.append(f'"{column}" IN ({", ".join("?" * len(value))})')
+            params.extend(value)
+        else:
+            where.append(f'"{column}" {op} ?')
+            params.append(value)
+
+    sql = f'SELECT {_quote(columns) if columns else "*"} FROM "{table}"'
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    if order_by:
+        sql += f' ORDER BY {_quote(order_by)}'
+    return sql, params
+
+
+def _expression(filters):
+    _check(filters)
+    expression = None
+    for column, op, value in filters:
+        field = pc.field(column)
+        if op == 'not null':
+            term = field.is_valid()
+        elif op == 'in':
+            term = field.isin(list(value))
+        else:
+            term = {'=': field == value, '!=': field != value, '<': field < value,
+                    '<=': field <= value, '>': field > value, '>=': field >= value}[op]
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def read_table(db_path, table, columns=None, filters=(), order_by=()):
+    # DataFrame of table's columns where every filter holds, in order_by order
+    if backend() == 'sqlite':
+        return read_sql(db_path, *select_sql(table, columns, filters, order_by))
+
+    path = parquet_file(db_path, table)
+    with timed_query(), trace.span('read_parquet', 'store', table=table) as current:
+        # the order columns are read too (sqlite can order by a column it does not return)
+        read = columns and [*columns, *(column for column in order_by if column not in columns)]
+        arrow = pq.read_table(path, columns=read, filters=_expression(filters), memory_map=True)
+        if order_by:
+            # nulls first, like sqlite
+            arrow = arrow.sort_by([(column, 'ascending', 'at_start') for column in order_by])
+        if columns and len(read) > len(columns):
+            arrow = arrow.select(columns)
+        # the arrow buffers are released as each column is converted
+        frame = arrow.to_pandas(split_blocks=True, self_destruct=True)
+        current['rows'] = len(frame)
+    return frame
@@ -0,0 +1,381 @@
+# incremental csv -> sqlite refresh
+#
+# sync_csv(db_path, table, url) replaces the "load it if the table is missing" step. the
+# database remembers the sha256 of the csv each table came from, so an unchanged file
+# is a no-op, and a fingerprint of every row, so a changed file is diffed against the
+# table and only the inserted, updated and deleted rows are written, all in one
+# transaction. a weekly tb update that adds a year only inserts that year's rows.
+#
+# rows are matched on a key (tb: country + year, simpsons: id). tables without one are
+# compared as a multiset of rows: a changed row is a delete plus an insert. the table is
+# loaded from scratch the first time, or when the csv's columns change.
+#
+# code that keeps tables derived from a source table (simpsons season totals, the
+# chocolate characteristic index) registers on_change(table, callback) and is called
+# with what changed after every commit. the read_sql cache and the chart fingerprints
+# already notice changed data by themselves.
+#
+# sync_all(db_path, {table: options}) syncs the tables of one database together: every
+# csv is downloaded at once and the changed ones are parsed at once (pydy/prefetch.py),
+# then written one table at a time, since sqlite has a single writer.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+from pydy import trace
+from pydy.db import mark_changed
+from pydy.dimensions import code_column, encode
+from pydy.fetch import fetch_csv, table_is_current
+from pydy.ingest import CHUNKSIZE, _rows, load_csv, read_chunks
+from pydy.prefetch import WORKERS, fetch_all, parse_all
+
+SOURCES = '_pydy_sources'
+# a bigger page cache for the staging and diff tables; unlike a first load, a diff
+# runs against a table that already matters, so it keeps sqlite's normal durability
+SYNC_CACHE = 'PRAGMA cache_size = -200000'
+
+# sync_csv arguments that are not read_csv arguments
+SYNC_OPTIONS = ('url', 'key', 'transform', 'schema', 'indexes', 'dimensions', 'chunksize')
+
+_listeners = defaultdict(list)
+
+
+class LayoutChanged(Exception):
+    # the csv no longer has the table's columns, so it is loaded from scratch
+    pass
+
+
+def on_change(table, callback):
+    # callback(db_path, changes) after every sync that changed table
+    _listeners[table].append(callback)
+
+
+def _notify(db_path, changes):
+    for callback in _listeners[changes['table']]:
+        callback(db_path, changes)
+
+
+_digests = {}
+
+
+def file_sha256(path):
+    # remembered per file version, sync_all and sync_csv both ask for it
+    stat = os.stat(path)
+    version = (os.fspath(path), stat.st_mtime_ns, stat.st_size)
+    if version not in _digests:
+        _digests[version] = _sha256(path)
+    return _digests[version]
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(*values):
+    # 64-bit hash of one row as sqlite stores it, so csv and table rows compare equal
+    digest = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _connect(db_path):
+    con = sqlite3.connect(db_path, isolation_level=None)
+    con.create_function('pydy_fingerprint', -1, _fingerprint, deterministic=True)
+    return con
+
+
+def _quoted(columns):
+    return ', '.join(f'"{c}"' for c in columns)
+
+
+def _rows_table(table):
+    return f'_pydy_rows_{table}'
+
+
+def _keyed_rows(source, columns, key):
+    # (key, fingerprint, row) for every row of source; without a key the n-th copy of
+    # a row gets key '<fingerprint>:<n>'
+    inner = f'SELECT rowid AS row, pydy_fingerprint({_quoted(columns)}) AS fingerprint'
+    if key:
+        return f'SELECT json_array({_quoted(key)}) AS key, fingerprint, row FROM ({inner}, {_quoted(key)} FROM {source})'
+    return f'''
+        SELECT fingerprint || ':' || ROW_NUMBER() OVER (PARTITION BY fingerprint ORDER BY row) AS key, fingerprint, row
+        FROM ({inner} FROM {source})
+    '''
+
+
+def _stored_source(con, table):
+    con.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SOURCES} (
+            name TEXT PRIMARY KEY,
+            source TEXT,
+            sha256 TEXT,
+            key TEXT,
+            rows INTEGER,
+            synced TEXT
+        )
+    ''')
+    row = con.execute(f'SELECT sha256, key FROM {SOURCES} WHERE name = ?', (table,)).fetchone()
+    return {'sha256': row[0], 'key': row[1]} if row else None
+
+
+def _fingerprint_table(con, table, columns, key):
+    # (re)build the stored fingerprints from the table as it is now
+    rows = _rows_table(table)
+    con.execute(f'DROP TABLE IF EXISTS "{rows}"')
+    con.execute(f'''
+        CREATE TABLE "{rows}" (
+            key TEXT PRIMARY KEY,
+            fingerprint INTEGER NOT NULL,
+            row INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    source = f'main."{table}"'
+    try:
+        con.execute(f'INSERT INTO "{rows}" {_keyed_rows(source, columns, key)}')
+    except sqlite3.IntegrityError:
+        raise ValueError(f'{", ".join(key)} is not unique in {table}') from None
+
+
+def _record_source(con, table, url, sha256, key):
+    rows = con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    con.execute(
+        f'INSERT OR REPLACE INTO {SOURCES} VALUES (?, ?, ?, ?, ?, ?)',
+        (table, url, sha256, json.dumps(key), rows, time.strftime('%Y-%m-%dT%H:%M:%S')),
+    )
+
+
+def _execute_all(con, statements):
+    # one by one: executescript would commit the open transaction first
+    for statement in statements:
+        con.execute(statement)
+
+
+def _columns(con, table):
+    return [row[1] for row in con.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _diff(con, table, source, key, transform, dimensions, chunksize, read_csv_kwargs):
+    # stage the csv next to the table, compare fingerprints and apply the difference
+    columns = _columns(con, table)
+    rows = _rows_table(table)
+    con.execute('DROP TABLE IF EXISTS temp._pydy_staging')
+    # same names and declared types as the table (CREATE TABLE ... AS SELECT would drop
+    # the types and rename a column called "False", as the diabetes csv has, to column1)
+    declared = ', '.join(f'"{row[1]}" {row[2]}' for row in con.execute(f'PRAGMA table_info("{table}")'))
+    con.execute(f'CREATE TEMP TABLE _pydy_staging ({declared})')
+    insert = f'INSERT INTO temp._pydy_staging VALUES ({", ".join("?" * len(columns))})'
+    reader = read_chunks(source, chunksize, **read_csv_kwargs)
+    for chunk in trace.spans(reader, 'read_csv', 'sync', table=table):
+        if transform is not None:
+            chunk = transform(chunk)
+        if dimensions:
+            # codes from the table's own dimension tables, so unchanged rows match
+            chunk = encode(con, chunk, dimensions)
+        if list(chunk.columns) != columns:
+            raise LayoutChanged(table)
+        con.executemany(insert, _rows(chunk))
+
+    con.execute('DROP TABLE IF EXISTS temp._pydy_staged')
+    con.execute('CREATE TEMP TABLE _pydy_staged (key TEXT PRIMARY KEY, fingerprint INTEGER, row INTEGER) WITHOUT ROWID')
+    try:
+        con.execute(f'INSERT INTO temp._pydy_staged {_keyed_rows("temp._pydy_staging", columns, key)}')
+    except sqlite3.IntegrityError:
+        raise ValueError(f'{", ".join(key)} is not unique in the new {table} data') from None
+
+    # change, key, target row in the table, row in the staging table, new fingerprint
+    base = con.execute(f'SELECT IFNULL(MAX(rowid), 0) FROM main."{table}"').fetchone()[0]
+    _execute_all(con, [
+        'DROP TABLE IF EXISTS temp._pydy_diff',
+        'CREATE TEMP TABLE _pydy_diff (change TEXT, key TEXT, target INTEGER, source INTEGER, fingerprint INTEGER)',
+        f'''INSERT INTO temp._pydy_diff
+            SELECT 'deleted', s.key, s.row, NULL, NULL
+            FROM main."{rows}" s
+            WHERE NOT EXISTS (SELECT 1 FROM temp._pydy_staged n WHERE n.key = s.key)''',
+        f'''INSERT INTO temp._pydy_diff
+            SELECT 'updated', n.key, s.row, n.row, n.fingerprint
+            FROM temp._pydy_staged n
+            JOIN main."{rows}" s ON s.key = n.key
+            WHERE s.fingerprint <> n.fingerprint''',
+        f'''INSERT INTO temp._pydy_diff
+            SELECT 'inserted', n.key, {base} + ROW_NUMBER() OVER (ORDER BY n.row), n.row, n.fingerprint
+            FROM temp._pydy_staged n
+            WHERE NOT EXISTS (SELECT 1 FROM main."{rows}" s WHERE s.key = n.key)''',
+    ])
+
+    # staged values go through positional aliases, so no column name has to survive the subquery
+    staged = ', '.join(f'g."{c}" AS _pydy_{i}' for i, c in enumerate(columns))
+    assignments = ', '.join(f'"{c}" = s._pydy_{i}' for i, c in enumerate(columns))
+    _execute_all(con, [
+        f'''DELETE FROM main."{table}" WHERE rowid IN (SELECT target FROM temp._pydy_diff WHERE change = 'deleted')''',
+        f'''DELETE FROM main."{rows}" WHERE key IN (SELECT key FROM temp._pydy_diff WHERE change = 'deleted')''',
+        f'''UPDATE main."{table}" SET {assignments}
+            FROM (
+                SELECT d.target AS _pydy_target, {staged}
+                FROM temp._pydy_diff d
+                JOIN temp._pydy_staging g ON g.rowid = d.source
+                WHERE d.change = 'updated'
+            ) AS s
+            WHERE main."{table}".rowid = s._pydy_target''',
+        f'''UPDATE main."{rows}" SET fingerprint = d.fingerprint
+            FROM temp._pydy_diff d
+            WHERE d.change = 'updated' AND d.key = main."{rows}".key''',
+        f'''INSERT INTO main."{table}" (rowid, {_quoted(columns)})
+            SELECT d.target, {', '.join(f'g."{c}"' for c in columns)}
+            FROM temp._pydy_diff d
+            JOIN temp._pydy_staging g ON g.rowid = d.source
+            WHERE d.change = 'inserted'
+            ORDER BY d.target''',
+        f'''INSERT INTO main."{rows}" (key, fingerprint, row)
+            SELECT key, fingerprint, target FROM temp._pydy_diff
+            WHERE change = 'inserted' ''',
+    ])
+
+    changes = {'table': table, 'full': False,
+               'keys': {'inserted': [], 'updated': [], 'deleted': []},
+               'rows': {'inserted': [], 'updated': [], 'deleted': []}}
+    for change, changed_key, target in con.execute('SELECT change, key, target FROM temp._pydy_diff'):
+        changes['keys'][change].append(tuple(json.loads(changed_key)) if key else changed_key)
+        changes['rows'][change].append(target)
+    for change in ('inserted', 'updated', 'deleted'):
+        changes[change] = len(changes['rows'][change])
+
+    _execute_all(con, ['DROP TABLE temp._pydy_diff', 'DROP TABLE temp._pydy_staged', 'DROP TABLE temp._pydy_staging'])
+    return changes
+
+
+def _key(key):
+    return [key] if isinstance(key, str) else list(key or [])
+
+
+def _schema(schema, dimensions):
+    # a table stored before its columns were encoded is not current
+    return {**(schema or {}), **{code_column(column): 'INTEGER' for column in dimensions or {}}}
+
+
+def _up_to_date(stored, sha256, key):
+    return bool(stored) and stored['sha256'] == sha256 and stored['key'] == json.dumps(key)
+
+
+def is_synced(db_path, table, source, key=None, schema=None, dimensions=None):
+    # the table was last synced from exactly this file, with this key
+    if not table_is_current(db_path, table, _schema(schema, dimensions)):
+        return False
+    con = _connect(db_path)
+    try:
+        stored = _stored_source(con, table)
+    finally:
+        con.close()
+    return _up_to_date(stored, file_sha256(source), _key(key))
+
+
+def sync_csv(db_path, table, url, key=None, transform=None, schema=None, indexes=(), dimensions=None,
+             source=None, frame=None, chunksize=CHUNKSIZE, **read_csv_kwargs):
+    # bring table up to date with the csv at url; returns what changed, or None when
+    # nothing did. key is a column name or tuple of names identifying a row (as stored,
+    # so a dimension column is keyed by its <column>_id codes). source is the csv when
+    # it was fetched already, frame its contents when they were parsed already
+    key = _key(key)
+    schema = _schema(schema, dimensions)
+    if source is None:
+        try:
+            source = fetch_csv(url)
+        except OSError as err:
+            # offline or github unreachable: an existing table is still usable
+            if table_is_current(db_path, table, schema):
+                print(f'Could not check {table} for updates ({err}), keeping the current table. 📦')
+                return None
+            raise
+    data = source if frame is None else frame
+
+    with trace.span('sync_csv', 'sync', table=table):
+        sha256 = file_sha256(source)
+        changes = None
+        if table_is_current(db_path, table, schema):
+            con = _connect(db_path)
+            try:
+                stored = _stored_source(con, table)
+                if _up_to_date(stored, sha256, key):
+                    print(f'{table} is up to date. 🧮')
+                    return None
+
+                con.execute(SYNC_CACHE)
+                con.execute('BEGIN IMMEDIATE')
+                try:
+                    # tables loaded before syncing existed (or with another key) get
+                    # their fingerprints from the rows they already have
+                    if not stored or stored['key'] != json.dumps(key):
+                        _fingerprint_table(con, table, _columns(con, table), key)
+                    changes = _diff(con, table, data, key, transform, dimensions, chunksize, read_csv_kwargs)
+                    _record_source(con, table, url, sha256, key)
+                    con.execute('COMMIT')
+                    mark_changed(db_path)
+                except LayoutChanged:
+                    con.execute('ROLLBACK')
+                    print(f'The columns of {table} changed, loading it again. 🔁')
+                except BaseException:
+                    if con.in_transaction:
+                        con.execute('ROLLBACK')
+                    raise
+            finally:
+                con.close()
+
+        if changes is None:
+            loaded = load_csv(db_path, table, data, chunksize=chunksize, indexes=indexes, transform=transform,
+                              schema=schema, dimensions=dimensions, **read_csv_kwargs)
+            con = _connect(db_path)
+            try:
+                con.execute('BEGIN IMMEDIATE')
+                _stored_source(con, table)
+                _fingerprint_table(con, table, _columns(con, table), key)
+                _record_source(con, table, url, sha256, key)
+                con.execute('COMMIT')
+                mark_changed(db_path)
+            finally:
+                if con.in_transaction:
+                    con.execute('ROLLBACK')
+                con.close()
+            changes = {'table': table, 'full': True, 'inserted': loaded['rows'], 'updated': 0, 'deleted': 0,
+                       'keys': None, 'rows': None}
+        elif not (changes['inserted'] or changes['updated'] or changes['deleted']):
+            print(f'{table}: new csv, but no row changed. 🧮')
+            return None
+        else:
+            print(f"Synced {table}: {changes['inserted']:,} inserted, {changes['updated']:,} updated, "
+                  f"{changes['deleted']:,} deleted rows. 🔄")
+
+    _notify(db_path, changes)
+    # the listeners write derived tables of their own
+    mark_changed(db_path)
+    return changes
+
+
+def sync_all(db_path, tables, workers=WORKERS):
+    # sync_csv for several tables of one database; tables maps table -> sync_csv
+    # arguments (url included). the files are fetched together and the changed ones
+    # parsed together, then each table is written in turn. returns {table: changes}
+    paths, _, _ = fetch_all([options['url'] for options in tables.values()], workers)
+
+    stale, parse_options = {}, {}
+    for table, options in tables.items():
+        source = paths.get(options['url'])
+        if source is None:
+            continue
+        if not is_synced(db_path, table, source, options.get('key'), options.get('schema'), options.get('dimensions')):
+            stale[table] = source
+            parse_options[table] = {name: value for name, value in options.items() if name not in SYNC_OPTIONS}
+    frames, _ = parse_all(stale, parse_options, workers) if stale else ({}, None)
+
+    # a file that could not be fetched goes through sync_csv's own fetch, which keeps
+    # the current table when there is one
+    return {
+        table: sync_csv(db_path, table, source=paths.get(options['url']), frame=frames.get(table), **options)
+        for table, options in tables.items()
+    }
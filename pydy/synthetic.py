@@ -0,0 +1,353 @@
+# synthetic copies of the tidytuesday csv files, at any size
+#
+# every source table has a generator that writes the same columns as the real csv, with
+# the same quirks the loaders have to deal with: '76%' cocoa, '8,000, 15,705' arena
+# capacities, 'true' / 'False' speaking flags, blank cells, untidy state codes, etc.
+# scale 1 gives the real row count and scale 1000 a thousand times that; foreign keys
+# (script lines -> episodes / characters / locations, tb country x year) grow with it.
+#
+# write_mirror() writes the files under their real names, so pointing PYDY_MIRROR at the
+# folder makes every dataset script load them instead of downloading.
+
+import time
+from pathlib import Path
+
+from pydy.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# rows generated and written at a time, so memory stays flat at any scale
+CHUNK_ROWS = 250_000
+
+COUNTRIES = [
+    'Argentina', 'Australia', 'Belgium', 'Brazil', 'Canada', 'Colombia', 'Ecuador', 'France',
+    'Germany', 'Ghana', 'Guatemala', 'India', 'Italy', 'Japan', 'Madagascar', 'Mexico', 'Peru',
+    'Spain', 'Switzerland', 'Tanzania', 'U.K.', 'U.S.A.', 'Venezuela', 'Vietnam',
+]
+WORDS = [
+    'bitter', 'cocoa', 'creamy', 'earthy', 'fatty', 'floral', 'fruity', 'nutty', 'roasty',
+    'rich', 'sandy', 'sour', 'spicy', 'sweet', 'vanilla', 'woody', 'smoky', 'molasses',
+    'caramel', 'citrus', 'berry', 'coffee', 'grassy', 'honey', 'banana', 'chalky',
+]
+STATES = ['CA', 'WA', 'IN', 'OR', 'FL', 'NY', 'TX', 'MI', 'co', ' ks ', 'Loire', 'Kent County', '']
+
+
+def _words(rng, n, vocabulary, low, high, sep=', '):
+    # n strings of low..high words each
+    counts = rng.integers(low, high + 1, n)
+    picks = np.asarray(vocabulary, dtype=object)[rng.integers(0, len(vocabulary), counts.sum())]
+    ends = np.cumsum(counts)
+    return [sep.join(picks[end - count:end]) for count, end in zip(counts, ends)]
+
+
+def _blank(rng, values, share):
+    # a share of the cells left empty, like the real exports
+    values = pd.Series(values)
+    return values.mask(rng.random(len(values)) < share)
+
+
+def _pool(size, scale):
+    # how many distinct movies, companies, towns ... there are at this scale
+    return max(int(size * scale), 2)
+
+
+def _numbered(prefix, ids):
+    return pd.Series(ids).map(lambda i: f'{prefix} {i}')
+
+
+def age_gaps(rng, ids, scale):
+    n = len(ids)
+    movies = rng.integers(1, _pool(830, scale), n)
+    actor_1_age = rng.integers(20, 82, n)
+    gap = np.minimum(rng.gamma(1.6, 6.5, n).astype(int), actor_1_age - 17)
+    actor_2_age = actor_1_age - gap
+    birth_1 = 2022 - actor_1_age
+    birth_2 = 2022 - actor_2_age
+    gender = rng.choice(['man', 'woman'], n, p=[0.82, 0.18])
+    return pd.DataFrame({
+        'movie_name': _numbered('Movie', movies),
+        'release_year': rng.integers(1935, 2023, n),
+        'director': _numbered('Director', movies // 2),
+        'age_difference': gap,
+        'couple_number': rng.integers(1, 4, n),
+        'actor_1_name': _numbered('Actor', rng.integers(1, _pool(600, scale), n)),
+        'actor_2_name': _numbered('Actor', rng.integers(1, _pool(600, scale), n)),
+        'character_1_gender': gender,
+        'character_2_gender': np.where(rng.random(n) < 0.97, np.where(gender == 'man', 'woman', 'man'), gender),
+        'actor_1_birthdate': [f'{year}-{month:02d}-15' for year, month in zip(birth_1, rng.integers(1, 13, n))],
+        'actor_2_birthdate': [f'{year}-{month:02d}-15' for year, month in zip(birth_2, rng.integers(1, 13, n))],
+        'actor_1_age': actor_1_age,
+        'actor_2_age': actor_2_age,
+    })
+
+
+def chocolate(rng, ids, scale):
+    n = len(ids)
+    companies = rng.integers(1, _pool(580, scale), n)
+    cocoa = np.clip(rng.normal(71, 5, n).round(), 42, 100).astype(int)
+    return pd.DataFrame({
+        'ref': ids,
+        'company_manufacturer': _numbered('Company', companies),
+        'company_location': np.asarray(COUNTRIES, dtype=object)[companies % len(COUNTRIES)],
+        'review_date': rng.integers(2006, 2022, n),
+        'country_of_bean_origin': rng.choice(COUNTRIES, n),
+        'specific_bean_origin_or_bar_name': [f'Estate {i % 997}, batch {i % 7 + 1}' for i in ids],
+        'cocoa_percent': [f'{p}%' for p in cocoa],
+        'ingredients': _blank(rng, rng.choice(['2- B,S', '3- B,S,C', '4- B,S,C,L', '5- B,S,C,V,L'], n), 0.03),
+        'most_memorable_characteristics': _words(rng, n, WORDS, 1, 4),
+        'rating': rng.choice(np.arange(1.0, 4.01, 0.25), n),
+    })
+
+
+def diabetes(rng, ids, scale):
+    n = len(ids)
+    positive = rng.random(n) < 0.35
+
+    def measure(mean, sd, shift, low, share):
+        values = np.clip(rng.normal(mean + shift * positive, sd), low, None).round(1)
+        return _blank(rng, values, share)
+
+    return pd.DataFrame({
+        'False': ids - 1,
+        'pregnancy_num': rng.poisson(3.4 + 1.2 * positive),
+        'glucose_mg-dl': measure(110, 25, 31, 40, 0.01),
+        'dbp_mm-hg': measure(70, 12, 4, 24, 0.05),
+        'triceps_mm': measure(27, 9, 4, 7, 0.3),
+        'insulin_microiu-ml': measure(130, 90, 50, 14, 0.49),
+        'bmi': measure(30.9, 6.5, 4.5, 18, 0.015),
+        'pedigree': np.clip(rng.gamma(2.0, 0.22, n) + 0.1 * positive, 0.078, 2.42).round(3),
+        'age': np.clip(rng.gamma(2.2, 6, n) + 21 + 6 * positive, 21, 81).astype(int),
+        'diabetes_5y': np.where(positive, 'pos', 'neg'),
+    })
+
+
+def basketball(rng, ids, scale):
+    n = len(ids)
+    seats = rng.integers(3_000, 21_000, n)
+    second = rng.integers(3_000, 21_000, n)
+    capacity = [f'{a:,}, {b:,}' if two else f'{a:,}' for a, b, two in zip(seats, second, rng.random(n) < 0.1)]
+    finals = rng.poisson(1.5, n)
+    titles = np.minimum(rng.poisson(0.5, n), finals)
+    return pd.DataFrame({
+        'Team': _numbered('Team', ids),
+        'Home city': _numbered('City', ids),
+        'Arena': _numbered('Arena', ids),
+        'Capacity': capacity,
+        'Last season': _blank(rng, [f'{place}th' for place in rng.integers(4, 19, n)], 0.05),
+        'Country': rng.choice(COUNTRIES[:12], n),
+        'FinalFour_Appearances': finals,
+        'Titles_Won': titles,
+        'Years_of_FinalFour_Appearances': [', '.join(map(str, sorted(rng.integers(1958, 2025, k)))) or None for k in finals],
+        'Years_of_Titles_Won': [', '.join(map(str, sorted(rng.integers(1958, 2025, k)))) or None for k in titles],
+    })
+
+
+def album_ranks(rng, ids, scale):
+    n = len(ids)
+    ranks = {year: _blank(rng, rng.integers(1, 501, n).astype(float), share)
+             for year, share in (('rank_2003', 0.28), ('rank_2012', 0.28), ('rank_2020', 0.28))}
+    differential = (ranks['rank_2003'].fillna(501) - ranks['rank_2020'].fillna(501)).astype(int)
+    release = rng.integers(1955, 2020, n)
+    debut = release - rng.integers(0, 15, n)
+    artists = rng.integers(1, _pool(480, scale), n)
+    return pd.DataFrame({
+        'sort_name': _numbered('Artist', artists),
+        'clean_name': _numbered('Artist', artists),
+        'album': _numbered('Album', rng.integers(1, _pool(680, scale), n)),
+        **ranks,
+        'differential': differential,
+        'release_year': release,
+        'genre': _blank(rng, rng.choice(['Rock n\' Roll', 'Soul/Gospel/R&B', 'Hip-Hop/Rap', 'Indie/Alternative Rock',
+                                         'Country/Folk', 'Big Band/Jazz', 'Electronic'], n), 0.1),
+        'type': rng.choice(['Studio', 'Compilation', 'Live', 'Soundtrack'], n, p=[0.9, 0.05, 0.03, 0.02]),
+        'weeks_on_billboard': _blank(rng, rng.gamma(1.5, 40, n).round(), 0.15),
+        'peak_billboard_position': rng.integers(1, 201, n),
+        'spotify_popularity': _blank(rng, rng.integers(0, 90, n).astype(float), 0.05),
+        'spotify_url': [f'spotify:album:{i:022d}' for i in ids],
+        'artist_member_count': rng.integers(1, 6, n).astype(float),
+        'artist_gender': rng.choice(['Male', 'Female', 'Male/Female'], n, p=[0.75, 0.15, 0.1]),
+        'artist_birth_year_sum': (release - rng.integers(20, 40, n)).astype(float),
+        'debut_album_release_year': debut.astype(float),
+        'ave_age_at_top_500': rng.integers(19, 50, n).astype(float),
+        'years_between': (release - debut).astype(float),
+        'album_id': [f'{i:022d}' for i in ids],
+    })
+
+
+def roundabouts(rng, ids, scale):
+    n = len(ids)
+    countries = rng.choice(['United States', 'France', 'United Kingdom', 'Spain', 'Canada', 'Australia', ''], n,
+                           p=[0.45, 0.2, 0.12, 0.1, 0.06, 0.05, 0.02])
+    return pd.DataFrame({
+        'name': _blank(rng, _numbered('Roundabout', ids), 0.6),
+        'address': _blank(rng, _numbered('Road', rng.integers(1, _pool(5_000, scale), n)), 0.3),
+        'town_city': _blank(rng, _numbered('Town', rng.zipf(1.6, n) % _pool(9_000, scale)), 0.1),
+        'county_area': _blank(rng, _numbered('County', rng.integers(1, _pool(900, scale), n)), 0.2),
+        'state_region': rng.choice(STATES, n),
+        'country': countries,
+        'road_operator': _blank(rng, rng.choice(['City', 'County', 'State DOT', 'Private'], n), 0.5),
+        'approaches': _blank(rng, rng.choice([3, 4, 5, 6], n, p=[0.35, 0.45, 0.15, 0.05]).astype(float), 0.1),
+        'driveways': _blank(rng, rng.integers(0, 3, n).astype(float), 0.5),
+        'status': rng.choice(['Existing', 'Planned', 'Under construction', 'Removed'], n, p=[0.9, 0.05, 0.03, 0.02]),
+        'type': rng.choice(['Roundabout', 'Rotary', 'Traffic calming circle', 'Signalized'], n, p=[0.85, 0.05, 0.08, 0.02]),
+        'year_completed': _blank(rng, rng.integers(1960, 2025, n).astype(float), 0.4),
+        'lat': rng.uniform(-45, 65, n).round(6),
+        'long': rng.uniform(-125, 150, n).round(6),
+    })
+
+
+def tbdata(rng, ids, scale):
+    # one row per country and year (2000-2023), countries numbered in id order
+    country = (ids - 1) // 24
+    year = 2000 + (ids - 1) % 24
+    n = len(ids)
+    # each country's level, trend and population are drawn once for the whole file, so
+    # every chunk sees the same country profile
+    countries = _rows('tbdata', scale) // 24
+    profile = np.random.default_rng([7, countries])
+    base = profile.lognormal(3, 1.3, countries)[country]
+    slope = profile.normal(-0.03, 0.03, countries)[country]
+    size = profile.integers(10_000, 200_000_000, countries)[country]
+    mortality = (base * np.exp(slope * (year - 2000)) * rng.lognormal(0, 0.05, n)).round(2)
+    incidence = (mortality * rng.uniform(4, 12, n)).round(1)
+    population = size * (1 + 0.01 * (year - 2000))
+    hiv = rng.uniform(0, 0.4, n)
+
+    def blank(values):
+        return _blank(rng, values, 0.04)
+
+    return pd.DataFrame({
+        'country': [f'Country {c}' for c in country],
+        'g_whoregion': np.asarray(['Africa', 'Americas', 'Eastern Mediterranean', 'Europe', 'South-East Asia',
+                                   'Western Pacific'], dtype=object)[country % 6],
+        'iso_numeric': country + 4,
+        'iso2': [f'{chr(65 + c % 26)}{chr(65 + c // 26 % 26)}' for c in country],
+        'iso3': [f'{chr(65 + c % 26)}{chr(65 + c // 26 % 26)}{chr(65 + c // 676 % 26)}' for c in country],
+        'year': year,
+        'c_cdr': blank(rng.uniform(20, 100, n).round()),
+        'c_newinc_100k': blank((incidence * rng.uniform(0.4, 1, n)).round()),
+        'cfr': blank(rng.uniform(0.02, 0.5, n).round(2)),
+        'e_inc_100k': blank(incidence),
+        'e_inc_num': (incidence * population / 100_000).astype(int),
+        'e_mort_100k': blank(mortality),
+        'e_mort_exc_tbhiv_100k': blank((mortality * (1 - hiv)).round(2)),
+        'e_mort_exc_tbhiv_num': blank((mortality * (1 - hiv) * population / 100_000).round()),
+        'e_mort_num': blank((mortality * population / 100_000).round()),
+        'e_mort_tbhiv_100k': blank((mortality * hiv).round(2)),
+        'e_mort_tbhiv_num': blank((mortality * hiv * population / 100_000).round()),
+        'e_pop_num': population.astype(int),
+    })
+
+
+def simpsons_characters(rng, ids, scale):
+    names = _numbered('Character', ids)
+    return pd.DataFrame({
+        'id': ids,
+        'name': names,
+        'normalized_name': names.str.lower(),
+        'gender': _blank(rng, rng.choice(['m', 'f'], len(ids), p=[0.7, 0.3]), 0.7),
+    })
+
+
+def simpsons_episodes(rng, ids, scale):
+    n = len(ids)
+    season = (ids - 1) // 22 + 1
+    air_year = 1989 + season
+    return pd.DataFrame({
+        'id': ids,
+        'image_url': [f'http://static.example.org/episodes/{i}.jpg' for i in ids],
+        'imdb_rating': _blank(rng, rng.uniform(5, 9.5, n).round(1), 0.01),
+        'imdb_votes': rng.integers(300, 4_000, n),
+        'number_in_season': (ids - 1) % 22 + 1,
+        'number_in_series': ids,
+        'original_air_date': [f'{year}-{month:02d}-10' for year, month in zip(air_year, rng.integers(1, 13, n))],
+        'original_air_year': air_year,
+        'production_code': [f'{s}F{i % 100:02d}' for s, i in zip(season, ids)],
+        'season': season,
+        'title': _numbered('Episode', ids),
+        'us_viewers_in_millions': rng.uniform(2, 30, n).round(2),
+        'video_url': [f'http://video.example.org/{i}' for i in ids],
+        'views': rng.integers(1_000, 200_000, n),
+    })
+
+
+def simpsons_locations(rng, ids, scale):
+    names = _numbered('Location', ids)
+    return pd.DataFrame({'id': ids, 'name': names, 'normalized_name': names.str.lower()})
+
+
+def simpsons_script_lines(rng, ids, scale):
+    n = len(ids)
+    rows = _rows('simpsons_script_lines', scale)
+    episodes = _rows('simpsons_episodes', scale)
+    characters = _rows('simpsons_characters', scale)
+    locations = _rows('simpsons_locations', scale)
+    # lines come in episode order, and a few characters (the family) say most of them
+    episode = (ids - 1) * episodes // rows + 1
+    character = _blank(rng, np.minimum(rng.zipf(1.4, n), characters), 0.11)
+    location = _blank(rng, np.minimum(rng.zipf(1.3, n), locations), 0.01)
+    spoken = _words(rng, n, WORDS, 1, 12, sep=' ')
+    speaking = rng.choice(['true', 'false', 'True', 'False'], n, p=[0.6, 0.1, 0.25, 0.05])
+    return pd.DataFrame({
+        'id': ids,
+        'episode_id': episode,
+        'number': (ids - 1) % max(rows // episodes, 1),
+        'raw_text': spoken,
+        'timestamp_in_ms': rng.integers(0, 1_400_000, n),
+        'speaking_line': speaking,
+        'character_id': character.astype('Int64'),
+        'location_id': location.astype('Int64'),
+        'raw_character_text': _numbered('Character', character.fillna(0).astype(int)),
+        'raw_location_text': _numbered('Location', location.fillna(0).astype(int)),
+        'spoken_words': spoken,
+        'normalized_text': [text.lower() for text in spoken],
+        'word_count': [text.count(' ') + 1 for text in spoken],
+    })
+
+
+# table -> (dataset, csv file name, rows at scale 1, generator)
+TABLES = {
+    'age_gaps': ('age_gaps', 'age_gaps.csv', 1_155, age_gaps),
+    'chocolate_rating': ('chocolate', 'chocolate.csv', 2_530, chocolate),
+    'diabetes': ('diabetes', 'diabetes.csv', 768, diabetes),
+    'basketball': ('euroleague', 'euroleague_basketball.csv', 20, basketball),
+    'album_ranks': ('rolling_stones', 'rolling_stone.csv', 691, album_ranks),
+    'roundabouts': ('roundabouts', 'roundabouts_clean.csv', 27_000, roundabouts),
+    'tbdata': ('tb', 'who_tb_data.csv', 5_160, tbdata),
+    'simpsons_characters': ('simpsons', 'simpsons_characters.csv', 6_722, simpsons_characters),
+    'simpsons_episodes': ('simpsons', 'simpsons_episodes.csv', 600, simpsons_episodes),
+    'simpsons_locations': ('simpsons', 'simpsons_locations.csv', 4_459, simpsons_locations),
+    'simpsons_script_lines': ('simpsons', 'simpsons_script_lines.csv', 158_271, simpsons_script_lines),
+}
+
+
+def _rows(table, scale):
+    rows = max(int(round(TABLES[table][2] * scale)), 1)
+    # whole countries only, every one with the full 2000-2023 range
+    return -(-rows // 24) * 24 if table == 'tbdata' else rows
+
+
+def tables_for(datasets=None):
+    return [table for table, (dataset, *_) in TABLES.items() if datasets is None or dataset in datasets]
+
+
+def write_table(folder, table, scale=1, seed=0):
+    # write one synthetic csv in chunks; returns its path, row count and the seconds it took
+    start = time.perf_counter()
+    _, file_name, _, generate = TABLES[table]
+    path = Path(folder) / file_name
+    rows = _rows(table, scale)
+    rng = np.random.default_rng([seed, list(TABLES).index(table)])
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for first in range(0, rows, CHUNK_ROWS):
+            ids = np.arange(first + 1, min(first + CHUNK_ROWS, rows) + 1)
+            generate(rng, ids, scale).to_csv(f, index=False, header=first == 0)
+    return {'table': table, 'path': str(path), 'rows': rows, 'seconds': time.perf_counter() - start}
+
+
+def write_mirror(folder, scale=1, seed=0, datasets=None):
+    # every table of the given datasets (all by default), under its real file name
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    return [write_table(folder, table, scale, seed) for table in tables_for(datasets)]
@@ -0,0 +1,258 @@
+# opt-in tracing of where a run spends its time
+#
+# set PYDY_TRACE=trace.json (or call enable()) and the shared helpers record a span for
+# every phase they run: fetching a csv, read_csv / transform / insert for each chunk it
+# is loaded in, index building, every read_sql (with its EXPLAIN QUERY PLAN), the
+# heavier pandas / numpy steps of the analyses and every chart drawn. each span has its
+# wall time, the rows it handled and the peak memory python and numpy allocated while
+# it ran (tracemalloc; PYDY_TRACE_MEMORY=0 skips that, it slows allocation-heavy code).
+#
+# the file is a chrome trace: open it in https://ui.perfetto.dev or chrome://tracing, or
+# read it as plain json (traceEvents, plus queryPlans keyed by sql). a summary of the
+# hottest spans by self time (time not spent in a nested span) is printed when the run
+# ends. with tracing off every span is a no-op.
+#
+#   python -m pydy.trace tb [--out trace.json] [--top 15]
+#
+# runs a dataset's build and analyses with tracing on, one span per analysis.
+
+import argparse
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+TOP = 15
+
+_state = {'path': None, 'memory': False}
+_events = []
+_plans = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enabled():
+    return _state['path'] is not None
+
+
+def enable(path, memory=None):
+    if memory is None:
+        memory = os.environ.get('PYDY_TRACE_MEMORY', '1').lower() not in ('0', 'false', 'no')
+    _state['path'] = Path(path)
+    _state['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    _state['path'] = None
+    if _state['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state['memory'] = False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _event(name, category, start, seconds, pid=None, tid=None, self_seconds=None, **args):
+    return {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start * 1e6,
+        'dur': seconds * 1e6,
+        'pid': pid or os.getpid(),
+        'tid': tid or threading.get_native_id(),
+        'args': {'self_ms': (seconds if self_seconds is None else self_seconds) * 1000, **args},
+    }
+
+
+@contextmanager
+def span(name, category='run', **args):
+    # time the block; the caller can add to the yielded dict (rows=..., etc.)
+    if not enabled():
+        yield args
+        return
+
+    stack = _stack()
+    memory = _state['memory'] and tracemalloc.is_tracing()
+    frame = {'children': 0.0, 'peak': 0}
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['base'] = current
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        if memory:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            args['peak_mb'] = round((frame['peak'] - frame['base']) / 2**20, 3)
+        if stack:
+            stack[-1]['children'] += seconds
+            stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        event = _event(name, category, start, seconds, self_seconds=seconds - frame['children'], **args)
+        with _lock:
+            _events.append(event)
+
+
+def spans(iterable, name, category='run', **args):
+    # one span per item pulled from iterable, e.g. every chunk read_csv parses
+    if not enabled():
+        yield from iterable
+        return
+    items = iter(iterable)
+    while True:
+        with span(name, category, **args) as current:
+            item = next(items, StopIteration)
+            if item is not StopIteration and hasattr(item, '__len__'):
+                current['rows'] = len(item)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def traced(category='compute'):
+    # decorator: a span for every call, named after the function
+    def decorate(function):
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            if not enabled():
+                return function(*args, **kwargs)
+            with span(function.__name__, category):
+                return function(*args, **kwargs)
+        return call
+    return decorate
+
+
+def record(name, category, start, seconds, pid=None, **args):
+    # a span timed somewhere else, e.g. a chart drawn in a pool worker
+    if enabled():
+        with _lock:
+            _events.append(_event(name, category, start, seconds, pid=pid, tid=pid, **args))
+
+
+def query_plan(sql, plan):
+    if enabled():
+        with _lock:
+            _plans.setdefault(' '.join(sql.split()), plan)
+
+
+def has_plan(sql):
+    return ' '.join(sql.split()) in _plans
+
+
+def drain():
+    # everything recorded so far, removed from this process (pool workers send it back)
+    with _lock:
+        data = {'events': list(_events), 'plans': dict(_plans)}
+        _events.clear()
+        _plans.clear()
+    return data
+
+
+def merge(data):
+    if enabled() and data:
+        with _lock:
+            _events.extend(data['events'])
+            for sql, plan in data['plans'].items():
+                _plans.setdefault(sql, plan)
+
+
+def summary(events=None, top=TOP):
+    # spans grouped by name, hottest self time first
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'self_ms': 0.0, 'rows': 0, 'peak_mb': 0.0})
+    for event in _events if events is None else events:
+        group = groups[(event['cat'], event['name'])]
+        group['count'] += 1
+        group['total_ms'] += event['dur'] / 1000
+        group['self_ms'] += event['args'].get('self_ms', event['dur'] / 1000)
+        group['rows'] += event['args'].get('rows') or 0
+        group['peak_mb'] = max(group['peak_mb'], event['args'].get('peak_mb') or 0)
+    rows = [{'category': cat, 'name': name, **group} for (cat, name), group in groups.items()]
+    return sorted(rows, key=lambda row: row['self_ms'], reverse=True)[:top]
+
+
+def print_summary(top=TOP):
+    rows = summary(top=top)
+    if not rows:
+        return
+    print(f'\n{"span":<34} {"count":>6} {"self ms":>10} {"total ms":>10} {"rows":>12} {"peak MB":>8}')
+    for row in rows:
+        label = f"{row['category']}:{row['name']}"[:34]
+        print(f"{label:<34} {row['count']:>6} {row['self_ms']:>10.1f} {row['total_ms']:>10.1f} "
+              f"{row['rows']:>12,} {row['peak_mb']:>8.1f}")
+
+
+def write(path=None):
+    path = Path(path or _state['path'])
+    with _lock:
+        data = {
+            'traceEvents': sorted(_events, key=lambda event: event['ts']),
+            'displayTimeUnit': 'ms',
+            'queryPlans': [{'sql': sql, 'plan': plan} for sql, plan in _plans.items()],
+        }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=1))
+    print(f"Wrote {len(data['traceEvents'])} spans and {len(data['queryPlans'])} query plans to {path}. 🔬")
+    return path
+
+
+def _finish():
+    if enabled() and _events:
+        print_summary()
+        write()
+
+
+if os.environ.get('PYDY_TRACE'):
+    enable(os.environ['PYDY_TRACE'])
+atexit.register(_finish)
+
+
+def main(argv=None):
+    from pydy import datasets
+    from pydy.run import analysis_name
+
+    parser = argparse.ArgumentParser(description="Trace a dataset's build and analyses.")
+    parser.add_argument('dataset', choices=list(datasets.DATASETS))
+    parser.add_argument('--out', type=Path, default=Path('trace.json'))
+    parser.add_argument('--top', type=int, default=TOP, help='spans in the console summary')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory (faster)')
+    args = parser.parse_args(argv)
+
+    enable(args.out, memory=not args.no_memory)
+    module = datasets.load(args.dataset)
+    with span('prepare', 'build', dataset=args.dataset):
+        module.prepare()
+    for analysis in getattr(module, 'ANALYSES', []):
+        with span(analysis_name(analysis), 'analysis', dataset=args.dataset):
+            analysis()
+    with span('render_charts', 'render', dataset=args.dataset):
+        module.render_charts()
+
+    print_summary(args.top)
+    write()
+    disable()
+    return 0
+
+
+if __name__ == '__main__':
+    # the helpers record into the imported pydy.trace, not into this __main__ copy
+    from pydy import trace
+    sys.exit(trace.main())
@@ -0,0 +1,23 @@
+# import-time budget of the dataset modules (pydy/importtime.py); PYDY_IMPORT_BUDGET_MS
+# raises the budget on a slow machine
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# the repo root for pydy
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.datasets import DATASETS
+from pydy.importtime import BUDGET_MS, check
+
+# libraries a dataset module must only import once an analysis needs them
+LAZY = {'pandas', 'matplotlib', 'plotly', 'scipy'}
+
+
+@pytest.mark.parametrize('name', list(DATASETS))
+def test_dataset_imports_within_budget(name):
+    [result] = check([name])
+    assert not LAZY & set(result['heavy']), f"{name} imports {', '.join(result['heavy'])} eagerly"
+    assert result['ms'] <= BUDGET_MS, f"{name} took {result['ms']:.1f} ms to import (budget {BUDGET_MS:g} ms)"
+    assert result['ok']
@@ -0,0 +1,40 @@
+# indexes built from the queries (pydy/indexer.py)
+
+import contextlib
+import sqlite3
+import sys
+from pathlib import Path
+
+# the repo root for pydy
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.indexer import build_indexes
+
+
+def _indexes(path):
+    with contextlib.closing(sqlite3.connect(path)) as con:
+        return {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_an_index_the_query_cannot_use_is_left_alone(tmp_path):
+    path = tmp_path / 't.db'
+    with contextlib.closing(sqlite3.connect(path)) as con, con:
+        con.execute('CREATE TABLE t (x INTEGER, y INTEGER)')
+        con.executemany('INSERT INTO t VALUES (?, ?)', [(i % 50, i) for i in range(2000)])
+        # built for another query (or an earlier run)
+        con.execute('CREATE INDEX ix_t_x ON t (x)')
+
+    # a != filter still scans with ix_t_x, so nothing is kept, and nothing is dropped
+    report = build_indexes(path, {'not_five': 'SELECT * FROM t WHERE x != 5'}, verbose=False)
+    assert report == []
+    assert 'ix_t_x' in _indexes(path)
+
+
+def test_an_index_that_helps_is_kept(tmp_path):
+    path = tmp_path / 't.db'
+    with contextlib.closing(sqlite3.connect(path)) as con, con:
+        con.execute('CREATE TABLE t (x INTEGER, y INTEGER)')
+        con.executemany('INSERT INTO t VALUES (?, ?)', [(i % 50, i) for i in range(2000)])
+
+    report = build_indexes(path, {'five': 'SELECT y FROM t WHERE x = 5'}, verbose=False)
+    assert [entry['query'] for entry in report] == ['five']
+    assert set(report[0]['indexes']) <= _indexes(path)
@@ -0,0 +1,55 @@
+# parquet copies of sqlite tables (pydy/store.py)
+
+import contextlib
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# the repo root for pydy
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pydy.store import export_table, parquet_file, read_table
+
+ROWS = [
+    # label (no declared type), score REAL, code NUMERIC, raw BLOB, empty TEXT
+    ('a', 1.5, 10, b'\x00\x01', None),
+    ('b', 'n/a', 20, None, None),
+    (3, 2.0, None, b'\x02', None),
+]
+
+
+def test_export_types_columns_by_what_they_hold(tmp_path, monkeypatch):
+    path = tmp_path / 'mixed.db'
+    with contextlib.closing(sqlite3.connect(path)) as con, con:
+        con.execute('CREATE TABLE mixed (label, score REAL, code NUMERIC, raw BLOB, empty TEXT)')
+        con.executemany('INSERT INTO mixed VALUES (?, ?, ?, ?, ?)', ROWS)
+
+    assert export_table(path, 'mixed')
+    schema = pq.read_schema(parquet_file(path, 'mixed'))
+    assert {name: str(schema.field(name).type) for name in schema.names} == {
+        'label': 'string', 'score': 'string', 'code': 'int64', 'raw': 'binary', 'empty': 'string',
+    }
+
+    monkeypatch.setenv('PYDY_BACKEND', 'parquet')
+    frame = read_table(path, 'mixed')
+    assert frame['label'].tolist() == ['a', 'b', '3']
+    assert frame['score'].tolist() == ['1.5', 'n/a', '2.0']
+    assert frame['raw'].tolist() == [b'\x00\x01', None, b'\x02']
+
+
+def test_both_backends_order_by_a_column_not_returned(tmp_path, monkeypatch):
+    path = tmp_path / 'rows.db'
+    with contextlib.closing(sqlite3.connect(path)) as con, con:
+        con.execute('CREATE TABLE rows (n INTEGER, status TEXT, value REAL)')
+        con.executemany('INSERT INTO rows VALUES (?, ?, ?)', [(2, 'neg', 1.0), (0, 'pos', 2.0), (1, 'neg', 3.0)])
+    # stored in another order than the one asked for
+    export_table(path, 'rows', ('status',))
+
+    frames = {}
+    for backend in ('sqlite', 'parquet'):
+        monkeypatch.setenv('PYDY_BACKEND', backend)
+        frames[backend] = read_table(path, 'rows', columns=['status', 'value'], order_by=['n'])
+    assert frames['sqlite']['value'].tolist() == [2.0, 3.0, 1.0]
+    pd.testing.assert_frame_equal(frames['sqlite'], frames['parquet'])
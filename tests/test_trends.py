@@ -0,0 +1,57 @@
+# year-over-year changes for the TB metrics (TB/trends.py) on a small hand-made tbdata
+
+import contextlib
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# the repo root for pydy, TB for trends.py
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / 'TB'))
+from pydy.store import export_table
+from trends import compare_years, year_over_year
+
+# country 1 has no rows for 2010-2014, country 2 has every year, country 3 starts in 2005
+ROWS = (
+    [(1, year, 100.0 - year % 100) for year in range(2000, 2024) if not 2010 <= year <= 2014]
+    + [(2, year, 50.0) for year in range(2000, 2024)]
+    + [(3, year, 10.0) for year in range(2005, 2024)]
+)
+
+
+@pytest.fixture(params=['sqlite', 'parquet'])
+def db_path(request, tmp_path, monkeypatch):
+    monkeypatch.setenv('PYDY_BACKEND', request.param)
+    path = tmp_path / 'tb.db'
+    with contextlib.closing(sqlite3.connect(path)) as con, con:
+        con.execute('CREATE TABLE dim_country (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)')
+        con.executemany('INSERT INTO dim_country VALUES (?, ?)', [(1, 'Gap'), (2, 'Full'), (3, 'Late')])
+        con.execute('CREATE TABLE tbdata (country_id INTEGER, year INTEGER, e_mort_100k REAL)')
+        con.executemany('INSERT INTO tbdata VALUES (?, ?, ?)', ROWS)
+    if request.param == 'parquet':
+        export_table(path, 'tbdata', ('year', 'country_id'))
+    return path
+
+
+def test_change_across_a_gap_year(db_path):
+    changes = compare_years(db_path, 2000, 2023, ['e_mort_100k']).set_index('country')
+    # both endpoint years exist for the country with missing years in between
+    assert changes.loc['Gap', 'value_2000'] == 100.0
+    assert changes.loc['Gap', 'value_2023'] == 77.0
+    assert changes.loc['Gap', 'change'] == -23.0
+    assert changes.loc['Full', 'change'] == 0.0
+    # no 2000 row: no change rather than one against another year
+    assert pd.isna(changes.loc['Late', 'value_2000'])
+
+
+def test_prior_is_looked_up_by_year(db_path):
+    yearly = year_over_year(db_path, ['e_mort_100k'], periods=1)
+    gap = yearly[yearly['country'] == 'Gap'].set_index('year')
+    # 2015 follows 2009 in row order, but its year-before (2014) is missing
+    assert pd.isna(gap.loc[2015, 'prior'])
+    assert gap.loc[2016, 'prior'] == 85.0
+    assert gap.loc[2009, 'prior'] == 92.0